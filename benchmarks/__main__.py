@@ -0,0 +1,85 @@
+"""
+Run the performance benchmarks.
+
+    python -m benchmarks                                   # run everything and print the results
+    python -m benchmarks --only render,index --quick       # smaller libraries, fewer repetitions
+    python -m benchmarks --save benchmarks/baselines/pi-zero-2w.json
+    python -m benchmarks --compare benchmarks/baselines/pi-zero-2w.json --threshold 0.15
+
+With --compare the exit status is 1 if any benchmark got slower than the threshold.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+from benchmarks.suite import BENCHMARKS, run_benchmarks, compare_results
+from src.constants import LOG_FORMAT, LOG_DATE_FORMAT
+
+DEFAULT_THRESHOLD = 0.15
+
+def _print_results(results):
+    width = max((len(name) for name in results), default=0)
+    for name, result in results.items():
+        details = f"  {result['items_per_second']:.1f}/s" if "items_per_second" in result else ""
+        if "allocated_mb" in result:
+            details += f"  {result['images_allocated']} images, {result['allocated_mb']:.1f} MB allocated"
+        print(f"{name:<{width}}  {result['median_ms']:10.2f} ms  (min {result['min_ms']:.2f}, {result['runs']} runs){details}")
+
+def _print_comparison(rows):
+    width = max((len(row["name"]) for row in rows), default=0)
+    for row in rows:
+        if row["change"] is None:
+            print(f"{row['name']:<{width}}  {row['status']}")
+            continue
+        print(f"{row['name']:<{width}}  {row['baseline_ms']:10.2f} -> {row['current_ms']:10.2f} ms  "
+              f"{row['change']:+7.1%}  {row['status']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the Pidash performance benchmarks.")
+    parser.add_argument("--only", help=f"comma separated groups to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="use small libraries and fewer repetitions")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression (default %(default)s)")
+    parser.add_argument("--workdir", help="directory for generated data, a temporary one by default")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pidash-bench-")
+    try:
+        groups = args.only.split(",") if args.only else None
+        current = run_benchmarks(workdir, groups, args.quick)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_results(current["results"])
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if baseline is not None:
+        rows = compare_results(baseline, current, args.threshold)
+        print()
+        _print_comparison(rows)
+        if any(row["status"] == "regression" for row in rows):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import os
+import random
+from typing import List, Tuple
+from PIL import Image
+
+# (format, extension, save options) of the formats a library is generated with
+LIBRARY_FORMATS = [
+    ("JPEG", ".jpg", {"quality": 90}),
+    ("PNG", ".png", {}),
+    ("WEBP", ".webp", {"quality": 85}),
+    ("GIF", ".gif", {}),
+    ("BMP", ".bmp", {}),
+    ("TIFF", ".tiff", {"compression": "tiff_deflate"})
+]
+LIBRARY_SIZES = [(640, 480), (1920, 1080), (1080, 1920), (4000, 3000), (3000, 4000), (6000, 4000)]
+# BMP is uncompressed, so its images are kept small enough not to dominate the library's size
+BMP_MAX_SIZE = (1920, 1920)
+
+def make_photo(size: Tuple[int, int], seed: int) -> Image.Image:
+    """Make a photo-like RGB image: smooth random colours that compress like real pictures."""
+    pixels = random.Random(seed).randbytes(16 * 12 * 3)
+    return Image.frombytes("RGB", (16, 12), pixels).resize(size, Image.Resampling.BICUBIC)
+
+def generate_library(folder: str, count: int, unique: int = 24, seed: int = 0) -> List[str]:
+    """
+    Fill a folder with a synthetic image library of mixed formats and sizes.
+
+    Only `unique` images are encoded, the rest of the library are hard links to
+    them (or copies where links aren't supported), so libraries of tens of
+    thousands of files are quick to create but still look like distinct files
+    to the index.
+
+    Args:
+        folder: Folder to create the images in
+        count: Number of image files to create
+        unique: Number of distinct images to encode
+        seed: Seed for the image contents
+
+    Returns:
+        List[str]: Names of the created files
+    """
+    os.makedirs(folder, exist_ok=True)
+    originals = []
+    for i in range(min(unique, count)):
+        image_format, extension, options = LIBRARY_FORMATS[i % len(LIBRARY_FORMATS)]
+        size = LIBRARY_SIZES[(i + i // len(LIBRARY_FORMATS)) % len(LIBRARY_SIZES)]
+        if image_format == "BMP":
+            size = (min(size[0], BMP_MAX_SIZE[0]), min(size[1], BMP_MAX_SIZE[1]))
+        name = f"photo_{i:05}{extension}"
+        image = make_photo(size, seed + i)
+        if image_format == "GIF":
+            image = image.convert("P")
+        image.save(os.path.join(folder, name), format=image_format, **options)
+        originals.append(name)
+
+    names = list(originals)
+    for i in range(len(originals), count):
+        original = originals[i % len(originals)]
+        name = f"photo_{i:05}{os.path.splitext(original)[1]}"
+        source, destination = os.path.join(folder, original), os.path.join(folder, name)
+        try:
+            os.link(source, destination)
+        except OSError:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                dst.write(src.read())
+        names.append(name)
+    return names
@@ -0,0 +1,98 @@
+"""
+Start the service in a child process, the way create_app and pidash.main do, for the startup benchmark.
+
+    python -m benchmarks.startup WORKDIR IMAGE_FOLDER [--foreground] [--detect-seconds S]
+
+Caches, indexes and configuration are kept in WORKDIR and the panel is simulated,
+writing the frames it shows to WORKDIR/frames. The child reports on stdout when
+each phase ended, as "<phase> <unix time>", and the port it listens on.
+"""
+import time
+
+STARTED = time.time()
+
+import os
+import sys
+import argparse
+
+def _report(phase: str, value: float) -> None:
+    print(f"{phase} {value}", flush=True)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("workdir")
+    parser.add_argument("image_folder")
+    parser.add_argument("--foreground", action="store_true", help="detect the panel before serving")
+    parser.add_argument("--detect-seconds", type=float, default=0.0, help="time the simulated panel takes to detect")
+    args = parser.parse_args(argv)
+    _report("started", STARTED)
+
+    from flask import Flask
+    from waitress import create_server
+    from src.blueprints import pidash, config, display, home, upload, gallery, settings, metrics
+    from src.config import Config
+    from src.constants import (
+        CONFIG_KEY, IMAGE_MANAGER_KEY, DISPLAY_MANAGER_KEY, REFRESH_MANAGER_KEY, THUMBNAIL_MANAGER_KEY,
+        UPLOAD_MANAGER_KEY, HOSTNAME_KEY, LOCAL_IP_KEY, IMAGE_FOLDER_KEY, RESOLUTION_KEY, THUMBNAIL_SIZE,
+        SUPPORTED_IMAGE_EXTENSIONS, UPLOAD_WORKERS, MAX_UPLOAD_JOBS, DEFAULT_SIMULATED_PANEL
+    )
+    from src.display_backend import SimulatedPanel
+    from src.display_manager import DisplayManager
+    from src.image_manager import ImageManager
+    from src.refresh_manager import RefreshManager
+    from src.thumbnail_manager import ThumbnailManager
+    from src.upload_manager import UploadManager
+    _report("imported", time.time())
+
+    class SlowlyDetectedDisplayManager(DisplayManager):
+        BASE_DIR = args.workdir
+
+        def initialize_display(self):
+            # Stands in for probing the panel's EEPROM over I2C and importing its driver
+            time.sleep(args.detect_seconds)
+            super().initialize_display()
+
+    class IsolatedImageManager(ImageManager):
+        BASE_DIR = args.workdir
+
+    src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    app = Flask("src.app", template_folder=os.path.join(src_dir, "templates"),
+                static_folder=os.path.join(src_dir, "static"))
+    app.secret_key = "benchmark"
+
+    # Defaults from the shipped configuration, kept in the working directory from here on
+    configuration = Config()
+    configuration.config_file = os.path.join(args.workdir, "device.json")
+    for key, value in ((HOSTNAME_KEY, "Pidash"), (LOCAL_IP_KEY, "127.0.0.1"), (IMAGE_FOLDER_KEY, args.image_folder)):
+        configuration.set(key, value, save=False)
+    panel = SimulatedPanel(DEFAULT_SIMULATED_PANEL, os.path.join(args.workdir, "frames"), time_scale=0)
+    configuration.set(RESOLUTION_KEY, [panel.width, panel.height], save=False)
+
+    image_manager = IsolatedImageManager(configuration)
+    display_manager = SlowlyDetectedDisplayManager(configuration, panel, background=not args.foreground)
+    refresh_manager = RefreshManager(configuration, image_manager, display_manager)
+    upload_manager = UploadManager(image_manager, os.path.join(args.workdir, "uploads"), UPLOAD_WORKERS,
+                                   MAX_UPLOAD_JOBS, on_changed=refresh_manager.cancel_prefetch)
+    app.config[CONFIG_KEY] = configuration
+    app.config[IMAGE_MANAGER_KEY] = image_manager
+    app.config[DISPLAY_MANAGER_KEY] = display_manager
+    app.config[REFRESH_MANAGER_KEY] = refresh_manager
+    app.config[THUMBNAIL_MANAGER_KEY] = ThumbnailManager(image_manager.image_folder,
+                                                         os.path.join(args.workdir, "thumbnails"),
+                                                         THUMBNAIL_SIZE, SUPPORTED_IMAGE_EXTENSIONS)
+    app.config[UPLOAD_MANAGER_KEY] = upload_manager
+    for blueprint in (pidash, config, display, home, upload, gallery, settings, metrics):
+        app.register_blueprint(blueprint.bp)
+    _report("created", time.time())
+
+    server = create_server(app, host="127.0.0.1", port=0, threads=4)
+    refresh_manager.start()
+    _report("port", server.effective_port)
+    try:
+        server.run()
+    finally:
+        refresh_manager.stop()
+        upload_manager.shutdown()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,452 @@
+import io
+import os
+import sys
+import time
+import shutil
+import threading
+import subprocess
+import urllib.request
+import logging
+import platform
+import statistics
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from flask import Flask
+from PIL import Image
+from benchmarks.library import generate_library, make_photo
+from src.blueprints import config as config_blueprint
+from src.blueprints import gallery as gallery_blueprint
+from src.config import Config
+from src.constants import (
+    IMAGE_FOLDER_KEY, HOSTNAME_KEY, IMAGE_SETTINGS_KEY, RESOLUTION_KEY, IMAGE_MANAGER_KEY, UPLOAD_MANAGER_KEY,
+    SUPPORTED_IMAGE_EXTENSIONS
+)
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.image_index import ImageIndex
+from src.image_manager import ImageManager
+from src.image_utils import resize_image, change_orientation, apply_image_enhancement, plan_transform, apply_transform
+from src.metrics import MetricsRegistry
+from src.upload_manager import UploadManager
+
+logger = logging.getLogger(__name__)
+
+ENHANCEMENT_SETTINGS = {"brightness": 1.1, "contrast": 1.2, "saturation": 1.3, "sharpness": 1.5}
+LIBRARY_COUNTS = (1000, 10000, 50000)
+QUICK_LIBRARY_COUNTS = (1000,)
+UPLOAD_BATCH_SIZE = 20
+CONCURRENT_READERS = 4
+# Time the simulated panel takes to be detected at startup, about what inky.auto takes on a Pi Zero 2 W
+STARTUP_DETECT_SECONDS = 1.0
+STARTUP_TIMEOUT_SECONDS = 120
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Differences below this are timer noise, whatever their relative size
+MIN_CHANGE_MS = 0.05
+
+class BenchmarkContext:
+    """Working directory, settings and collected results of one benchmark run."""
+
+    def __init__(self, workdir: str, quick: bool = False) -> None:
+        self.workdir = workdir
+        self.quick = quick
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.workdir, *parts)
+
+    def make_config(self, name: str, **settings: Any) -> Config:
+        """Make a configuration kept in the working directory."""
+        config = Config()
+        config.config_file = self.path(f"{name}.json")
+        config.set(HOSTNAME_KEY, "Pidash", save=False)
+        for key, value in settings.items():
+            config.set(key, value, save=False)
+        return config
+
+    def measure(self, name: str, func: Callable[[], Any], repeat: int,
+                setup: Optional[Callable[[], Any]] = None, warmup: int = 1, items: int = 1) -> Dict[str, Any]:
+        """
+        Time a function and record the result.
+
+        Args:
+            name: Name the result is recorded under
+            func: Function to time
+            repeat: Number of timed runs
+            setup: Called untimed before every run
+            warmup: Number of untimed runs before the timed ones
+            items: Number of items one run processes, to report a rate
+
+        Returns:
+            Dict[str, Any]: The recorded result
+        """
+        if self.quick:
+            repeat = max(1, repeat // 3)
+        for _ in range(warmup):
+            if setup is not None:
+                setup()
+            func()
+
+        times = []
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+
+        return self.record(name, times, items)
+
+    def record(self, name: str, times: List[float], items: int = 1) -> Dict[str, Any]:
+        """Record times in milliseconds measured elsewhere, e.g. in a child process."""
+        median = statistics.median(times)
+        result = {"median_ms": round(median, 3), "min_ms": round(min(times), 3),
+                  "max_ms": round(max(times), 3), "runs": len(times)}
+        if items > 1:
+            result["items_per_second"] = round(items / (median / 1000), 1)
+        self.results[name] = result
+        logger.info(f"{name}: {result['median_ms']:.2f} ms")
+        return result
+
+def _count_allocations(func: Callable[[], Any]) -> Dict[str, Any]:
+    """Count the images and memory blocks Pillow allocates while a function runs."""
+    before = Image.core.get_stats()
+    func()
+    after = Image.core.get_stats()
+    blocks = after["allocated_blocks"] + after["reused_blocks"] - before["allocated_blocks"] - before["reused_blocks"]
+    return {"images_allocated": after["new_count"] - before["new_count"],
+            "allocated_mb": round(blocks * Image.core.get_block_size() / (1024 * 1024), 1)}
+
+def _rotate_crop_resize(image: Image.Image, orientation: str) -> Image.Image:
+    # The chain plan_transform replaced, kept as the reference it is measured against
+    return resize_image(change_orientation(image, orientation), (800, 480)).rotate(180)
+
+def _isolated(manager_class, workdir: str):
+    """Subclass a manager so the caches and indexes it keeps under BASE_DIR go to workdir instead."""
+    return type(manager_class.__name__, (manager_class,), {"BASE_DIR": workdir})
+
+def bench_render(ctx: BenchmarkContext) -> None:
+    source = make_photo((4000, 3000), seed=1)
+    frame = resize_image(source, (800, 480))
+
+    ctx.measure("render/resize_image/4000x3000-800x480", lambda: resize_image(source, (800, 480)), repeat=15)
+    ctx.measure("render/change_orientation/portrait/4000x3000",
+                lambda: change_orientation(source, "portrait"), repeat=15)
+    for orientation in ("landscape", "portrait"):
+        plan = plan_transform(source.size, (800, 480), orientation, inverted=True)
+        for name, func in (("transform", lambda: apply_transform(source, plan)),
+                           ("rotate_crop_resize", lambda: _rotate_crop_resize(source, orientation))):
+            result = ctx.measure(f"render/{name}/{orientation}/4000x3000-800x480", func, repeat=15)
+            result.update(_count_allocations(func))
+    ctx.measure("render/apply_image_enhancement/800x480",
+                lambda: apply_image_enhancement(frame, ENHANCEMENT_SETTINGS), repeat=30)
+
+    for model in ("7.3", "13.3"):
+        panel = SimulatedPanel(model, time_scale=0)
+        config = ctx.make_config(f"render-{model}", **{RESOLUTION_KEY: [panel.width, panel.height],
+                                                       IMAGE_SETTINGS_KEY: ENHANCEMENT_SETTINGS})
+        display_manager = _isolated(DisplayManager, ctx.path(f"render-{model}"))(config, panel)
+        # A copy has no filename, so every run renders from scratch instead of hitting the caches
+        ctx.measure(f"render/display_image/cold/{model}",
+                    lambda: display_manager.display_image(source.copy(), force=True), repeat=10)
+
+        source_path = ctx.path(f"render-{model}.jpg")
+        source.save(source_path, quality=90)
+
+        def display_cached():
+            with Image.open(source_path) as image:
+                display_manager.display_image(image, force=True)
+        ctx.measure(f"render/display_image/cached/{model}", display_cached, repeat=15)
+
+def _read_while_writing(read: Callable[[], Any], write: Callable[[], Any], readers: int, reads: int) -> None:
+    """Run reads on several threads while another thread keeps writing, until every read is done."""
+    done = threading.Event()
+
+    def write_until_done():
+        while not done.is_set():
+            write()
+
+    def read_all():
+        for _ in range(reads):
+            read()
+
+    writer = threading.Thread(target=write_until_done)
+    threads = [threading.Thread(target=read_all) for _ in range(readers)]
+    writer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    writer.join()
+
+def bench_index(ctx: BenchmarkContext) -> None:
+    for count in (QUICK_LIBRARY_COUNTS if ctx.quick else LIBRARY_COUNTS):
+        folder = ctx.path(f"library-{count}")
+        generate_library(folder, count)
+        image_manager = _isolated(ImageManager, ctx.path(f"index-{count}"))(
+            ctx.make_config(f"index-{count}", **{IMAGE_FOLDER_KEY: folder}))
+
+        index_files = []
+
+        def new_index():
+            index_files.append(ctx.path(f"index-{count}", f"cold-{len(index_files)}.json"))
+
+        ctx.measure(f"index/refresh_image_list/cold/{count}",
+                    lambda: ImageIndex(folder, SUPPORTED_IMAGE_EXTENSIONS, index_files[-1], use_inotify=False).refresh(),
+                    repeat=5, setup=new_index)
+        ctx.measure(f"index/refresh_image_list/unchanged/{count}", image_manager.refresh_image_list, repeat=50)
+
+        added = []
+
+        def add_file():
+            name = f"added_{len(added):05}.jpg"
+            os.link(os.path.join(folder, "photo_00000.jpg"), os.path.join(folder, name))
+            added.append(name)
+        ctx.measure(f"index/refresh_image_list/one_added/{count}", image_manager.refresh_image_list,
+                    repeat=10, setup=add_file)
+
+        # Jumping to an image picked in the gallery, alternating between the ends of the library
+        names = image_manager.get_image_names()
+        first, last = names[0], names[-1]
+
+        def select_images():
+            for _ in range(500):
+                image_manager.set_current_image(last)
+                image_manager.set_current_image(first)
+        ctx.measure(f"index/set_current_image/{count}", select_images, repeat=10, items=1000)
+
+        def read_snapshot():
+            for _ in range(1000):
+                image_manager.get_current_image_name()
+                image_manager.get_relative_image_path(1)
+        ctx.measure(f"index/snapshot_reads/{count}", read_snapshot, repeat=10, items=1000)
+
+        # Gallery and display readers racing a writer that moves the current image, with the
+        # lock-free snapshots and with every read and write behind one global lock as before them
+        global_lock = threading.Lock()
+
+        def read_locked():
+            with global_lock:
+                image_manager.get_current_image_name()
+                image_manager.get_relative_image_path(1)
+
+        def move_locked():
+            with global_lock:
+                image_manager.move_current_image(1)
+
+        def read_unlocked():
+            image_manager.get_current_image_name()
+            image_manager.get_relative_image_path(1)
+
+        for name, read, move in (("snapshot", read_unlocked, lambda: image_manager.move_current_image(1)),
+                                 ("global_lock", read_locked, move_locked)):
+            ctx.measure(f"index/concurrent_reads/{name}/{count}",
+                        lambda: _read_while_writing(read, move, CONCURRENT_READERS, 1000),
+                        repeat=5, items=CONCURRENT_READERS * 1000)
+
+def bench_upload(ctx: BenchmarkContext) -> None:
+    folder = ctx.path("uploads")
+    os.makedirs(folder, exist_ok=True)
+    image_manager = _isolated(ImageManager, ctx.path("upload-index"))(
+        ctx.make_config("upload", **{IMAGE_FOLDER_KEY: folder}))
+    upload_manager = UploadManager(image_manager, ctx.path("upload-staging"), 2, 5)
+    app = Flask(__name__)
+    app.secret_key = "benchmark"
+    app.config[UPLOAD_MANAGER_KEY] = upload_manager
+    app.register_blueprint(config_blueprint.bp)
+    client = app.test_client()
+
+    photos = []
+    for i in range(UPLOAD_BATCH_SIZE):
+        buffer = io.BytesIO()
+        make_photo((1920, 1080), seed=1000 + i).save(buffer, format="JPEG", quality=90)
+        photos.append(buffer.getvalue())
+    batches = []
+
+    def upload_batch():
+        # Distinct names and contents per batch, so no upload is skipped as a duplicate
+        batch = len(batches)
+        batches.append(batch)
+        files = [(io.BytesIO(data + batch.to_bytes(4, "big")), f"upload_{batch}_{i}.jpg")
+                 for i, data in enumerate(photos)]
+        response = client.post("/upload_images", headers={"Accept": "application/json"},
+                               data={"image_upload_names": files})
+        job_id = response.get_json()["job_id"]
+        while upload_manager.get_job(job_id)["state"] != "done":
+            time.sleep(0.005)
+
+    try:
+        ctx.measure(f"upload/upload_images/batch_{UPLOAD_BATCH_SIZE}", upload_batch, repeat=6,
+                    items=UPLOAD_BATCH_SIZE)
+    finally:
+        upload_manager.shutdown()
+
+def bench_gallery(ctx: BenchmarkContext) -> None:
+    count = QUICK_LIBRARY_COUNTS[-1] if ctx.quick else 10000
+    folder = ctx.path(f"gallery-{count}")
+    generate_library(folder, count)
+    app = Flask(__name__)
+    app.config[IMAGE_MANAGER_KEY] = _isolated(ImageManager, ctx.path(f"gallery-index-{count}"))(
+        ctx.make_config(f"gallery-{count}", **{IMAGE_FOLDER_KEY: folder}))
+    app.register_blueprint(gallery_blueprint.bp)
+    client = app.test_client()
+
+    for sort in ("none", "name", "size"):
+        query = f"/api/images?limit=24&cursor={count // 2}" + ("" if sort == "none" else f"&sort={sort}")
+        ctx.measure(f"gallery/page/{sort}/{count}", lambda: client.get(query), repeat=50)
+
+def _start_service(workdir: str, image_folder: str, foreground: bool) -> Dict[str, float]:
+    """Start the service in a child process and time its phases, in milliseconds from launch."""
+    os.makedirs(workdir, exist_ok=True)
+    command = [sys.executable, "-m", "benchmarks.startup", workdir, image_folder,
+               "--detect-seconds", str(STARTUP_DETECT_SECONDS)] + (["--foreground"] if foreground else [])
+    launched = time.time()
+    process = subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+    try:
+        phases = {}
+        for line in process.stdout:
+            phase, value = line.split()
+            phases[phase] = float(value)
+            if phase == "port":
+                break
+        if "port" not in phases:
+            raise RuntimeError(f"Service exited during startup with status {process.wait()}")
+
+        url = f"http://127.0.0.1:{int(phases['port'])}/home"
+        frame_path = os.path.join(workdir, "frames", "latest.png")
+        if os.path.exists(frame_path):
+            os.remove(frame_path)
+        first_response = first_frame = None
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while (first_response is None or first_frame is None) and time.monotonic() < deadline:
+            if first_response is None:
+                try:
+                    with urllib.request.urlopen(url, timeout=STARTUP_TIMEOUT_SECONDS) as response:
+                        if response.status == 200:
+                            first_response = time.time()
+                except OSError:
+                    pass
+            if first_frame is None and os.path.exists(frame_path):
+                first_frame = time.time()
+            time.sleep(0.005)
+        if first_response is None or first_frame is None:
+            raise RuntimeError("Service didn't answer and show a frame in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"imports": (phases["imported"] - phases["started"]) * 1000,
+            "create_app": (phases["created"] - phases["imported"]) * 1000,
+            "first_response": (first_response - launched) * 1000,
+            "first_frame": (first_frame - launched) * 1000}
+
+def bench_startup(ctx: BenchmarkContext) -> None:
+    folder = ctx.path("startup-library")
+    generate_library(folder, QUICK_LIBRARY_COUNTS[-1] if ctx.quick else 10000)
+    image_manager = _isolated(ImageManager, ctx.path("startup-splash"))(
+        ctx.make_config("startup-splash", **{IMAGE_FOLDER_KEY: folder}))
+    splash_folder = ctx.path("startup-splash", "default")
+
+    ctx.measure("startup/default_images/drawn",
+                lambda: image_manager.create_default_image("Pidash", "Visit: http://pidash", splash_folder),
+                repeat=10, setup=lambda: shutil.rmtree(splash_folder, ignore_errors=True))
+    ctx.measure("startup/default_images/cached",
+                lambda: image_manager.create_default_image("Pidash", "Visit: http://pidash", splash_folder),
+                repeat=50)
+
+    # The first start of each mode builds the index and draws the splash images, later ones find them on disk
+    repeat = 1 if ctx.quick else 3
+    for mode in ("background", "foreground"):
+        workdir = ctx.path(f"startup-{mode}")
+        _start_service(workdir, folder, mode == "foreground")
+        runs = [_start_service(workdir, folder, mode == "foreground") for _ in range(repeat)]
+        for phase in ("imports", "create_app", "first_response", "first_frame"):
+            ctx.record(f"startup/{phase}/{mode}", [run[phase] for run in runs])
+
+def bench_metrics(ctx: BenchmarkContext) -> None:
+    registry = MetricsRegistry()
+    histogram = registry.histogram("benchmark_seconds", "Benchmark latencies.", ("stage",))
+    counter = registry.counter("benchmark_total", "Benchmark events.", ("result",))
+
+    def time_stages():
+        for _ in range(1000):
+            with histogram.labels("resize").time():
+                pass
+            counter.labels("hit").inc()
+    ctx.measure("metrics/timed_stage_and_counter", time_stages, repeat=20, items=1000)
+    ctx.measure("metrics/render", registry.render, repeat=50)
+
+BENCHMARKS: Dict[str, Callable[[BenchmarkContext], None]] = {
+    "render": bench_render,
+    "index": bench_index,
+    "upload": bench_upload,
+    "gallery": bench_gallery,
+    "metrics": bench_metrics,
+    "startup": bench_startup
+}
+
+def run_benchmarks(workdir: str, groups: Optional[List[str]] = None, quick: bool = False) -> Dict[str, Any]:
+    """
+    Run benchmark groups and collect their results.
+
+    Args:
+        workdir: Empty directory for generated libraries, caches and indexes
+        groups: Names of the groups in BENCHMARKS to run, or None for all of them
+        quick: Whether to run smaller libraries and fewer repetitions
+
+    Returns:
+        Dict[str, Any]: Results with metadata, in the format saved as a baseline
+    """
+    ctx = BenchmarkContext(workdir, quick)
+    for group in groups or list(BENCHMARKS):
+        if group not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark group {group}, expected one of {', '.join(BENCHMARKS)}")
+        logger.info(f"Running {group} benchmarks")
+        BENCHMARKS[group](ctx)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": quick
+        },
+        "results": ctx.results
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compare the median times of two runs.
+
+    Args:
+        baseline: Results of the reference run
+        current: Results of the run being checked
+        threshold: Relative slowdown beyond which a benchmark counts as a regression, e.g. 0.15
+
+    Returns:
+        List[Dict[str, Any]]: One row per benchmark with its status: "regression",
+        "improvement", "ok", "new" or "missing"
+    """
+    baseline_results, current_results = baseline["results"], current["results"]
+    rows = []
+    for name in sorted(set(baseline_results) | set(current_results)):
+        before = baseline_results.get(name, {}).get("median_ms")
+        after = current_results.get(name, {}).get("median_ms")
+        if before is None or after is None:
+            rows.append({"name": name, "baseline_ms": before, "current_ms": after,
+                         "change": None, "status": "new" if before is None else "missing"})
+            continue
+
+        change = (after - before) / before if before else 0.0
+        if abs(after - before) < MIN_CHANGE_MS:
+            status = "ok"
+        elif change > threshold:
+            status = "regression"
+        elif change < -threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"name": name, "baseline_ms": before, "current_ms": after, "change": change, "status": status})
+    return rows
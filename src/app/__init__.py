@@ -5,8 +5,18 @@ from config import Config
 from image_manager import ImageManager
 from display_manager import DisplayManager
 from refresh_manager import RefreshManager
-from blueprints import (pidash, config, display, home, upload, gallery, settings)
-from constants import (CONFIG_KEY, IMAGE_MANAGER_KEY, DISPLAY_MANAGER_KEY, REFRESH_MANAGER_KEY, HOSTNAME_KEY, LOCAL_IP_KEY)
+from remote_frames import RemoteFrameSource
+# Through the src package, like the managers, so the app configures the budget they share
+from src.memory_budget import MEMORY_BUDGET
+from thumbnail_manager import ThumbnailManager
+from upload_manager import UploadManager
+from blueprints import (pidash, config, display, home, upload, gallery, settings, metrics)
+from constants import (CONFIG_KEY, IMAGE_MANAGER_KEY, DISPLAY_MANAGER_KEY, REFRESH_MANAGER_KEY, HOSTNAME_KEY, LOCAL_IP_KEY,
+                       THUMBNAIL_MANAGER_KEY, DEFAULT_THUMBNAIL_FOLDER, THUMBNAIL_SIZE, SUPPORTED_IMAGE_EXTENSIONS,
+                       UPLOAD_MANAGER_KEY, DEFAULT_UPLOAD_STAGING_FOLDER, UPLOAD_WORKERS, MAX_UPLOAD_JOBS,
+                       DEEP_VERIFY_UPLOADS, NEAR_DUPLICATE_DISTANCE, MEMORY_BUDGET_MB_KEY, DEFAULT_MEMORY_BUDGET_MB,
+                       FRAME_SERVER_URL_KEY, FRAME_SERVER_PROFILE_KEY, DEFAULT_REMOTE_FRAME_FOLDER,
+                       RENDER_CACHE_SIZE_MB_KEY, DEFAULT_RENDER_CACHE_SIZE_MB)
 from waitress import serve
 
 def create_app(hostname=None):
@@ -22,14 +32,33 @@ def create_app(hostname=None):
     if hostname is not None:
         configuration.set(HOSTNAME_KEY, hostname)
 
+    MEMORY_BUDGET.set_limit(configuration.get(MEMORY_BUDGET_MB_KEY, DEFAULT_MEMORY_BUDGET_MB) * 1024 * 1024)
+
+    # Frames are pulled from a frame server when one is configured, and rendered here when it can't be reached
+    frame_source = None
+    if configuration.get(FRAME_SERVER_URL_KEY) and configuration.get(FRAME_SERVER_PROFILE_KEY):
+        cache_size_mb = configuration.get(RENDER_CACHE_SIZE_MB_KEY, DEFAULT_RENDER_CACHE_SIZE_MB)
+        frame_source = RemoteFrameSource(configuration.get(FRAME_SERVER_URL_KEY),
+                                         configuration.get(FRAME_SERVER_PROFILE_KEY),
+                                         os.path.join(os.path.dirname(src_dir), DEFAULT_REMOTE_FRAME_FOLDER),
+                                         int(cache_size_mb * 1024 * 1024))
+
     image_manager = ImageManager(configuration)
-    display_manager = DisplayManager(configuration)
+    display_manager = DisplayManager(configuration, background=True, frame_source=frame_source)
     refresh_manager = RefreshManager(configuration, image_manager, display_manager)
+    thumbnail_manager = ThumbnailManager(image_manager.image_folder,
+                                         os.path.join(os.path.dirname(src_dir), DEFAULT_THUMBNAIL_FOLDER),
+                                         THUMBNAIL_SIZE, SUPPORTED_IMAGE_EXTENSIONS)
+    upload_manager = UploadManager(image_manager, os.path.join(os.path.dirname(src_dir), DEFAULT_UPLOAD_STAGING_FOLDER),
+                                   UPLOAD_WORKERS, MAX_UPLOAD_JOBS, DEEP_VERIFY_UPLOADS, NEAR_DUPLICATE_DISTANCE,
+                                   on_changed=refresh_manager.cancel_prefetch)
 
     app.config[CONFIG_KEY] = configuration
     app.config[IMAGE_MANAGER_KEY] = image_manager
     app.config[DISPLAY_MANAGER_KEY] = display_manager
     app.config[REFRESH_MANAGER_KEY] = refresh_manager
+    app.config[THUMBNAIL_MANAGER_KEY] = thumbnail_manager
+    app.config[UPLOAD_MANAGER_KEY] = upload_manager
 
     app.register_blueprint(pidash.bp)
     app.register_blueprint(config.bp)
@@ -38,6 +67,7 @@ def create_app(hostname=None):
     app.register_blueprint(upload.bp)
     app.register_blueprint(gallery.bp)
     app.register_blueprint(settings.bp)
+    app.register_blueprint(metrics.bp)
 
     return app
 
@@ -9,9 +9,20 @@ from src.blueprints import upload
 from src.blueprints import gallery
 from src.blueprints import settings
 from src.blueprints import display
+from src.blueprints import metrics
 from src.config import Config
 from src.image_manager import ImageManager
-from src.constants import CONFIG_KEY, IMAGE_MANAGER_KEY, DISPLAY_MANAGER_KEY, LOG_FORMAT, LOG_DATE_FORMAT, HOSTNAME_KEY, LOCAL_IP_KEY
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.refresh_manager import RefreshManager
+from src.thumbnail_manager import ThumbnailManager
+from src.upload_manager import UploadManager
+from src.constants import (
+    CONFIG_KEY, IMAGE_MANAGER_KEY, DISPLAY_MANAGER_KEY, REFRESH_MANAGER_KEY, LOG_FORMAT, LOG_DATE_FORMAT, HOSTNAME_KEY, LOCAL_IP_KEY,
+    THUMBNAIL_MANAGER_KEY, DEFAULT_THUMBNAIL_FOLDER, THUMBNAIL_SIZE, SUPPORTED_IMAGE_EXTENSIONS,
+    UPLOAD_MANAGER_KEY, DEFAULT_UPLOAD_STAGING_FOLDER, UPLOAD_WORKERS, MAX_UPLOAD_JOBS, DEEP_VERIFY_UPLOADS,
+    NEAR_DUPLICATE_DISTANCE, DEFAULT_SIMULATED_PANEL
+)
 
 # Test app designed for local development
 def create_app():
@@ -26,26 +37,32 @@ def create_app():
         format=LOG_FORMAT,
         datefmt=LOG_DATE_FORMAT,
     )
-    class DummyRefreshManager:
-        def refresh_display(self):
-            return True
-        def display_next_image(self):
-            return True
-        def display_previous_image(self):
-            return True
-        def start(self):
-            return True
-        def stop(self):
-            return True
 
     configuration = Config()
 
     configuration.set(HOSTNAME_KEY, "Pidash")
     configuration.set(LOCAL_IP_KEY, "localhost")
 
+    image_manager = ImageManager(configuration)
+    # The last frames shown on the simulated panel are kept in src/cache/simulated for inspection
+    display_manager = DisplayManager(configuration, SimulatedPanel(DEFAULT_SIMULATED_PANEL,
+                                                                   os.path.join(src_dir, "cache", "simulated"),
+                                                                   time_scale=0.1),
+                                     background=True)
+    refresh_manager = RefreshManager(configuration, image_manager, display_manager)
+
     app.config[CONFIG_KEY] = configuration
-    app.config[IMAGE_MANAGER_KEY] = ImageManager(configuration)
-    app.config[DISPLAY_MANAGER_KEY] = DummyRefreshManager()
+    app.config[IMAGE_MANAGER_KEY] = image_manager
+    app.config[DISPLAY_MANAGER_KEY] = display_manager
+    app.config[REFRESH_MANAGER_KEY] = refresh_manager
+    app.config[THUMBNAIL_MANAGER_KEY] = ThumbnailManager(image_manager.image_folder,
+                                                         os.path.join(os.path.dirname(src_dir), DEFAULT_THUMBNAIL_FOLDER),
+                                                         THUMBNAIL_SIZE, SUPPORTED_IMAGE_EXTENSIONS)
+    app.config[UPLOAD_MANAGER_KEY] = UploadManager(image_manager,
+                                                   os.path.join(os.path.dirname(src_dir), DEFAULT_UPLOAD_STAGING_FOLDER),
+                                                   UPLOAD_WORKERS, MAX_UPLOAD_JOBS, DEEP_VERIFY_UPLOADS,
+                                                   NEAR_DUPLICATE_DISTANCE,
+                                                   on_changed=refresh_manager.cancel_prefetch)
 
     app.register_blueprint(pidash.bp)
     app.register_blueprint(config.bp)
@@ -54,9 +71,11 @@ def create_app():
     app.register_blueprint(upload.bp)
     app.register_blueprint(gallery.bp)
     app.register_blueprint(settings.bp)
+    app.register_blueprint(metrics.bp)
 
     return app
 
 if __name__ == "__main__":
     app = create_app()
-    app.run(host="0.0.0.0", debug=True)
+    app.config[REFRESH_MANAGER_KEY].start()
+    app.run(host="0.0.0.0", debug=True, use_reloader=False)
@@ -1,49 +1,18 @@
-import os
-import tempfile
-import magic
-from PIL import Image
 from flask import (
-    Blueprint, current_app, flash, redirect, request, url_for
+    Blueprint, current_app, flash, jsonify, redirect, request, url_for
 )
 from werkzeug.utils import secure_filename
 from src.constants import (
-    MAX_FILE_SIZE_BYTES, ALLOWED_MIME_TYPES, SUPPORTED_IMAGE_EXTENSIONS,
     SECONDS_PER_MINUTE, SECONDS_PER_HOUR, ORIENTATION_KEY, REFRESH_INTERVAL_KEY,
-    CONFIG_KEY, IMAGE_MANAGER_KEY, REFRESH_MANAGER_KEY
+    CONFIG_KEY, IMAGE_MANAGER_KEY, REFRESH_MANAGER_KEY, THUMBNAIL_MANAGER_KEY, UPLOAD_MANAGER_KEY
 )
+from src.metrics import UPLOAD_STAGE_SECONDS
 from src.validation import (
     ValidationError, validate_refresh_interval, validate_orientation
 )
 
 bp = Blueprint("config", __name__)
 
-def validate_uploaded_file(file_path, filename):
-    """Validate uploaded file for security and format."""
-    try:
-        file_size = os.path.getsize(file_path)
-        if file_size > MAX_FILE_SIZE_BYTES:
-            return False, f"File too large. Maximum size is {MAX_FILE_SIZE_BYTES // (1024*1024)}MB"
-        
-        file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext not in SUPPORTED_IMAGE_EXTENSIONS:
-            return False, f"File type {file_ext} not allowed"
-
-        mime = magic.from_file(file_path, mime=True)
-        if mime not in ALLOWED_MIME_TYPES:
-            return False, f"Invalid file format (detected: {mime})" 
-
-        try:
-            with Image.open(file_path) as img:
-                img.verify()
-            with Image.open(file_path) as img:
-                img.load()
-            return True, "File validation successful"
-        except Exception as e:
-            return False, f"Invalid image file: {str(e)}"
-            
-    except Exception as e:
-        return False, f"File validation error: {str(e)}"
-
 @bp.post("/update_config")
 def update_config():
     config = current_app.config[CONFIG_KEY]
@@ -81,63 +50,42 @@ def update_config():
     if has_errors:
         flash("Some settings could not be updated due to errors", "error")
 
-    _refresh_display()
-
     return redirect(request.referrer or url_for("home.home"))
 
 @bp.post("/upload_images")
 def upload_images():
-    image_manager = current_app.config[IMAGE_MANAGER_KEY]
+    upload_manager = current_app.config[UPLOAD_MANAGER_KEY]
+    wants_json = request.accept_mimetypes.best == "application/json"
 
-    files = request.files.getlist("image_upload_names")
+    files = [file for file in request.files.getlist("image_upload_names") if file and file.filename]
     
     if not files:
+        if wants_json:
+            return jsonify({"error": "No files selected"}), 400
         flash("No files selected", "error")
         return redirect(request.referrer or url_for("home.home"))
     
-    uploaded_count = 0
-    rejected_count = 0
-    
-    for file in files:
-        if file and file.filename:
-            safe_filename = secure_filename(file.filename)
-            tmp_path = None
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.tmp') as tmp_file:
-                tmp_path = tmp_file.name
-                file.save(tmp_file.name)
-                
-                try:
-                    is_valid, message = validate_uploaded_file(tmp_path, safe_filename)
-
-                    if is_valid:
-                        success = image_manager.add_image(tmp_path, safe_filename)
-                        if success:
-                            uploaded_count += 1
-                        else:
-                            flash(f"Failed to save {safe_filename}", "error")
-                            rejected_count += 1
-                    else:
-                        flash(f"Rejected {safe_filename}: {message}", "error")
-                        rejected_count += 1
-                        
-                except Exception as e:
-                    flash(f"Failed to upload {safe_filename}: {str(e)}", "error")
-                    rejected_count += 1
-                finally:
-                    if tmp_path and os.path.exists(tmp_path):
-                        try:
-                            os.unlink(tmp_path)
-                        except Exception:
-                            pass
-    
-    if uploaded_count > 0:
-        flash(f"Successfully uploaded {uploaded_count} image(s)", "success")
-    if rejected_count > 0:
-        flash(f"Rejected {rejected_count} file(s) due to security or format issues", "warning")
+    staged_files = []
+    with UPLOAD_STAGE_SECONDS.labels("receive").time():
+        for file in files:
+            staged_path = upload_manager.create_staging_file()
+            file.save(staged_path)
+            staged_files.append((staged_path, secure_filename(file.filename)))
+
+    job_id = upload_manager.submit(staged_files)
     
+    if wants_json:
+        return jsonify({"job_id": job_id, "status_url": url_for("config.upload_status", job_id=job_id)}), 202
+    flash(f"Uploading {len(staged_files)} image(s), they will appear in the gallery shortly", "success")
     return redirect(request.referrer or url_for("home.home"))
 
+@bp.get("/upload_images/<job_id>")
+def upload_status(job_id):
+    job = current_app.config[UPLOAD_MANAGER_KEY].get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown upload job"}), 404
+    return jsonify(job)
+
 @bp.post("/remove_images")
 def remove_images():
     image_manager = current_app.config[IMAGE_MANAGER_KEY]
@@ -151,14 +99,15 @@ def remove_images():
     
     removed_count = 0
     
-    for image_name in image_names:
-        try:
-            image_manager.remove_image(image_name)
+    for image_name, removed in zip(image_names, image_manager.remove_images(image_names)):
+        if removed:
+            current_app.config[THUMBNAIL_MANAGER_KEY].remove(image_name)
             removed_count += 1
-        except Exception as _:
+        else:
             flash(f"Failed to remove {image_name}", "error")
     
     if removed_count > 0:
+        _cancel_prefetch()
         flash(f"Removed {removed_count} image(s)", "success")
 
     current_image_name = image_manager.get_current_image_name()
@@ -170,6 +119,8 @@ def remove_images():
 @bp.post("/remove_all_images")
 def remove_all_images():
     current_app.config[IMAGE_MANAGER_KEY].remove_all_images()
+    current_app.config[THUMBNAIL_MANAGER_KEY].clear()
+    _cancel_prefetch()
     return redirect(request.referrer or url_for("home.home"))
 
 @bp.post("/change_current_image")
@@ -180,10 +131,12 @@ def change_current_image():
         flash("No image selected", "error")
         return redirect(request.referrer or url_for("home.home"))
 
-    current_app.config[IMAGE_MANAGER_KEY].set_current_image(image_name)
-    _refresh_display()
+    current_app.config[REFRESH_MANAGER_KEY].request_image(image_name)
 
     return redirect(request.referrer or url_for("home.home"))
 
 def _refresh_display():
-    current_app.config[REFRESH_MANAGER_KEY].refresh_display()
\ No newline at end of file
+    current_app.config[REFRESH_MANAGER_KEY].request_refresh()
+
+def _cancel_prefetch():
+    current_app.config[REFRESH_MANAGER_KEY].cancel_prefetch()
\ No newline at end of file
@@ -1,5 +1,5 @@
 from flask import (
-    Blueprint, current_app, redirect, request, url_for
+    Blueprint, current_app, jsonify, redirect, request, url_for
 )
 from src.constants import REFRESH_MANAGER_KEY
 
@@ -11,21 +11,25 @@ def home():
 
 @bp.post("/refresh_screen")
 def refresh_screen():
-    _refresh_display()
-    return redirect(request.referrer or url_for("home.home"))
+    return _respond(current_app.config[REFRESH_MANAGER_KEY].request_refresh(force=True))
 
 @bp.post("/show_next_image")
 def show_next_image():
-    _refresh_display()
-    return redirect(request.referrer or url_for("home.home"))
+    return _respond(current_app.config[REFRESH_MANAGER_KEY].request_next())
 
 @bp.post("/show_previous_image")
 def show_previous_image():
-    _refresh_display()
-    return redirect(request.referrer or url_for("home.home"))
+    return _respond(current_app.config[REFRESH_MANAGER_KEY].request_previous())
 
-def _refresh_display():
-    try:
-        current_app.config[REFRESH_MANAGER_KEY].refresh_display()
-    except Exception:
-        pass
\ No newline at end of file
+@bp.get("/display_jobs/<job_id>")
+def display_status(job_id):
+    job = current_app.config[REFRESH_MANAGER_KEY].get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown display job"}), 404
+    return jsonify(job)
+
+def _respond(job):
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job.job_id,
+                        "status_url": url_for("display.display_status", job_id=job.job_id)}), 202
+    return redirect(request.referrer or url_for("home.home"))
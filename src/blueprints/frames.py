@@ -0,0 +1,37 @@
+from flask import (
+    Blueprint, current_app, request, jsonify, abort
+)
+from src.constants import FRAME_SERVER_KEY
+
+bp = Blueprint("frames", __name__)
+
+@bp.get("/api/profiles")
+def list_profiles():
+    frame_server = current_app.config[FRAME_SERVER_KEY]
+    return jsonify(profiles=[profile.to_dict() for profile in frame_server.profiles.values()])
+
+@bp.get("/api/frames/<profile>/<image_name>")
+def frame(profile, image_name):
+    frame_server = current_app.config[FRAME_SERVER_KEY]
+    device_profile = frame_server.profiles.get(profile)
+    if device_profile is None:
+        return jsonify(error=f"Unknown device profile {profile}"), 404
+
+    # A device whose settings drifted from its profile would show frames rendered for another setup
+    settings = request.args.get("settings")
+    if settings is not None and settings != device_profile.settings_digest():
+        return jsonify(error=f"Device settings don't match profile {profile}",
+                       profile=device_profile.to_dict()), 409
+
+    source = frame_server.locate(profile, image_name)
+    if source is None:
+        abort(404)
+
+    source_path, etag = source
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(frame_server.render(profile, source_path), mimetype="image/png")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
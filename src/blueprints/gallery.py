@@ -1,45 +1,67 @@
 import os
+from concurrent.futures import TimeoutError
 from flask import (
-    Blueprint, current_app, render_template, request
+    Blueprint, current_app, render_template, request, send_file, abort, jsonify
 )
 from src.constants import (
-    CONFIG_KEY, IMAGE_MANAGER_KEY, DEFAULT_GALLERY_LIMIT, CURRENT_IMAGE_INDEX_KEY
+    IMAGE_MANAGER_KEY, DEFAULT_GALLERY_LIMIT, MAX_GALLERY_PAGE_SIZE, THUMBNAIL_MANAGER_KEY, THUMBNAIL_WAIT_SECONDS
 )
 
 bp = Blueprint("gallery", __name__)
 
 @bp.route("/gallery")
 def home():
-    config = current_app.config[CONFIG_KEY]
     image_manager = current_app.config[IMAGE_MANAGER_KEY]
+
+    return render_template("gallery.html",
+                           current_image=image_manager.get_current_image_name(),
+                           total_count=image_manager.get_image_count(),
+                           gallery_limit=DEFAULT_GALLERY_LIMIT)
+
+@bp.route("/api/images")
+def list_images():
+    image_manager = current_app.config[IMAGE_MANAGER_KEY]
+
+    try:
+        offset = int(request.args.get("cursor") or 0)
+        limit = int(request.args.get("limit") or DEFAULT_GALLERY_LIMIT)
+    except ValueError:
+        return jsonify(error="cursor and limit must be integers"), 400
+
+    if offset < 0 or not 1 <= limit <= MAX_GALLERY_PAGE_SIZE:
+        return jsonify(error=f"cursor must be positive and limit between 1 and {MAX_GALLERY_PAGE_SIZE}"), 400
+
+    sort = request.args.get("sort") or None
+    descending = request.args.get("order", "asc").lower() == "desc"
+
     try:
-        images = image_manager.get_image_names()
+        images, total = image_manager.get_image_page(offset, limit, sort, descending)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    next_offset = offset + limit
+    return jsonify(images=images,
+                   total=total,
+                   current_image=image_manager.get_current_image_name(),
+                   next_cursor=str(next_offset) if next_offset < total else None)
+
+@bp.route("/thumbnail/<image_name>")
+def thumbnail(image_name):
+    thumbnail_manager = current_app.config[THUMBNAIL_MANAGER_KEY]
+    try:
+        result = thumbnail_manager.get_thumbnail(image_name, timeout=THUMBNAIL_WAIT_SECONDS)
+    except TimeoutError:
+        response = current_app.response_class("Thumbnail is being generated", status=503)
+        response.headers["Retry-After"] = "2"
+        return response
     except Exception:
-        images = []
-
-    show_all = request.args.get("all") == "1"
-    current_index = config.get(CURRENT_IMAGE_INDEX_KEY)
-
-    if show_all:
-        visible_images = images
-    else:
-        total_images = len(images)
-        window_size = DEFAULT_GALLERY_LIMIT
-        
-        half_window = window_size // 2
-        start_index = max(0, current_index - half_window)
-        end_index = min(total_images, start_index + window_size)
-        
-        if end_index - start_index < window_size:
-            start_index = max(0, end_index - window_size)
-        
-        visible_images = images[start_index:end_index]
-
-    current_image = image_manager.get_current_image_name()
+        abort(404)
 
-    return render_template("gallery.html",
-                           images=visible_images,
-                           current_image=current_image,
-                           total_count=len(images),
-                           show_all=show_all,
-                           gallery_limit=DEFAULT_GALLERY_LIMIT)
\ No newline at end of file
+    if result is None:
+        abort(404)
+
+    thumbnail_path, etag = result
+    response = send_file(thumbnail_path, mimetype=thumbnail_manager.mimetype, etag=etag,
+                         conditional=True, max_age=0)
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,10 @@
+from flask import (
+    Blueprint, current_app
+)
+from src.metrics import REGISTRY, CONTENT_TYPE
+
+bp = Blueprint("metrics", __name__)
+
+@bp.get("/metrics")
+def metrics():
+    return current_app.response_class(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -1,10 +1,13 @@
 import os
 import json
+import atexit
 import logging
-from typing import Any, Dict
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from src.constants import (
-    DEFAULT_CONFIG_FILE, CONFIG_DIR 
+    DEFAULT_CONFIG_FILE, CONFIG_DIR, DEFAULT_STATE_FILE, STATE_KEYS, CONFIG_FLUSH_DELAY_SECONDS
 )
+from src.file_utils import write_json_atomic
 
 logger = logging.getLogger(__name__)
 
@@ -14,14 +17,66 @@ class Config:
     
     Handles loading, saving, and accessing configuration values from device.json.
     Automatically finds the config file in development or production environments.
+
+    Saves are coalesced: set marks the value dirty and a timer writes it out a
+    few seconds later, or at exit. Ephemeral keys that change all the time, like
+    the current image index, are written to a small state file next to the
+    config file so they don't rewrite device.json. Both files are replaced
+    atomically.
+
+    Components that depend on a value can subscribe to it and are called with
+    the old and new value whenever it changes.
     """
     
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     
-    def __init__(self) -> None:
-        """Initialize the configuration manager and load config file."""
+    def __init__(self, state_keys: Iterable[str] = STATE_KEYS,
+                 flush_delay: float = CONFIG_FLUSH_DELAY_SECONDS) -> None:
+        """
+        Initialize the configuration manager and load config file.
+
+        Args:
+            state_keys: Keys persisted to the state file instead of the config file
+            flush_delay: Seconds to wait after a change before writing it to disk
+        """
+        self.state_keys: Set[str] = set(state_keys)
+        self.flush_delay = flush_delay
+        self.lock = threading.RLock()
+        # Held from copying the data until it is on disk, so an older copy never lands after a newer one
+        self.write_lock = threading.Lock()
+        self.dirty_config = False
+        self.dirty_state = False
+        self.flush_timer: Optional[threading.Timer] = None
+        self.subscribers: List[Tuple[Set[str], Callable[[str, Any, Any], None]]] = []
         self.config_file: str = self._find_config_file()
         self.config: Dict[str, Any] = self.load_config()
+        atexit.register(self.flush)
+
+    @property
+    def state_file(self) -> str:
+        return os.path.join(os.path.dirname(self.config_file), DEFAULT_STATE_FILE)
+
+    def subscribe(self, keys: Iterable[str], callback: Callable[[str, Any, Any], None]) -> None:
+        """
+        Register a callback for changes to some configuration values.
+
+        The callback runs on the thread that set the value, after it was stored.
+
+        Args:
+            keys: Configuration keys to watch
+            callback: Called as callback(key, old_value, new_value) when one of the keys changes
+        """
+        with self.lock:
+            self.subscribers.append((set(keys), callback))
+
+    def unsubscribe(self, callback: Callable[[str, Any, Any], None]) -> None:
+        with self.lock:
+            self.subscribers = [(keys, cb) for keys, cb in self.subscribers if cb != callback]
+
+    def mark_ephemeral(self, *keys: str) -> None:
+        """Persist the given keys to the state file instead of the config file from now on."""
+        with self.lock:
+            self.state_keys.update(keys)
     
     def _find_config_file(self) -> str:
         """
@@ -68,6 +123,7 @@ class Config:
             with open(self.config_file) as f:
                 config = json.load(f)
 
+            config.update(self._load_state())
             logger.debug("Loaded config:\n%s", json.dumps(config, indent=2))
             return config
         except FileNotFoundError:
@@ -82,15 +138,41 @@ class Config:
     
     def save_config(self) -> None:
         """
-        Save current configuration to file.
+        Save current configuration to file immediately.
         
         Logs errors but doesn't raise exceptions to avoid breaking the application.
         """
-        try:
-            with open(self.config_file, "w") as f:
-                json.dump(self.config, f, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving config: {e}")
+        with self.write_lock:
+            with self.lock:
+                data = dict(self.config)
+                self.dirty_config = False
+            try:
+                write_json_atomic(self.config_file, data, indent=2, fsync=True)
+            except Exception as e:
+                logger.error(f"Error saving config: {e}")
+
+    def save_state(self) -> None:
+        """Save the ephemeral keys to the state file immediately."""
+        with self.write_lock:
+            with self.lock:
+                data = {key: self.config[key] for key in self.state_keys if key in self.config}
+                self.dirty_state = False
+            try:
+                write_json_atomic(self.state_file, data, fsync=True)
+            except Exception as e:
+                logger.error(f"Error saving state: {e}")
+
+    def flush(self) -> None:
+        """Write any pending changes to disk now."""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            dirty_config, dirty_state = self.dirty_config, self.dirty_state
+        if dirty_config:
+            self.save_config()
+        if dirty_state:
+            self.save_state()
     
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -112,8 +194,38 @@ class Config:
         Args:
             key: Configuration key to set
             value: Value to set
-            save: Whether to immediately save to file
+            save: Whether to persist the value, which happens after the flush delay
         """
-        self.config[key] = value
-        if save:
-            self.save_config()
+        with self.lock:
+            old_value = self.config.get(key)
+            # The same dict or list may have been modified in place, so it can't be compared with itself
+            modified_in_place = old_value is value and isinstance(value, (dict, list))
+            changed = key not in self.config or modified_in_place or old_value != value
+            self.config[key] = value
+            callbacks = [callback for keys, callback in self.subscribers if key in keys] if changed else []
+            if save:
+                if key in self.state_keys:
+                    self.dirty_state = True
+                else:
+                    self.dirty_config = True
+                if self.flush_timer is None:
+                    self.flush_timer = threading.Timer(self.flush_delay, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+
+        for callback in callbacks:
+            try:
+                callback(key, old_value, value)
+            except Exception as e:
+                logger.exception(f"Config subscriber failed for {key}: {e}")
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable state file {self.state_file}: {e}")
+            return {}
+        return {key: value for key, value in state.items() if key in self.state_keys}
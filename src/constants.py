@@ -8,7 +8,15 @@ to improve maintainability and reduce duplication.
 # File and path constants
 DEFAULT_IMAGE_FOLDER = "src/static/images"
 DEFAULT_CONFIG_FILE = "device.json"
+DEFAULT_STATE_FILE = "state.json"
 CONFIG_DIR = "config"
+DEFAULT_RENDER_CACHE_FOLDER = "src/cache/render"
+DEFAULT_IMAGE_INDEX_FOLDER = "src/cache/index"
+DEFAULT_THUMBNAIL_FOLDER = "src/cache/thumbnails"
+DEFAULT_UPLOAD_STAGING_FOLDER = "src/cache/uploads"
+DEFAULT_FRAME_STORE_FILE = "src/cache/frames.bin"
+DEFAULT_FRAME_SERVER_FOLDER = "src/cache/frame_server"
+DEFAULT_REMOTE_FRAME_FOLDER = "src/cache/remote"
 
 # Config constants
 NAME_KEY = "name"
@@ -19,13 +27,35 @@ ORIENTATION_KEY = "orientation"
 INVERTED_IMAGE_KEY = "inverted_image"
 REFRESH_INTERVAL_KEY = "refresh_interval"
 CURRENT_IMAGE_INDEX_KEY = "current_image_index"
+# Name of the current image, which finds it again after positions changed, e.g. across restarts
+CURRENT_IMAGE_KEY = "current_image"
 IMAGE_SETTINGS_KEY = "image_settings"
 RESOLUTION_KEY = "resolution"
+RENDER_CACHE_SIZE_MB_KEY = "render_cache_size_mb"
+LAST_FRAME_FINGERPRINT_KEY = "last_frame_fingerprint"
+MEMORY_BUDGET_MB_KEY = "memory_budget_mb"
+# "inky" for the attached panel or "simulated" to run without hardware
+DISPLAY_BACKEND_KEY = "display_backend"
+# Keyword arguments of the simulated panel, e.g. {"model": "13.3", "time_scale": 0}
+SIMULATED_DISPLAY_KEY = "simulated_display"
+# Device profiles a frame server renders for, by name: {"kitchen": {"panel": "7.3", "orientation": "portrait"}}
+FRAME_SERVER_PROFILES_KEY = "frame_server_profiles"
+# Frame server a device pulls its frames from, e.g. "http://frames.local:8080", and the profile it pulls
+FRAME_SERVER_URL_KEY = "frame_server_url"
+FRAME_SERVER_PROFILE_KEY = "frame_server_profile"
+# Keys whose values change how a frame is rendered
+RENDER_SETTING_KEYS = (RESOLUTION_KEY, ORIENTATION_KEY, INVERTED_IMAGE_KEY, IMAGE_SETTINGS_KEY)
+# Frequently changing keys persisted to the state file instead of the config file
+STATE_KEYS = (CURRENT_IMAGE_INDEX_KEY, CURRENT_IMAGE_KEY, LAST_FRAME_FINGERPRINT_KEY)
+CONFIG_FLUSH_DELAY_SECONDS = 5
 
 CONFIG_KEY = "config"
 IMAGE_MANAGER_KEY = "image_manager"
 REFRESH_MANAGER_KEY = "refresh_manager"
 DISPLAY_MANAGER_KEY = "display_manager"
+THUMBNAIL_MANAGER_KEY = "thumbnail_manager"
+UPLOAD_MANAGER_KEY = "upload_manager"
+FRAME_SERVER_KEY = "frame_server"
 
 # Image processing constants
 SUPPORTED_IMAGE_EXTENSIONS = {
@@ -39,9 +69,33 @@ DEFAULT_BRIGHTNESS = 1.0
 DEFAULT_CONTRAST = 1.0
 DEFAULT_SATURATION = 1.0
 DEFAULT_SHARPNESS = 1.0
+MAX_PREPARED_FRAMES = 3
+MAX_DISPLAY_JOBS = 20
+# Saturation the panel driver blends its palette with by default
+PANEL_SATURATION = 0.5
+# "floyd-steinberg" matches the panel driver exactly, "ordered" is a Bayer dither
+QUANTIZE_DITHER = "floyd-steinberg"
+FRAME_STORE_SLOTS = 8
+DEFAULT_SIMULATED_PANEL = "7.3"
+# Numbered frames the simulated panel keeps in its frame folder, besides latest.png
+SIMULATED_PANEL_KEPT_FRAMES = 20
+
+# Render cache constants
+DEFAULT_RENDER_CACHE_SIZE_MB = 64
+
+# Memory shared by every decode in flight, sized for a Pi Zero 2 W's 512 MB
+DEFAULT_MEMORY_BUDGET_MB = 128
+# Memory a frame render takes relative to the decoded source: the source plus the
+# box-reduced intermediate the resize makes, as no full-size copy is made
+RENDER_DECODE_COPIES = 1.25
+# Seconds a decode waits for the memory budget before failing
+MEMORY_BUDGET_WAIT_SECONDS = 120
 
 # Gallery constants
 DEFAULT_GALLERY_LIMIT = 24
+MAX_GALLERY_PAGE_SIZE = 200
+THUMBNAIL_SIZE = 256
+THUMBNAIL_WAIT_SECONDS = 10
 
 # Time constants (in seconds)
 SECONDS_PER_MINUTE = 60
@@ -55,6 +109,14 @@ ALLOWED_MIME_TYPES = {
     'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 
     'image/tiff', 'image/webp'
 }
+ALLOWED_IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "BMP", "TIFF", "WEBP")
+MAX_IMAGE_PIXELS = 8192 * 8192
+DEEP_VERIFY_UPLOADS = True
+# Uploads whose perceptual hash is within this many bits of an existing image are
+# treated as duplicates, None only rejects exact copies
+NEAR_DUPLICATE_DISTANCE = None
+UPLOAD_WORKERS = 2
+MAX_UPLOAD_JOBS = 20
 
 # Validation constants
 MIN_REFRESH_INTERVAL = 60  # 1 second
@@ -69,6 +131,14 @@ LOG_DATE_FORMAT = "%H:%M:%S"
 DEFAULT_HOST = "0.0.0.0"
 DEFAULT_PORT = 80
 
+# Frame server constants
+FRAME_SERVER_PORT = 8080
+FRAME_SERVER_THREADS = 8
+# Seconds a device waits for the frame server before rendering locally
+FRAME_SERVER_TIMEOUT_SECONDS = 5
+# Seconds a device renders locally after the frame server couldn't be reached, before trying it again
+FRAME_SERVER_RETRY_SECONDS = 300
+
 # Image enhancement settings
 DEFAULT_IMAGE_SETTINGS = {
     "brightness": DEFAULT_BRIGHTNESS,
@@ -0,0 +1,169 @@
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from PIL import Image
+from src.file_utils import write_json_atomic
+from src.image_utils import compute_dhash
+
+logger = logging.getLogger(__name__)
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+def compute_file_digest(file_path: str) -> str:
+    """Compute the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(DIGEST_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+def hash_image_file(file_path: str) -> Tuple[str, Optional[int]]:
+    """
+    Compute the content digest and perceptual hash of an image file.
+
+    Returns:
+        Tuple[str, Optional[int]]: SHA-256 hex digest and dHash, or None for the dHash if
+        the image can't be decoded
+    """
+    digest = compute_file_digest(file_path)
+    try:
+        with Image.open(file_path) as image:
+            return digest, compute_dhash(image)
+    except Exception as e:
+        logger.warning(f"Failed to compute perceptual hash of {file_path}: {e}")
+        return digest, None
+
+class ContentIndex:
+    """
+    Persistent index of image contents used to find duplicate uploads.
+
+    Images are looked up by SHA-256 digest in O(1), and by perceptual hash for
+    near-duplicates. Perceptual hashes are split into bands so candidates only
+    have to be compared against images sharing at least one band, which finds
+    every match within fewer differing bits than there are bands.
+    """
+
+    HASH_BANDS = 4
+    HASH_BITS = 64
+
+    def __init__(self, index_file: str) -> None:
+        """
+        Initialize the index, loading any persisted state.
+
+        Args:
+            index_file: Path where the index is persisted between runs
+        """
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        # name -> (digest, dhash, size, mtime_ns)
+        self.entries: Dict[str, Tuple[str, Optional[int], int, int]] = {}
+        self.by_digest: Dict[str, List[str]] = {}
+        self.by_band: Dict[Tuple[int, int], Set[str]] = {}
+        self._load()
+
+    def find(self, digest: str) -> List[str]:
+        """Get the names of indexed images with the given content digest."""
+        with self.lock:
+            return list(self.by_digest.get(digest, ()))
+
+    def find_similar(self, dhash: int, max_distance: int) -> List[Tuple[str, int]]:
+        """
+        Get indexed images whose perceptual hash is within max_distance bits.
+
+        Args:
+            dhash: Perceptual hash to compare against
+            max_distance: Largest number of differing bits, below HASH_BANDS to find every match
+
+        Returns:
+            List[Tuple[str, int]]: (name, distance) pairs, closest first
+        """
+        with self.lock:
+            candidates = set()
+            for band in self._get_bands(dhash):
+                candidates.update(self.by_band.get(band, ()))
+            matches = []
+            for name in candidates:
+                distance = (self.entries[name][1] ^ dhash).bit_count()
+                if distance <= max_distance:
+                    matches.append((name, distance))
+        return sorted(matches, key=lambda match: match[1])
+
+    def get(self, name: str) -> Optional[Tuple[str, Optional[int], int, int]]:
+        """Get the (digest, dhash, size, mtime_ns) recorded for an image."""
+        with self.lock:
+            return self.entries.get(name)
+
+    def add(self, name: str, digest: str, dhash: Optional[int], size: int, mtime_ns: int) -> None:
+        """Record the contents of an image, replacing any previous entry for the name."""
+        with self.lock:
+            self._remove_locked(name)
+            self.entries[name] = (digest, dhash, size, mtime_ns)
+            self.by_digest.setdefault(digest, []).append(name)
+            if dhash is not None:
+                for band in self._get_bands(dhash):
+                    self.by_band.setdefault(band, set()).add(name)
+
+    def remove(self, name: str) -> None:
+        with self.lock:
+            self._remove_locked(name)
+
+    def get_stale(self, files: Dict[str, Tuple[int, int]]) -> Tuple[List[str], List[str]]:
+        """
+        Compare the index with the images currently in the library.
+
+        Args:
+            files: Mapping of image name to (size, mtime_ns)
+
+        Returns:
+            Tuple[List[str], List[str]]: Names that need hashing, and indexed names no longer present
+        """
+        with self.lock:
+            missing = [name for name, (size, mtime_ns) in files.items()
+                       if self.entries.get(name, (None, None, None, None))[2:] != (size, mtime_ns)]
+            gone = [name for name in self.entries if name not in files]
+        return missing, gone
+
+    def save(self) -> None:
+        with self.lock:
+            data = {"entries": [[name, *entry] for name, entry in self.entries.items()]}
+        try:
+            write_json_atomic(self.index_file, data)
+        except Exception as e:
+            logger.error(f"Failed to save content index {self.index_file}: {e}")
+
+    def _remove_locked(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        digest, dhash, _, _ = entry
+        names = self.by_digest.get(digest, [])
+        if name in names:
+            names.remove(name)
+        if not names:
+            self.by_digest.pop(digest, None)
+        if dhash is not None:
+            for band in self._get_bands(dhash):
+                band_names = self.by_band.get(band)
+                if band_names is not None:
+                    band_names.discard(name)
+                    if not band_names:
+                        del self.by_band[band]
+
+    def _get_bands(self, dhash: int) -> Iterable[Tuple[int, int]]:
+        band_bits = self.HASH_BITS // self.HASH_BANDS
+        mask = (1 << band_bits) - 1
+        return [(band, (dhash >> (band * band_bits)) & mask) for band in range(self.HASH_BANDS)]
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for name, digest, dhash, size, mtime_ns in data.get("entries", []):
+            self.add(name, digest, dhash, size, mtime_ns)
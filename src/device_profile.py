@@ -0,0 +1,85 @@
+import json
+import hashlib
+from typing import Any, Dict, NamedTuple, Tuple
+from src.config import Config
+from src.display_backend import PANEL_MODELS
+from src.constants import (
+    RESOLUTION_KEY, ORIENTATION_KEY, INVERTED_IMAGE_KEY, IMAGE_SETTINGS_KEY, FRAME_SERVER_PROFILES_KEY,
+    DEFAULT_SIMULATED_PANEL, DEFAULT_ORIENTATION, DEFAULT_IMAGE_SETTINGS, VALID_ORIENTATIONS
+)
+
+def settings_digest(resolution, orientation: str, inverted: bool, image_settings: Dict[str, Any]) -> str:
+    """
+    Digest of the settings a frame is rendered with, for a device and a frame server to check they agree.
+
+    Returns:
+        str: Hex digest, the same for equal settings whatever the types the numbers were stored as
+    """
+    image_settings = {key: float(value) if isinstance(value, (int, float)) else value
+                      for key, value in (image_settings or {}).items()}
+    payload = json.dumps([[int(value) for value in resolution], orientation, bool(inverted), image_settings],
+                         sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+class DeviceProfile(NamedTuple):
+    """Everything about a device that changes how its frames are rendered."""
+    name: str
+    panel: str
+    resolution: Tuple[int, int]
+    orientation: str
+    inverted: bool
+    image_settings: Dict[str, Any]
+
+    @classmethod
+    def from_dict(cls, name: str, settings: Dict[str, Any]) -> "DeviceProfile":
+        """
+        Build a profile from its entry in the configuration.
+
+        Args:
+            name: Name devices ask for the profile by
+            settings: "panel" (screen size, one of PANEL_MODELS) and the render settings
+                of device.json: orientation, inverted_image and image_settings
+
+        Raises:
+            ValueError: If the panel or orientation is not supported
+        """
+        panel = str(settings.get("panel", DEFAULT_SIMULATED_PANEL))
+        if panel not in PANEL_MODELS:
+            raise ValueError(f"Profile {name} has unsupported panel {panel}, expected one of {', '.join(PANEL_MODELS)}")
+        orientation = settings.get(ORIENTATION_KEY, DEFAULT_ORIENTATION)
+        if orientation not in VALID_ORIENTATIONS:
+            raise ValueError(f"Profile {name} has unsupported orientation {orientation}")
+        return cls(name, panel, PANEL_MODELS[panel].resolution, orientation,
+                   bool(settings.get(INVERTED_IMAGE_KEY, False)),
+                   dict(settings.get(IMAGE_SETTINGS_KEY, DEFAULT_IMAGE_SETTINGS) or {}))
+
+    def settings_digest(self) -> str:
+        return settings_digest(self.resolution, self.orientation, self.inverted, self.image_settings)
+
+    def apply(self, config: Config) -> None:
+        """Set the profile's render settings in a configuration, without saving them."""
+        config.set(RESOLUTION_KEY, list(self.resolution), save=False)
+        config.set(ORIENTATION_KEY, self.orientation, save=False)
+        config.set(INVERTED_IMAGE_KEY, self.inverted, save=False)
+        config.set(IMAGE_SETTINGS_KEY, dict(self.image_settings), save=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "panel": self.panel,
+            RESOLUTION_KEY: list(self.resolution),
+            ORIENTATION_KEY: self.orientation,
+            INVERTED_IMAGE_KEY: self.inverted,
+            IMAGE_SETTINGS_KEY: self.image_settings,
+            "settings_digest": self.settings_digest()
+        }
+
+def load_profiles(config: Config) -> Dict[str, DeviceProfile]:
+    """
+    Get the device profiles registered in the configuration.
+
+    Raises:
+        ValueError: If a profile is invalid
+    """
+    profiles = config.get(FRAME_SERVER_PROFILES_KEY) or {}
+    return {name: DeviceProfile.from_dict(name, settings) for name, settings in profiles.items()}
@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from PIL import Image
+from src.config import Config
+from src.image_utils import quantize_to_palette
+from src.constants import (
+    DISPLAY_BACKEND_KEY, SIMULATED_DISPLAY_KEY, DEFAULT_SIMULATED_PANEL, SIMULATED_PANEL_KEPT_FRAMES
+)
+
+logger = logging.getLogger(__name__)
+
+class DisplayBackend:
+    """
+    Panel that DisplayManager pushes frames to.
+
+    Backends take panel-sized frames through set_image the way the inky drivers
+    do: "P" mode frames are used as palette indices, anything else is quantized
+    to the panel palette first. show then updates the panel and blocks until it
+    is done.
+    """
+
+    width = 0
+    height = 0
+
+    def get_palette(self, saturation: float) -> Optional[List[int]]:
+        """Get the flat [r, g, b, ...] palette frames are quantized to, or None for panels without one."""
+        return None
+
+    def set_image(self, image: Image.Image) -> None:
+        raise NotImplementedError
+
+    def show(self) -> None:
+        raise NotImplementedError
+
+    def is_busy(self) -> bool:
+        return False
+
+class InkyBackend(DisplayBackend):
+    """Pimoroni Inky panel, detected from its EEPROM."""
+
+    def __init__(self, display=None) -> None:
+        if display is None:
+            # Imported here so machines without the panel libraries can run other backends
+            from inky.auto import auto
+            display = auto()
+        self.display = display
+        self.width = display.width
+        self.height = display.height
+        display.set_border(display.BLACK)
+
+    def get_palette(self, saturation: float) -> Optional[List[int]]:
+        palette_blend = getattr(self.display, "_palette_blend", None)
+        return palette_blend(saturation) if palette_blend is not None else None
+
+    def set_image(self, image: Image.Image) -> None:
+        self.display.set_image(image)
+
+    def show(self) -> None:
+        self.display.show()
+
+class PanelModel(NamedTuple):
+    resolution: Tuple[int, int]
+    saturated_palette: List[List[int]]
+    desaturated_palette: List[List[int]]
+    # Approximate time of a full refresh in seconds
+    refresh_seconds: float
+
+_ACEP_SATURATED = [[57, 48, 57], [255, 255, 255], [58, 91, 70], [61, 59, 94], [156, 72, 75],
+                   [208, 190, 71], [177, 106, 73], [255, 255, 255]]
+_ACEP_DESATURATED = [[0, 0, 0], [255, 255, 255], [0, 255, 0], [0, 0, 255], [255, 0, 0],
+                     [255, 255, 0], [255, 140, 0], [255, 255, 255]]
+_SPECTRA_SATURATED = [[0, 0, 0], [161, 164, 165], [208, 190, 71], [156, 72, 75], [61, 59, 94], [58, 91, 70]]
+_SPECTRA_DESATURATED = [[0, 0, 0], [255, 255, 255], [255, 255, 0], [255, 0, 0], [0, 0, 255], [0, 255, 0]]
+
+# Inky Impression models by screen size, with the palettes their drivers use
+PANEL_MODELS: Dict[str, PanelModel] = {
+    "4": PanelModel((640, 400), _ACEP_SATURATED, _ACEP_DESATURATED, 30.0),
+    "5.7": PanelModel((600, 448), _ACEP_SATURATED, _ACEP_DESATURATED, 30.0),
+    "7.3": PanelModel((800, 480), _SPECTRA_SATURATED, _SPECTRA_DESATURATED, 20.0),
+    "13.3": PanelModel((1600, 1200), _SPECTRA_SATURATED, _SPECTRA_DESATURATED, 30.0)
+}
+
+class SimulatedPanel(DisplayBackend):
+    """
+    Stand-in for an Inky Impression panel that needs no hardware.
+
+    Frames are checked and quantized like the real driver does, and show takes
+    as long as the real panel's refresh, scaled by time_scale, while is_busy
+    reports the panel as busy. Shown frames can be written to a folder to be
+    looked at, which keeps the latest and the last kept_frames numbered ones.
+    """
+
+    def __init__(self, model: str = DEFAULT_SIMULATED_PANEL, frame_folder: Optional[str] = None,
+                 time_scale: float = 1.0, saturation: float = 0.5,
+                 kept_frames: int = SIMULATED_PANEL_KEPT_FRAMES) -> None:
+        """
+        Initialize the simulated panel.
+
+        Args:
+            model: Screen size of the simulated model, one of PANEL_MODELS
+            frame_folder: Folder shown frames are written to, or None to keep them in memory only
+            time_scale: Factor applied to the refresh time, 0 to refresh instantly
+            saturation: Palette saturation used for frames the panel has to quantize itself
+            kept_frames: Number of numbered frames kept in frame_folder, 0 to only keep latest.png
+
+        Raises:
+            ValueError: If the model is not supported
+        """
+        if model not in PANEL_MODELS:
+            raise ValueError(f"Unsupported panel model {model}, expected one of {', '.join(PANEL_MODELS)}")
+        self.model = PANEL_MODELS[model]
+        self.width, self.height = self.model.resolution
+        self.frame_folder = frame_folder
+        self.time_scale = time_scale
+        self.saturation = saturation
+        self.kept_frames = kept_frames
+        self.buf = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.show_count = 0
+        self.busy = threading.Event()
+
+    def get_palette(self, saturation: float) -> Optional[List[int]]:
+        palette = []
+        for saturated, desaturated in zip(self.model.saturated_palette, self.model.desaturated_palette):
+            palette += [int(s * saturation + d * (1.0 - saturation)) for s, d in zip(saturated, desaturated)]
+        return palette
+
+    def set_image(self, image: Image.Image) -> None:
+        if image.size != (self.width, self.height):
+            raise ValueError(f"Image must be ({self.width}x{self.height}) pixels!")
+        if image.mode != "P":
+            image = quantize_to_palette(image, self.get_palette(self.saturation))
+        self.buf = np.array(image, dtype=np.uint8).reshape((self.height, self.width))
+
+    def show(self) -> None:
+        self.busy.set()
+        try:
+            time.sleep(self.model.refresh_seconds * self.time_scale)
+            self.show_count += 1
+            if self.frame_folder:
+                self._save_frame()
+        finally:
+            self.busy.clear()
+
+    def is_busy(self) -> bool:
+        return self.busy.is_set()
+
+    def get_frame(self) -> Image.Image:
+        """Get what the panel currently shows, in the panel's real colours."""
+        frame = Image.fromarray(self.buf)
+        frame.putpalette(self.get_palette(1.0) + [0, 0, 0] * (256 - len(self.model.saturated_palette)))
+        return frame.convert("RGB")
+
+    def _save_frame(self) -> None:
+        os.makedirs(self.frame_folder, exist_ok=True)
+        frame = self.get_frame()
+        if self.kept_frames > 0:
+            frame.save(self._get_frame_path(self.show_count))
+        frame.save(os.path.join(self.frame_folder, "latest.png"))
+        # A long-running panel would otherwise fill the disk
+        expired = self.show_count - self.kept_frames
+        if expired > 0:
+            try:
+                os.remove(self._get_frame_path(expired))
+            except FileNotFoundError:
+                pass
+
+    def _get_frame_path(self, number: int) -> str:
+        return os.path.join(self.frame_folder, f"frame_{number:05}.png")
+
+def create_display_backend(config: Config) -> DisplayBackend:
+    """
+    Create the display backend selected in the configuration.
+
+    Raises:
+        ValueError: If the configured backend is not supported
+    """
+    backend = config.get(DISPLAY_BACKEND_KEY) or "inky"
+    if backend == "inky":
+        return InkyBackend()
+    if backend == "simulated":
+        settings = config.get(SIMULATED_DISPLAY_KEY) or {}
+        logger.info(f"Using a simulated display: {settings}")
+        return SimulatedPanel(**settings)
+    raise ValueError(f"Unsupported display backend {backend}")
@@ -1,42 +1,308 @@
+import os
 import logging
-from src.image_utils import resize_image, change_orientation, apply_image_enhancement
+import threading
+from typing import Optional
+from src.image_utils import (
+    plan_transform, apply_transform, apply_image_enhancement, reduce_for_display, compute_image_hash,
+    quantize_to_palette
+)
 from PIL import Image
-from inky.auto import auto
 from src.config import Config
+from src.display_backend import DisplayBackend, create_display_backend
+from src.device_profile import settings_digest
+from src.render_cache import RenderCache
+from src.frame_store import FrameStore
+from src.memory_budget import MEMORY_BUDGET
+from src.metrics import PIPELINE_STAGE_SECONDS, CACHE_LOOKUPS, DISPLAY_UPDATES
 from src.constants import (
-    RESOLUTION_KEY, ORIENTATION_KEY, INVERTED_IMAGE_KEY, IMAGE_SETTINGS_KEY
+    RESOLUTION_KEY, ORIENTATION_KEY, INVERTED_IMAGE_KEY, IMAGE_SETTINGS_KEY,
+    RENDER_CACHE_SIZE_MB_KEY, DEFAULT_RENDER_CACHE_SIZE_MB, DEFAULT_RENDER_CACHE_FOLDER,
+    LAST_FRAME_FINGERPRINT_KEY, RENDER_SETTING_KEYS, PANEL_SATURATION, QUANTIZE_DITHER,
+    DEFAULT_FRAME_STORE_FILE, FRAME_STORE_SLOTS, RENDER_DECODE_COPIES, MEMORY_BUDGET_WAIT_SECONDS
 )
 
 logger = logging.getLogger(__name__)
 
 class DisplayManager:
 
-    def __init__(self, config: Config):
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, config: Config, backend: DisplayBackend = None, dither: str = QUANTIZE_DITHER,
+                 background: bool = False, frame_source=None):
+        """
+        Initialize the display manager.
+
+        Args:
+            config: Configuration holding the render settings
+            backend: Panel to show frames on, or None to create the one selected in the configuration
+            dither: Dither method frames are quantized to the panel palette with
+            background: Whether to detect and set up the panel on a background thread, so
+                the caller doesn't wait for it. Methods that need the panel wait until it is ready.
+            frame_source: RemoteFrameSource frames are pulled from before rendering them locally, or None
+        """
         self.config = config
-        self.initialize_display()
-    
+        self.dither = dither
+        self.frame_source = frame_source
+        self.inky_display = backend
+        self.palette = None
+        self.render_cache = None
+        self.frame_store = None
+        self.ready = threading.Event()
+        self.init_error: Optional[Exception] = None
+        self.init_lock = threading.Lock()
+        config.subscribe(RENDER_SETTING_KEYS, self._render_settings_changed)
+        if background:
+            threading.Thread(target=self._initialize_in_background, name="display-init", daemon=True).start()
+        else:
+            self._initialize()
+
+    def _initialize(self):
+        # Detecting the panel can take seconds, so it runs without the lock settings changes take
+        try:
+            self.initialize_display()
+            palette = self._get_panel_palette()
+        except Exception as e:
+            with self.init_lock:
+                self.init_error = e
+                self.ready.set()
+            raise
+
+        # Settings changed before this point are read here, later ones invalidate the caches once ready
+        with self.init_lock:
+            try:
+                self.palette = palette
+                cache_size_mb = self.config.get(RENDER_CACHE_SIZE_MB_KEY, DEFAULT_RENDER_CACHE_SIZE_MB)
+                self.render_cache = RenderCache(os.path.join(self.BASE_DIR, DEFAULT_RENDER_CACHE_FOLDER),
+                                                int(cache_size_mb * 1024 * 1024))
+                self._update_caches()
+            except Exception as e:
+                self.init_error = e
+                raise
+            finally:
+                self.ready.set()
+
+    def _initialize_in_background(self):
+        try:
+            self._initialize()
+            logger.info("Display ready")
+        except Exception as e:
+            logger.exception(f"Failed to initialize display: {e}")
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait until the panel has been set up.
+
+        Raises:
+            TimeoutError: If the panel isn't ready within the timeout
+            RuntimeError: If setting up the panel failed
+        """
+        if not self.ready.wait(timeout):
+            raise TimeoutError("Display is still initializing")
+        if self.init_error is not None:
+            raise RuntimeError(f"Display failed to initialize: {self.init_error}") from self.init_error
+
     def initialize_display(self):
-        self.inky_display = auto()
-        self.inky_display.set_border(self.inky_display.BLACK)
-        logger.info(f"Inky display initialized: {self.inky_display.width}x{self.inky_display.height}")
+        if self.inky_display is None:
+            self.inky_display = create_display_backend(self.config)
+        logger.info(f"Display initialized: {self.inky_display.width}x{self.inky_display.height}")
         if not self.config.get(RESOLUTION_KEY):
             self.config.set(RESOLUTION_KEY, [int(self.inky_display.width), int(self.inky_display.height)])
 
-    def display_image(self, image: Image.Image, image_settings=[]):
+    def display_image(self, image: Image.Image, image_settings=[], force: bool = False) -> bool:
         logger.info("Displaying image to Inky display.")
         if not image:
             raise ValueError(f"No image provided.")
-        
+
+        try:
+            image = self.render_frame(image, image_settings)
+        except Exception as e:
+            logger.error(f"Failed to display image: {e}")
+            raise
+
+        return self.show_frame(image, force=force)
+
+    def show_frame(self, frame: Image.Image, force: bool = False) -> bool:
+        """
+        Push an already rendered frame to the display.
+
+        Args:
+            frame: Panel-sized frame to show
+            force: Refresh the panel even if it already shows this frame
+
+        Returns:
+            bool: True if the panel was refreshed, False if the frame was unchanged
+        """
+        self.wait_until_ready()
+        with PIPELINE_STAGE_SECONDS.labels("fingerprint").time():
+            fingerprint = compute_image_hash(frame)
+        if not force and fingerprint == self.config.get(LAST_FRAME_FINGERPRINT_KEY):
+            logger.info("Frame unchanged since last refresh, skipping display update.")
+            DISPLAY_UPDATES.labels("skipped").inc()
+            return False
+
         try:
-            image = change_orientation(image, self.config.get(ORIENTATION_KEY))
-            image = resize_image(image, self.config.get(RESOLUTION_KEY), image_settings)
-            if self.config.get(INVERTED_IMAGE_KEY, False): 
-                image = image.rotate(180)
-            image = apply_image_enhancement(image, self.config.get(IMAGE_SETTINGS_KEY))
-
-            self.inky_display.set_image(image)
-            self.inky_display.show()
+            with PIPELINE_STAGE_SECONDS.labels("set_image").time():
+                self.inky_display.set_image(frame)
+            with PIPELINE_STAGE_SECONDS.labels("show").time():
+                self.inky_display.show()
             logger.info("Image displayed successfully")
         except Exception as e:
             logger.error(f"Failed to display image: {e}")
+            DISPLAY_UPDATES.labels("failed").inc()
             raise
+
+        DISPLAY_UPDATES.labels("shown").inc()
+
+        self.config.set(LAST_FRAME_FINGERPRINT_KEY, fingerprint)
+        return True
+
+    def render_frame(self, image: Image.Image, image_settings=[]) -> Image.Image:
+        """
+        Produce the panel-sized frame for an image, reusing the render cache when possible.
+
+        If the panel has a colour palette, the frame is already quantized to it,
+        so the driver doesn't have to dither it again when it is shown.
+
+        Args:
+            image: Source image, ideally opened from a file so it can be cached
+            image_settings: Resize options such as "keep-width"
+
+        Returns:
+            Image.Image: Frame ready to be pushed to the display
+        """
+        render_settings = self.get_render_settings()
+
+        cache_key = None
+        source_path = getattr(image, "filename", None)
+        if source_path:
+            if self.frame_source is not None and not image_settings:
+                frame = self._pull_frame(source_path, render_settings)
+                if frame is not None:
+                    return frame
+            cache_key = self._make_cache_key(source_path, render_settings, image_settings)
+            if cache_key:
+                if self.frame_store is not None:
+                    with PIPELINE_STAGE_SECONDS.labels("frame_store").time():
+                        frame = self.frame_store.get(cache_key, self.palette)
+                    CACHE_LOOKUPS.labels("frame_store", "miss" if frame is None else "hit").inc()
+                    if frame is not None:
+                        logger.info(f"Frame store hit for {os.path.basename(source_path)}")
+                        return frame
+                with PIPELINE_STAGE_SECONDS.labels("render_cache").time():
+                    frame = self.render_cache.get(cache_key)
+                CACHE_LOOKUPS.labels("render_cache", "miss" if frame is None else "hit").inc()
+                if frame is not None:
+                    logger.info(f"Render cache hit for {os.path.basename(source_path)}")
+                    self._store_frame(cache_key, frame)
+                    return frame
+
+        image = self._reduce_and_render(image, render_settings, image_settings)
+
+        if cache_key:
+            with PIPELINE_STAGE_SECONDS.labels("cache_store").time():
+                self.render_cache.put(cache_key, image)
+                self._store_frame(cache_key, image)
+        return image
+
+    def render_uncached(self, image: Image.Image, image_settings=[]) -> Image.Image:
+        """Render the frame for an image without looking it up in or adding it to the caches."""
+        return self._reduce_and_render(image, self.get_render_settings(), image_settings)
+
+    def _reduce_and_render(self, image: Image.Image, render_settings: dict, image_settings) -> Image.Image:
+        image = reduce_for_display(image, render_settings[RESOLUTION_KEY], render_settings[ORIENTATION_KEY])
+        # The source is decoded and processed at full size, which can dwarf the frame, so it is admitted first
+        with MEMORY_BUDGET.reserve_image(image, RENDER_DECODE_COPIES, MEMORY_BUDGET_WAIT_SECONDS):
+            return self._render(image, render_settings, image_settings)
+
+    def get_cache_key(self, source_path: str, image_settings=[]) -> Optional[str]:
+        """
+        Get the key the frame for a source file is cached under with the current settings.
+
+        Returns:
+            Optional[str]: Key that changes whenever the file or a render setting does, or None
+            if the file can't be read
+        """
+        return self._make_cache_key(source_path, self.get_render_settings(), image_settings)
+
+    @staticmethod
+    def _make_cache_key(source_path: str, render_settings: dict, image_settings) -> Optional[str]:
+        return RenderCache.make_key(source_path, render_settings[RESOLUTION_KEY], render_settings[ORIENTATION_KEY],
+                                    render_settings[INVERTED_IMAGE_KEY], render_settings[IMAGE_SETTINGS_KEY],
+                                    image_settings)
+
+    def _pull_frame(self, source_path: str, render_settings: dict) -> Optional[Image.Image]:
+        """Get the frame for a source file from the frame server, or None to render it locally."""
+        name = os.path.basename(source_path)
+        digest = settings_digest(render_settings[RESOLUTION_KEY], render_settings[ORIENTATION_KEY],
+                                 render_settings[INVERTED_IMAGE_KEY], render_settings[IMAGE_SETTINGS_KEY])
+        with PIPELINE_STAGE_SECONDS.labels("frame_server").time():
+            frame = self.frame_source.fetch(name, digest)
+        if frame is None:
+            return None
+
+        # The panel shows "P" frames as palette indices, so they must have been quantized to its palette
+        size = tuple(int(value) for value in render_settings[RESOLUTION_KEY])
+        if (frame.size != size or not self.palette or frame.mode != "P"
+                or frame.getpalette()[:len(self.palette)] != self.palette):
+            logger.warning(f"Frame server sent a frame for {name} that doesn't fit this panel, rendering it locally.")
+            return None
+        logger.info(f"Pulled frame for {name} from the frame server")
+        return frame
+
+    def _render(self, image: Image.Image, render_settings: dict, image_settings) -> Image.Image:
+        with PIPELINE_STAGE_SECONDS.labels("decode").time():
+            image.load()
+        with PIPELINE_STAGE_SECONDS.labels("transform").time():
+            plan = plan_transform(image.size, render_settings[RESOLUTION_KEY], render_settings[ORIENTATION_KEY],
+                                  render_settings[INVERTED_IMAGE_KEY], image_settings)
+            image = apply_transform(image, plan)
+        with PIPELINE_STAGE_SECONDS.labels("enhance").time():
+            image = apply_image_enhancement(image, render_settings[IMAGE_SETTINGS_KEY])
+        if self.palette:
+            with PIPELINE_STAGE_SECONDS.labels("quantize").time():
+                image = quantize_to_palette(image, self.palette, self.dither)
+        return image
+
+    def _store_frame(self, cache_key: str, frame: Image.Image) -> None:
+        if self.frame_store is not None:
+            self.frame_store.put(cache_key, frame)
+
+    def _render_settings_changed(self, key, old_value, new_value):
+        with self.init_lock:
+            # Before the panel is set up there is nothing to invalidate, setting it up reads the new value
+            if not self.ready.is_set() or self.init_error is not None:
+                return
+            logger.info(f"{key} changed, invalidating rendered frames.")
+            self._update_caches()
+
+    def _update_caches(self):
+        """Drop rendered frames made with other settings and size the frame store for the panel."""
+        render_settings = self._get_render_settings()
+        invalidated = self.render_cache.ensure_settings(render_settings)
+        if not self.palette:
+            return
+
+        width, height = (int(value) for value in render_settings[RESOLUTION_KEY])
+        if self.frame_store is None or self.frame_store.size != (width, height):
+            self.frame_store = FrameStore(os.path.join(self.BASE_DIR, DEFAULT_FRAME_STORE_FILE),
+                                          width, height, FRAME_STORE_SLOTS)
+        if invalidated:
+            self.frame_store.clear()
+
+    def _get_panel_palette(self):
+        """Get the colours the panel driver quantizes frames to, or None if it doesn't use a colour palette."""
+        return self.inky_display.get_palette(PANEL_SATURATION)
+
+    def get_render_settings(self) -> dict:
+        """Collect every configuration value that affects a rendered frame, once the panel is ready."""
+        self.wait_until_ready()
+        return self._get_render_settings()
+
+    def _get_render_settings(self) -> dict:
+        return {
+            RESOLUTION_KEY: self.config.get(RESOLUTION_KEY),
+            ORIENTATION_KEY: self.config.get(ORIENTATION_KEY),
+            INVERTED_IMAGE_KEY: bool(self.config.get(INVERTED_IMAGE_KEY, False)),
+            IMAGE_SETTINGS_KEY: self.config.get(IMAGE_SETTINGS_KEY) or {},
+            "quantization": [self.palette, self.dither] if self.palette else None
+        }
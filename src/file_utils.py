@@ -0,0 +1,57 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import IO, Any, Iterator, Optional
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb", fsync: bool = False) -> Iterator[IO]:
+    """
+    Open a file for writing so that readers see either the old or the new contents, never a mix.
+
+    The block writes to a temporary file next to the target, which is renamed over it
+    when the block completes and removed if it raises. Pillow images can be saved
+    straight into the yielded file with an explicit format.
+
+    Args:
+        path: File to write
+        mode: Mode the temporary file is opened with, "wb" or "w"
+        fsync: Whether to flush the file and its directory to disk before returning, so the
+            new contents survive a power cut
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def write_json_atomic(path: str, data: Any, indent: Optional[int] = None, fsync: bool = False) -> None:
+    """
+    Write JSON to a file atomically, see atomic_write.
+
+    Args:
+        path: File to write
+        data: JSON-serializable data
+        indent: Indentation passed to json.dump
+        fsync: Whether to flush the file and its directory to disk before returning
+    """
+    with atomic_write(path, "w", fsync) as f:
+        json.dump(data, f, indent=indent)
@@ -0,0 +1,149 @@
+"""
+Frame server: renders ready-to-show frames for a fleet of Pidash devices.
+
+    python -m src.frame_server [--host HOST] [--port PORT] [--threads N]
+
+The server shares the image library with the devices and renders every frame
+with the same pipeline a device would, for each device profile registered
+under "frame_server_profiles" in device.json. Devices set "frame_server_url"
+and "frame_server_profile" to pull their frames from it.
+"""
+import io
+import os
+import sys
+import logging
+import argparse
+from typing import Dict, Optional, Tuple
+from flask import Flask
+from PIL import Image
+from waitress import serve
+from src.blueprints import frames, metrics
+from src.config import Config
+from src.device_profile import DeviceProfile, load_profiles
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.image_manager import ImageManager
+from src.metrics import PIPELINE_STAGE_SECONDS
+from src.constants import (
+    FRAME_SERVER_KEY, LAST_FRAME_FINGERPRINT_KEY, DEFAULT_CONFIG_FILE, DEFAULT_FRAME_SERVER_FOLDER, DEFAULT_HOST,
+    FRAME_SERVER_PORT, FRAME_SERVER_THREADS, FRAME_SERVER_PROFILES_KEY, LOG_FORMAT, LOG_DATE_FORMAT
+)
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def create_profile_display_manager(profile: DeviceProfile, cache_dir: str) -> DisplayManager:
+    """
+    Create a display manager that renders frames the way a device with the profile would.
+
+    Its render cache and frame store are kept under cache_dir, laid out as a device
+    keeps them under its installation folder, and its configuration is never saved.
+    The panel is simulated, as only its palette is used.
+    """
+    config = Config()
+    config.config_file = os.path.join(cache_dir, DEFAULT_CONFIG_FILE)
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    profile.apply(config)
+    display_manager_class = type("ProfileDisplayManager", (DisplayManager,), {"BASE_DIR": cache_dir})
+    return display_manager_class(config, SimulatedPanel(profile.panel, time_scale=0))
+
+class FrameServer:
+    """
+    Renders frames of a library for registered device profiles.
+
+    Each profile has its own display manager, so its frames are rendered,
+    quantized and cached exactly as on a device with that profile. A frame's
+    ETag is its render cache key, which changes with the image file and with
+    every render setting, so devices can revalidate the frames they hold
+    without the server rendering anything.
+    """
+
+    def __init__(self, image_manager: ImageManager, profiles: Dict[str, DeviceProfile], cache_dir: str) -> None:
+        """
+        Initialize the frame server.
+
+        Args:
+            image_manager: Library the devices show
+            profiles: Device profiles by name
+            cache_dir: Directory where each profile's rendered frames are kept, in a folder per profile
+        """
+        self.image_manager = image_manager
+        self.profiles = profiles
+        self.display_managers = {name: create_profile_display_manager(profile, os.path.join(cache_dir, name))
+                                 for name, profile in profiles.items()}
+
+    def locate(self, profile_name: str, image_name: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the source of a frame without rendering it.
+
+        Args:
+            profile_name: Device profile the frame is rendered for
+            image_name: Filename of the image in the library
+
+        Returns:
+            Optional[Tuple[str, str]]: (source path, ETag), or None if the image isn't in the library
+
+        Raises:
+            KeyError: If the profile isn't registered
+        """
+        display_manager = self.display_managers[profile_name]
+        source_path = self.image_manager.get_image_path(image_name)
+        if source_path is None:
+            # It may have been added since the library was last looked at
+            self.image_manager.refresh_image_list()
+            source_path = self.image_manager.get_image_path(image_name)
+        if source_path is None:
+            return None
+
+        etag = display_manager.get_cache_key(source_path)
+        return (source_path, etag) if etag is not None else None
+
+    def render(self, profile_name: str, source_path: str) -> bytes:
+        """
+        Render a frame for a profile, or take it from the profile's caches.
+
+        Returns:
+            bytes: PNG of the palette-index frame, which is what the device's panel is sent
+
+        Raises:
+            KeyError: If the profile isn't registered
+        """
+        display_manager = self.display_managers[profile_name]
+        with Image.open(source_path) as image:
+            frame = display_manager.render_frame(image)
+        with PIPELINE_STAGE_SECONDS.labels("encode").time():
+            buffer = io.BytesIO()
+            frame.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+def create_frame_server_app(frame_server: FrameServer) -> Flask:
+    app = Flask(__name__)
+    app.config[FRAME_SERVER_KEY] = frame_server
+    app.register_blueprint(frames.bp)
+    app.register_blueprint(metrics.bp)
+    return app
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.frame_server",
+                                     description="Render frames for Pidash devices to pull.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=FRAME_SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=FRAME_SERVER_THREADS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    config = Config()
+    try:
+        profiles = load_profiles(config)
+    except ValueError as e:
+        parser.error(str(e))
+    if not profiles:
+        parser.error(f"No device profiles registered under {FRAME_SERVER_PROFILES_KEY} in {config.config_file}")
+
+    frame_server = FrameServer(ImageManager(config), profiles, os.path.join(ROOT_DIR, DEFAULT_FRAME_SERVER_FOLDER))
+    logger.info(f"Serving frames for {', '.join(profiles)} on port {args.port}")
+    serve(create_frame_server_app(frame_server), host=args.host, port=args.port, threads=args.threads)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
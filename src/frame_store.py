@@ -0,0 +1,146 @@
+import os
+import struct
+import logging
+import threading
+from typing import Dict, Optional
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class FrameStore:
+    """
+    Fixed number of palette-index frames kept in a single memory-mapped file.
+
+    The file starts with a header, then a table recording which key each slot
+    holds and when it was last used, then the slots' pixel data. Frames are
+    returned as views over the mapping rather than copies, so a frame handed
+    out stays valid until `slots` other frames have been stored. When the store
+    is full the least recently used slot is reused.
+    """
+
+    MAGIC = b"PDFRAME1"
+    HEADER = struct.Struct("<8sIII")
+    SLOT = struct.Struct("<40sQ")
+
+    def __init__(self, path: str, width: int, height: int, slots: int) -> None:
+        """
+        Open the store, creating or resetting the file if its layout doesn't match.
+
+        Args:
+            path: File backing the store
+            width: Frame width in pixels
+            height: Frame height in pixels
+            slots: Number of frames the store holds
+        """
+        self.path = path
+        self.size = (int(width), int(height))
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.keys: Dict[str, int] = {}
+        self.last_used = [0] * slots
+        self.clock = 0
+
+        table_size = self.HEADER.size + slots * self.SLOT.size
+        frame_bytes = self.size[0] * self.size[1]
+        file_size = table_size + slots * frame_bytes
+        self.mapping = self._open(file_size)
+        self.table = self.mapping[:table_size]
+        self.frames = self.mapping[table_size:].reshape(slots, self.size[1], self.size[0])
+        self._load_table()
+
+    def get(self, key: str, palette: list) -> Optional[Image.Image]:
+        """
+        Get a stored frame without copying its pixels.
+
+        Args:
+            key: Key the frame was stored under
+            palette: Flat palette to attach to the returned "P" image
+
+        Returns:
+            Optional[Image.Image]: Read-only view of the frame, or None on a miss
+        """
+        with self.lock:
+            slot = self.keys.get(key)
+            if slot is None:
+                return None
+            self._touch_locked(key, slot)
+
+        frame = Image.frombuffer("P", self.size, self.frames[slot], "raw", "P", 0, 1)
+        frame.putpalette(palette)
+        return frame
+
+    def put(self, key: str, frame: Image.Image) -> bool:
+        """
+        Store a "P" mode frame, replacing the least recently used one if the store is full.
+
+        Returns:
+            bool: False if the frame doesn't fit the store
+        """
+        if frame.mode != "P" or frame.size != self.size:
+            return False
+
+        with self.lock:
+            slot = self.keys.get(key)
+            if slot is None:
+                slot = min(range(self.slots), key=lambda index: self.last_used[index])
+                for old_key, old_slot in list(self.keys.items()):
+                    if old_slot == slot:
+                        del self.keys[old_key]
+            # The slot is unclaimed while its pixels are replaced, so a crash can't pair a key with a torn frame
+            self._write_slot_locked(slot, b"", 0)
+            self.frames[slot] = np.asarray(frame, dtype=np.uint8)
+            self.keys[key] = slot
+            self._touch_locked(key, slot)
+        return True
+
+    def clear(self) -> None:
+        """Forget every stored frame."""
+        with self.lock:
+            for slot in range(self.slots):
+                self._write_slot_locked(slot, b"", 0)
+            self.keys.clear()
+            self.last_used = [0] * self.slots
+
+    def close(self) -> None:
+        self.mapping.flush()
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.keys
+
+    def _touch_locked(self, key: str, slot: int) -> None:
+        self.clock += 1
+        self._write_slot_locked(slot, key.encode("ascii"), self.clock)
+
+    def _write_slot_locked(self, slot: int, key: bytes, last_used: int) -> None:
+        offset = self.HEADER.size + slot * self.SLOT.size
+        self.table[offset:offset + self.SLOT.size] = np.frombuffer(self.SLOT.pack(key, last_used), dtype=np.uint8)
+        self.last_used[slot] = last_used
+
+    def _load_table(self) -> None:
+        for slot in range(self.slots):
+            offset = self.HEADER.size + slot * self.SLOT.size
+            key, last_used = self.SLOT.unpack(self.table[offset:offset + self.SLOT.size].tobytes())
+            key = key.rstrip(b"\0").decode("ascii", errors="replace")
+            if key:
+                self.keys[key] = slot
+                self.last_used[slot] = last_used
+        self.clock = max(self.last_used, default=0)
+        logger.info(f"Frame store holds {len(self.keys)} of {self.slots} frames.")
+
+    def _open(self, file_size: int) -> np.memmap:
+        header = self.HEADER.pack(self.MAGIC, self.size[0], self.size[1], self.slots)
+        try:
+            if os.path.getsize(self.path) == file_size:
+                with open(self.path, "rb") as f:
+                    if f.read(self.HEADER.size) == header:
+                        return np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(file_size,))
+            logger.info(f"Frame store {self.path} has a different layout, resetting it.")
+        except OSError:
+            pass
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        mapping = np.memmap(self.path, dtype=np.uint8, mode="w+", shape=(file_size,))
+        mapping[:self.HEADER.size] = np.frombuffer(header, dtype=np.uint8)
+        return mapping
@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import struct
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from src.file_utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+class InotifyWatcher:
+    """
+    Minimal non-blocking inotify watch on a single directory (Linux only).
+
+    Events are drained on demand by read_events, so no background thread is needed.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, folder: str) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def read_events(self) -> Optional[List[Tuple[int, str]]]:
+        """
+        Drain pending events.
+
+        Returns:
+            Optional[List[Tuple[int, str]]]: (mask, filename) pairs, or None if events were
+            lost or the watch is gone and the caller must rescan
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            if not data:
+                return events
+
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+
+                if mask & (self.IN_Q_OVERFLOW | self.IN_IGNORED | self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    return None
+                if not mask & self.IN_ISDIR:
+                    events.append((mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+class ImageIndex:
+    """
+    Persistent index of the images in a folder that is updated incrementally.
+
+    On Linux, changes are picked up from inotify events. Elsewhere, or if the
+    watch fails, the directory mtime is compared and only a changed directory
+    is rescanned, applying the difference to the index. Callers that change
+    the folder themselves can report it with notify_added and notify_removed.
+    """
+
+    # 3: new images found by a scan are indexed in name order instead of directory order
+    INDEX_FORMAT = 3
+    # Changes kept for changes_since, readers further behind rebuild from names()
+    CHANGE_LOG_SIZE = 64
+    SORT_KEYS = {
+        "name": lambda item: item[0].lower(),
+        "size": lambda item: item[1][0],
+        "added": lambda item: item[1][2]
+    }
+
+    # Directory mtimes this close to the scan time may hide a later change within the same tick
+    RACY_MTIME_NS = 2 * 1_000_000_000
+
+    def __init__(self, folder: str, extensions: Iterable[str], index_file: str, use_inotify: bool = True) -> None:
+        """
+        Initialize the index, loading any persisted state.
+
+        Args:
+            folder: Folder containing the images
+            extensions: Lower-case file extensions to include
+            index_file: Path where the index is persisted between runs
+            use_inotify: Whether to try watching the folder with inotify
+        """
+        self.folder = folder
+        self.extensions = tuple(extensions)
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.entries: Dict[str, Tuple[int, int, int]] = {}
+        self.sorted_views: Dict[Tuple[str, bool], Tuple[int, List[str]]] = {}
+        self.dir_mtime_ns: Optional[int] = None
+        self.version = 0
+        self.changes: Deque[Tuple[int, Tuple[str, ...], Tuple[str, ...]]] = deque(maxlen=self.CHANGE_LOG_SIZE)
+        self.use_inotify = use_inotify
+        self.watcher: Optional[InotifyWatcher] = None
+        self.watch_verified = False
+        self._load()
+
+    def is_supported(self, name: str) -> bool:
+        return name.lower().endswith(self.extensions)
+
+    def names(self) -> List[str]:
+        """Get the indexed image filenames in index order."""
+        with self.lock:
+            return list(self.entries)
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[Tuple[str, ...], Tuple[str, ...]]]]:
+        """
+        Get the images added and removed since a version of the index, in the order it changed.
+
+        Args:
+            version: Version the caller is up to date with
+
+        Returns:
+            Optional[List[Tuple[Tuple[str, ...], Tuple[str, ...]]]]: (added, removed) names per change,
+            or None if the changes are no longer recorded and the caller must start over from names()
+        """
+        with self.lock:
+            if version == self.version:
+                return []
+            changes = [change for change in self.changes if change[0] > version]
+            if not changes or changes[0][0] != version + 1:
+                return None
+            return [(added, removed) for _, added, removed in changes]
+
+    def stat(self, name: str) -> Optional[Tuple[int, int, int]]:
+        """Get the (size, mtime_ns, ctime_ns) recorded for an image."""
+        with self.lock:
+            return self.entries.get(name)
+
+    def sorted_names(self, sort_key: str, descending: bool = False) -> List[str]:
+        """
+        Get the indexed image filenames sorted by name, size or added time.
+
+        Sorted views are cached until the index changes, so repeated calls are O(1).
+
+        Raises:
+            ValueError: If the sort key is not supported
+        """
+        if sort_key not in self.SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort_key}")
+
+        view_key = (sort_key, descending)
+        with self.lock:
+            version = self.version
+            cached = self.sorted_views.get(view_key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            items = list(self.entries.items())
+
+        items.sort(key=self.SORT_KEYS[sort_key], reverse=descending)
+        names = [name for name, _ in items]
+        with self.lock:
+            self.sorted_views[view_key] = (version, names)
+        return names
+
+    def refresh(self) -> bool:
+        """
+        Bring the index up to date with the folder.
+
+        Returns:
+            bool: True if the set of indexed images changed
+        """
+        with self.refresh_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        if not os.path.isdir(self.folder):
+            self.close()
+            with self.lock:
+                removed = list(self.entries)
+                self.entries.clear()
+                self.dir_mtime_ns = None
+            if removed:
+                self._changed(removed=removed)
+            return bool(removed)
+
+        if self.watcher is None and self.use_inotify:
+            self._start_watcher()
+
+        if self.watcher is not None and self.watch_verified:
+            events = self.watcher.read_events()
+            if events is not None:
+                return self._apply_events(events)
+            logger.warning(f"Lost inotify events for {self.folder}, rescanning.")
+            self.close()
+
+        try:
+            dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Failed to stat image folder {self.folder}: {e}")
+            return False
+
+        # The watch predates this check, so any later change will arrive as an event
+        self.watch_verified = self.watcher is not None
+        if dir_mtime_ns == self.dir_mtime_ns:
+            return False
+        return self._rescan(dir_mtime_ns)
+
+    def notify_added(self, name: str) -> None:
+        """Record an image that was written to the folder by this process."""
+        self.notify_added_many([name])
+
+    def notify_added_many(self, names: Iterable[str]) -> None:
+        """Record several images written to the folder by this process as a single index update."""
+        entries = {}
+        for name in names:
+            entry = self._stat_entry(name)
+            if entry is not None:
+                entries[name] = entry
+        if not entries:
+            return
+        with self.lock:
+            added = [name for name in entries if name not in self.entries]
+            self.entries.update(entries)
+            self._adopt_dir_mtime_locked()
+        self._changed(added=added)
+
+    def notify_removed(self, name: str) -> None:
+        """Record an image that was deleted from the folder by this process."""
+        self.notify_removed_many([name])
+
+    def notify_removed_many(self, names: Iterable[str]) -> None:
+        """Record several images deleted from the folder by this process as a single index update."""
+        with self.lock:
+            removed = [name for name in names if self.entries.pop(name, None) is not None]
+            self._adopt_dir_mtime_locked()
+        if removed:
+            self._changed(removed=removed)
+
+    def close(self) -> None:
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        self.watch_verified = False
+
+    def _apply_events(self, events: List[Tuple[int, str]]) -> bool:
+        changed = False
+        # Net effect of the batch, a file deleted and written again is neither added nor removed
+        added: Dict[str, None] = {}
+        removed: Dict[str, None] = {}
+        for mask, name in events:
+            if not self.is_supported(name):
+                continue
+            if mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM):
+                with self.lock:
+                    if self.entries.pop(name, None) is None:
+                        continue
+                changed = True
+                if name in added:
+                    del added[name]
+                else:
+                    removed[name] = None
+            else:
+                entry = self._stat_entry(name)
+                if entry is None:
+                    continue
+                with self.lock:
+                    previous = self.entries.get(name)
+                    self.entries[name] = entry
+                changed = changed or previous != entry
+                if previous is None:
+                    if name in removed:
+                        del removed[name]
+                    else:
+                        added[name] = None
+
+        if changed:
+            logger.debug(f"Applied {len(events)} inotify events to index of {self.folder}.")
+            self._changed(added=list(added), removed=list(removed))
+        return changed
+
+    def _rescan(self, dir_mtime_ns: int) -> bool:
+        scanned = {}
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if self.is_supported(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    scanned[entry.name] = (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+        with self.lock:
+            removed = [name for name in self.entries if name not in scanned]
+            # Directory order depends on the filesystem, name order is the same everywhere
+            added = sorted((name for name in scanned if name not in self.entries), key=lambda name: (name.lower(), name))
+            modified = [name for name in scanned if name in self.entries and self.entries[name] != scanned[name]]
+            for name in removed:
+                del self.entries[name]
+            for name in added + modified:
+                self.entries[name] = scanned[name]
+
+            # Leave the mtime unrecorded if it's too recent to rule out a missed change
+            racy = time.time_ns() - dir_mtime_ns < self.RACY_MTIME_NS
+            self.dir_mtime_ns = None if racy else dir_mtime_ns
+
+        changed = bool(removed or added or modified)
+        logger.info(f"Scanned {self.folder}: {len(added)} added, {len(removed)} removed, "
+                    f"{len(modified)} modified, {len(scanned)} total.")
+        if changed:
+            self._changed(added=added, removed=removed)
+        elif not racy:
+            self._save()
+        return changed
+
+    def _adopt_dir_mtime_locked(self) -> None:
+        # Our own change bumped the directory mtime, keep the index in sync without a rescan
+        if self.watcher is not None or self.dir_mtime_ns is None:
+            return
+        try:
+            self.dir_mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            self.dir_mtime_ns = None
+
+    def _stat_entry(self, name: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns
+
+    def _start_watcher(self) -> None:
+        if not os.path.isdir(self.folder):
+            return
+        try:
+            self.watcher = InotifyWatcher(self.folder)
+            self.watch_verified = False
+        except (OSError, AttributeError) as e:
+            logger.debug(f"inotify unavailable for {self.folder}, using mtime polling: {e}")
+            self.watcher = None
+
+    def _changed(self, added: Iterable[str] = (), removed: Iterable[str] = ()) -> None:
+        with self.lock:
+            self.version += 1
+            self.changes.append((self.version, tuple(added), tuple(removed)))
+        self._save()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if data.get("folder") != self.folder or data.get("format") != self.INDEX_FORMAT:
+            return
+        self.dir_mtime_ns = data.get("dir_mtime_ns")
+        self.entries = {name: tuple(entry) for name, *entry in data.get("entries", [])}
+
+    def _save(self) -> None:
+        with self.lock:
+            data = {
+                "format": self.INDEX_FORMAT,
+                "folder": self.folder,
+                "dir_mtime_ns": self.dir_mtime_ns,
+                "entries": [[name, *entry] for name, entry in self.entries.items()]
+            }
+        try:
+            write_json_atomic(self.index_file, data)
+        except Exception as e:
+            logger.error(f"Failed to save image index {self.index_file}: {e}")
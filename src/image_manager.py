@@ -1,19 +1,43 @@
 import os
+import json
+import hashlib
 import logging
 import shutil
-from typing import List, Optional
-from PIL import Image, ImageDraw, ImageFont
-from src.constants import SUPPORTED_IMAGE_EXTENSIONS, IMAGE_FOLDER_KEY, CURRENT_IMAGE_INDEX_KEY, ORIENTATION_KEY, HOSTNAME_KEY, LOCAL_IP_KEY
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from PIL import Image
+from src.constants import (
+    SUPPORTED_IMAGE_EXTENSIONS, IMAGE_FOLDER_KEY, CURRENT_IMAGE_INDEX_KEY, CURRENT_IMAGE_KEY, ORIENTATION_KEY,
+    HOSTNAME_KEY, LOCAL_IP_KEY, DEFAULT_IMAGE_INDEX_FOLDER
+)
 from src.config import Config
+from src.image_index import ImageIndex
+from src.content_index import ContentIndex
+from src.file_utils import atomic_write
+from src.playlist import Playlist
+from src.metrics import LIBRARY_SCAN_SECONDS, LIBRARY_IMAGES
 
 logger = logging.getLogger(__name__)
 
+class LibrarySnapshot(NamedTuple):
+    """The playlist and the position of the current image in it, published together."""
+    playlist: Playlist
+    current_index: int
+    version: Optional[int]
+
 class ImageManager:
     """
     Manages image files for the PiDash display.
     
     Handles loading, organizing, and providing access to image files.
     Supports various image formats and provides methods for navigation.
+
+    The playlist and current position are published together as a LibrarySnapshot
+    that is swapped in whole. Readers take the current snapshot once and never
+    lock. Changes to the library are applied to the playlist in place, which
+    leaves the position a reader holds pointing at the same image or at a
+    tombstone it skips, and a compacted playlist comes with a new snapshot.
+    Writers are serialized by write_lock.
     """
 
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -28,12 +52,18 @@ class ImageManager:
         """
         self.config = config
         self.image_folder: str = os.path.abspath(os.path.join(self.BASE_DIR, config.get(IMAGE_FOLDER_KEY)))
-        self.current_index: int = config.get(CURRENT_IMAGE_INDEX_KEY)
-        self.image_files: List[str] = []
+        self.write_lock = threading.Lock()
+        self.snapshot = LibrarySnapshot(Playlist(self.image_folder), config.get(CURRENT_IMAGE_INDEX_KEY) or 0, None)
+        self.image_index = ImageIndex(self.image_folder, self.image_extensions, self._get_index_file())
+        self.content_index = ContentIndex(self._get_index_file(".content"))
         hostname = config.get(HOSTNAME_KEY)
         self.default_image_landscape_path, self.default_image_portrait_path = self.create_default_image(hostname, f"Visit: http://{hostname}")
         self.refresh_image_list()
 
+    @property
+    def current_index(self) -> int:
+        return self.snapshot.current_index
+
     def get_image_names(self) -> List[str]:
         """
         Get list of image filenames (without full paths).
@@ -41,8 +71,43 @@ class ImageManager:
         Returns:
             List[str]: List of image filenames
         """
-        return [os.path.basename(image_path) for image_path in self.image_files]
+        return list(self.snapshot.playlist.names())
     
+    def get_image_page(self, offset: int, limit: int, sort: Optional[str] = None,
+                       descending: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Get one page of image details without building the full name list.
+
+        Args:
+            offset: Position of the first image to return
+            limit: Maximum number of images to return
+            sort: "name", "size" or "added", or None for display order
+            descending: Whether to reverse the sort order
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: Image details for the page and the total image count
+
+        Raises:
+            ValueError: If the sort key is not supported
+        """
+        if sort is None:
+            playlist_names = self.snapshot.playlist.names()
+            names = playlist_names[offset:offset + limit]
+            total = len(playlist_names)
+        else:
+            sorted_names = self.image_index.sorted_names(sort, descending)
+            names = sorted_names[offset:offset + limit]
+            total = len(sorted_names)
+
+        page = []
+        for name in names:
+            entry = self.image_index.stat(name)
+            if entry is None:
+                continue
+            size, mtime_ns, ctime_ns = entry
+            page.append({"name": name, "size": size, "modified": mtime_ns / 1e9, "added": ctime_ns / 1e9})
+        return page, total
+
     def get_image_paths(self) -> List[str]:
         """
         Get list of image full paths.
@@ -50,8 +115,14 @@ class ImageManager:
         Returns:
             List[str]: List of image full paths
         """
-        return self.image_files
+        playlist = self.snapshot.playlist
+        return [playlist.path(name) for name in playlist.names()]
     
+    def get_image_path(self, image_name: str) -> Optional[str]:
+        """Get the path of an image in the library, or None if it isn't in it."""
+        playlist = self.snapshot.playlist
+        return playlist.path(image_name) if image_name in playlist else None
+
     def add_image(self, image_path: str, original_filename: str) -> bool:
         """
         Add an image to the image folder.
@@ -59,13 +130,37 @@ class ImageManager:
         Args:
             image_path: Path to the image file to add
         """
+        return self.add_images([(image_path, original_filename)])[0] is not None
+
+    def add_images(self, files: List[Tuple[str, str]], move: bool = False) -> List[Optional[str]]:
+        """
+        Add several images to the image folder with a single index update.
+
+        Args:
+            files: (source path, original filename) pairs to add
+            move: Whether to move the sources into the folder instead of copying them
+
+        Returns:
+            List[Optional[str]]: Name each image was stored under, or None if it couldn't be added
+        """
+        added_names = []
+        for image_path, original_filename in files:
+            added_names.append(self._store_image(image_path, original_filename, move))
+
+        stored = [name for name in added_names if name is not None]
+        if stored:
+            self.image_index.notify_added_many(stored)
+            self._sync_image_files()
+        return added_names
+
+    def _store_image(self, image_path: str, original_filename: str, move: bool) -> Optional[str]:
         if not os.path.exists(image_path):
             logger.error(f"Source image {image_path} doesn't exist.")
-            return False
+            return None
 
         if not any(original_filename.lower().endswith(ext) for ext in self.image_extensions):
             logger.error(f"File {image_path} is not a supported image format.")
-            return False
+            return None
         
         destination_name = original_filename
         destination_path = os.path.join(self.image_folder, destination_name)
@@ -80,22 +175,113 @@ class ImageManager:
             logger.info(f"File renamed to {destination_name} to avoid overwriting.")
         
         try:
-            shutil.copy2(image_path, destination_path)
+            if move:
+                shutil.move(image_path, destination_path)
+            else:
+                shutil.copy2(image_path, destination_path)
             logger.info(f"Successfully added {destination_name} to {self.image_folder}.")
-            self.refresh_image_list()
-            return True
+            return destination_name
         except Exception as e:
             logger.error(f"Failed to add image {image_path}: {str(e)}")
-            return False
+            return None
+
+    def find_duplicate(self, digest: str) -> Optional[str]:
+        """
+        Find an image in the library with exactly the given contents.
+
+        Args:
+            digest: SHA-256 hex digest of the contents
+
+        Returns:
+            Optional[str]: Name of the existing image, or None if there is none
+        """
+        for name in self.content_index.find(digest):
+            if self._is_content_current(name):
+                return name
+        return None
+
+    def find_similar(self, dhash: int, max_distance: int, exclude: Optional[str] = None) -> Optional[str]:
+        """Find the image in the library that looks most like a perceptual hash, if any is close enough."""
+        for name, _ in self.content_index.find_similar(dhash, max_distance):
+            if name != exclude and self._is_content_current(name):
+                return name
+        return None
+
+    def record_content(self, hashes: Dict[str, Tuple[str, Optional[int]]]) -> None:
+        """
+        Record the content hashes of images in the library.
+
+        Args:
+            hashes: Mapping of image name to (SHA-256 hex digest, perceptual hash or None)
+        """
+        for name, (digest, dhash) in hashes.items():
+            entry = self.image_index.stat(name)
+            if entry is not None:
+                size, mtime_ns, _ = entry
+                self.content_index.add(name, digest, dhash, size, mtime_ns)
+        self.content_index.save()
+
+    def get_unhashed_images(self) -> List[str]:
+        """Get the images whose content hashes are missing or out of date, forgetting deleted ones."""
+        files = {}
+        for name in self.image_index.names():
+            entry = self.image_index.stat(name)
+            if entry is not None:
+                files[name] = entry[:2]
+        missing, gone = self.content_index.get_stale(files)
+        for name in gone:
+            self.content_index.remove(name)
+        if gone:
+            self.content_index.save()
+        return missing
+
+    def _is_content_current(self, name: str) -> bool:
+        # Entries for files that were replaced or deleted outside the app are dropped
+        entry = self.image_index.stat(name)
+        content = self.content_index.get(name)
+        if entry is not None and content is not None and tuple(entry[:2]) == content[2:]:
+            return True
+        self.content_index.remove(name)
+        return False
 
     def remove_all_images(self) -> None:
         self.remove_images(self.get_image_names())
 
     def remove_image(self, image_path) -> bool:
+        return self.remove_images([image_path])[0]
+
+    def remove_images(self, image_paths) -> List[bool]:
+        """
+        Remove several images from the image folder with a single index update.
+
+        Args:
+            image_paths: Image names in the image folder, or full paths
+
+        Returns:
+            List[bool]: Whether each image was removed
+        """
         if not os.path.exists(self.image_folder):
             logger.warning(f"Image folder {self.image_folder} doesn't exist.")
-            return False
-        
+            return [False] * len(image_paths)
+
+        results = []
+        removed_names = []
+        for image_path in image_paths:
+            full_path = self._delete_image(image_path)
+            results.append(full_path is not None)
+            if full_path is not None and os.path.dirname(os.path.abspath(full_path)) == self.image_folder:
+                removed_names.append(os.path.basename(full_path))
+
+        if removed_names:
+            self.image_index.notify_removed_many(removed_names)
+            for name in removed_names:
+                self.content_index.remove(name)
+            self.content_index.save()
+        if any(results):
+            self._sync_image_files()
+        return results
+
+    def _delete_image(self, image_path: str) -> Optional[str]:
         if not os.path.dirname(image_path):
             full_path = os.path.join(self.image_folder, image_path)
         else:
@@ -103,73 +289,102 @@ class ImageManager:
         
         if not os.path.exists(full_path):
             logger.error(f"Image {full_path} doesn't exist.")
-            return False
+            return None
         
         if not any(full_path.lower().endswith(ext) for ext in self.image_extensions):
             logger.error(f"File {full_path} is not a supported image format.")
-            return False
+            return None
         
         try:
-            was_current_image = (full_path in self.image_files and 
-                               self.image_files.index(full_path) == self.current_index)
-            
             os.remove(full_path)
             logger.info(f"Successfully removed {os.path.basename(full_path)} from {self.image_folder}.")
-            
-            self.refresh_image_list()
-            
-            if was_current_image and self.image_files and self.current_index >= len(self.image_files):
-                self.current_index = 0
-            
-            return True
+            return full_path
         except Exception as e:
             logger.error(f"Failed to remove image {full_path}: {str(e)}")
-            return False
-
-    def remove_images(self, image_paths) -> None:
-        for imagePath in image_paths:
-            self.remove_image(imagePath)
+            return None
 
     def refresh_image_list(self) -> None:
-        """Refresh the list of available images and clear cache if needed."""
+        """Bring the list of available images up to date with the image folder."""
         if not os.path.exists(self.image_folder):
             logger.warning(f"Image folder {self.image_folder} doesn't exist. Creating it.")
             os.makedirs(self.image_folder, exist_ok=True)
             return
 
-        logger.info(f"Scanning folder: {self.image_folder}")
-        
-        self.image_files = []
+        with LIBRARY_SCAN_SECONDS.time():
+            self.image_index.refresh()
+            self._sync_image_files()
+        LIBRARY_IMAGES.set(len(self.snapshot.playlist))
 
-        for file in os.listdir(self.image_folder):
-            if any(file.lower().endswith(ext) for ext in self.image_extensions):
-                logger.info(f"Loaded {file}.")
-                self.image_files.append(os.path.join(self.image_folder, file))
-        
-        logger.info(f"Successfully loaded {len(self.image_files)} images.")
-        
-        if self.current_index >= len(self.image_files):
-            self.current_index = 0
+    def _sync_image_files(self) -> None:
+        """Bring the playlist up to date with the index if it changed since the last sync."""
+        with self.write_lock:
+            snapshot = self.snapshot
+            version = self.image_index.version
+            if version == snapshot.version:
+                return
+
+            playlist = snapshot.playlist
+            changes = None if snapshot.version is None else self.image_index.changes_since(snapshot.version)
+            if changes is None:
+                # First sync, or too far behind the index to catch up change by change
+                current_name = self.config.get(CURRENT_IMAGE_KEY) if snapshot.version is None else \
+                    playlist.name_at(snapshot.current_index)
+                playlist = Playlist(self.image_folder, self.image_index.names())
+                current_index = playlist.position(current_name) if current_name is not None else None
+                if current_index is None:
+                    current_index = playlist.resolve(snapshot.current_index) or 0
+            else:
+                # The published playlist is read without locks, so the changes go to a copy
+                playlist = playlist.copy()
+                for added, removed in changes:
+                    playlist.remove(removed)
+                    playlist.add(added)
+                # Keep the same image current if it survived the change, otherwise move on to the next one
+                current_index = playlist.resolve(snapshot.current_index) or 0
+                if playlist.needs_compaction():
+                    current_name = playlist.name_at(current_index)
+                    playlist = playlist.compacted()
+                    current_index = playlist.position(current_name) if current_name is not None else 0
+
+            self._publish(LibrarySnapshot(playlist, current_index, version))
+        logger.info(f"Successfully loaded {len(playlist)} images.")
+
+    def _publish(self, snapshot: LibrarySnapshot) -> None:
+        """Swap in a new snapshot and persist the current image if it moved. Called with write_lock held."""
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if snapshot.current_index != previous.current_index or snapshot.playlist is not previous.playlist:
+            self.config.set(CURRENT_IMAGE_INDEX_KEY, snapshot.current_index)
+            self.config.set(CURRENT_IMAGE_KEY, snapshot.playlist.name_at(snapshot.current_index))
+
+    def _get_index_file(self, suffix: str = "") -> str:
+        folder_hash = hashlib.sha1(self.image_folder.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.BASE_DIR, DEFAULT_IMAGE_INDEX_FOLDER, f"{folder_hash}{suffix}.json")
 
     def get_current_image_name(self) -> str:
-        if not self.image_files:
+        snapshot = self.snapshot
+        position = snapshot.playlist.resolve(snapshot.current_index)
+        if position is None:
             logger.warning(f"No images were found in {self.config.get(IMAGE_FOLDER_KEY)}.")
             return None
-        return os.path.basename(self.image_files[self.current_index])
+        return snapshot.playlist.name_at(position)
 
-    def set_current_image(self, image_name) -> None:
-        for i, img_name in enumerate(self.get_image_names()):
-            if image_name == img_name:
-                self.current_index = i
-                self.config.set(CURRENT_IMAGE_INDEX_KEY, i)
-                break
+    def set_current_image(self, image_name) -> bool:
+        with self.write_lock:
+            snapshot = self.snapshot
+            index = snapshot.playlist.position(image_name)
+            if index is None:
+                return False
+            self._publish(snapshot._replace(current_index=index))
+        return True
 
     def get_current_image(self) -> Image.Image:
-        if not self.image_files:
+        image_path = self.get_relative_image_path(0)
+        if image_path is None:
             logger.warning(f"No images were found in {self.config.get(IMAGE_FOLDER_KEY)}.")
             return self.get_default_image()
-        logger.info(f"Current image index: {self.image_files[self.current_index]}")
-        return Image.open(self.image_files[self.current_index])
+        logger.info(f"Current image index: {image_path}")
+        return Image.open(image_path)
 
     def get_next_image(self) -> Optional[Image.Image]:
         """
@@ -178,25 +393,7 @@ class ImageManager:
         Returns:
             Optional[Image.Image]: Next image or None if no images available
         """
-        default_image = self.get_default_image()
-        if not self.image_files:
-            logger.warning(f"No images were found in {self.config.get(IMAGE_FOLDER_KEY)}.")
-            return default_image
-        
-        try:
-            next_image_index = (self.current_index + 1) % len(self.image_files)
-            image_path = self.image_files[next_image_index]
-            
-            if not os.path.exists(image_path):
-                logger.error(f"Image file not found: {image_path}")
-                return default_image
-                
-            image = Image.open(image_path)
-            logger.info(f"Loaded image for display: {os.path.basename(image_path)} ({next_image_index + 1}/{len(self.image_files)})")
-            return image
-        except Exception as e:
-            logger.error(f"Error loading image {image_path}: {e}")
-            return default_image
+        return self._open_relative_image(1)
 
     def get_previous_image(self) -> Optional[Image.Image]:
         """
@@ -205,42 +402,69 @@ class ImageManager:
         Returns:
             Optional[Image.Image]: Previous image or None if no images available
         """
+        return self._open_relative_image(-1)
+
+    def _open_relative_image(self, offset: int) -> Optional[Image.Image]:
         default_image = self.get_default_image()
-        if not self.image_files:
+        image_path = self.get_relative_image_path(offset)
+        if image_path is None:
             logger.warning(f"No images were found in {self.config.get(IMAGE_FOLDER_KEY)}.")
             return default_image
         
         try:
-            previous_image_index = (self.current_index - 1) % len(self.image_files)
-            image_path = self.image_files[previous_image_index]
-            
             if not os.path.exists(image_path):
                 logger.error(f"Image file not found: {image_path}")
                 return default_image
                 
             image = Image.open(image_path)
-            logger.info(f"Loaded image for display: {os.path.basename(image_path)} ({previous_image_index + 1}/{len(self.image_files)})")
+            logger.info(f"Loaded image for display: {os.path.basename(image_path)}")
             return image
         except Exception as e:
             logger.error(f"Error loading image {image_path}: {e}")
             return default_image
 
+    def get_relative_image_path(self, offset: int) -> Optional[str]:
+        """
+        Get the path of the image at an offset from the current image without opening it.
+
+        Args:
+            offset: Number of positions to move from the current image (negative for previous)
+
+        Returns:
+            Optional[str]: Image path or None if no images available
+        """
+        snapshot = self.snapshot
+        position = snapshot.playlist.step(snapshot.current_index, offset)
+        if position is None:
+            return None
+        name = snapshot.playlist.name_at(position)
+        # None only if a writer removed the image since step found it
+        return None if name is None else snapshot.playlist.path(name)
+
     def get_default_image(self) -> Image.Image:
         return Image.open(self.default_image_landscape_path if self.config.get(ORIENTATION_KEY) == "landscape" else self.default_image_portrait_path)
 
     def update_image_index(self, increment: bool = True) -> None:
-        if increment:
-            self.current_index = (self.current_index + 1) % len(self.image_files)
-        else:
-            self.current_index = (self.current_index - 1) % len(self.image_files)
-        self.config.set(CURRENT_IMAGE_INDEX_KEY, self.current_index)
+        self.move_current_image(1 if increment else -1)
+
+    def move_current_image(self, offset: int) -> None:
+        """Move the current image by offset positions, wrapping around the library."""
+        with self.write_lock:
+            snapshot = self.snapshot
+            index = snapshot.playlist.step(snapshot.current_index, offset)
+            if index is None:
+                return
+            self._publish(snapshot._replace(current_index=index))
 
     def get_image_count(self) -> int:
-        return len(self.image_files)
-    
+        return len(self.snapshot.playlist)
+
     def create_default_image(self, main_text: str, sub_text: str, output_dir: str = None, base_filename: str = "default") -> tuple[str, str]:
         """
         Create both portrait and landscape versions of an image with centered text.
+
+        The files are named after a hash of their text and size, so an image drawn
+        by an earlier start is reused instead of being drawn and encoded again.
         
         Args:
             main_text: Text to display on the image
@@ -257,16 +481,37 @@ class ImageManager:
         landscape_size = (800, 400)
         portrait_size = (400, 800)
         
-        landscape_path = os.path.join(output_dir, f"{base_filename}_landscape.png")
-        portrait_path = os.path.join(output_dir, f"{base_filename}_portrait.png")
+        landscape_path = self._get_default_image_path(output_dir, f"{base_filename}_landscape", main_text, sub_text, landscape_size)
+        portrait_path = self._get_default_image_path(output_dir, f"{base_filename}_portrait", main_text, sub_text, portrait_size)
         
-        self._create_image(main_text, sub_text, landscape_size, landscape_path)
-        self._create_image(main_text, sub_text, portrait_size, portrait_path)
+        for path, size in ((landscape_path, landscape_size), (portrait_path, portrait_size)):
+            if not os.path.exists(path):
+                self._create_image(main_text, sub_text, size, path)
+                self._remove_stale_default_images(path)
         
         return landscape_path, portrait_path
 
+    def _get_default_image_path(self, output_dir: str, name: str, main_text: str, sub_text: str,
+                                size: tuple[int, int]) -> str:
+        key = hashlib.sha1(json.dumps([main_text, sub_text, size]).encode("utf-8")).hexdigest()[:12]
+        return os.path.join(output_dir, f"{name}-{key}.png")
+
+    def _remove_stale_default_images(self, path: str) -> None:
+        """Remove images drawn for other text or sizes, and the unhashed files older versions wrote."""
+        prefix = os.path.basename(path).rsplit("-", 1)[0]
+        output_dir = os.path.dirname(path)
+        for name in os.listdir(output_dir):
+            if name != os.path.basename(path) and (name.startswith(prefix + "-") or name == prefix + ".png"):
+                try:
+                    os.remove(os.path.join(output_dir, name))
+                except OSError as e:
+                    logger.warning(f"Failed to remove old default image {name}: {e}")
+
     def _create_image(self, main_text: str, sub_text: str, size: tuple[int, int], output_file: str) -> None:
         """Helper method to create a single image."""
+        # Only needed when an image isn't cached yet, so kept off the startup path
+        from PIL import ImageDraw, ImageFont
+
         width, height = size
         img = Image.new("RGB", size, color="white")
         draw = ImageDraw.Draw(img)
@@ -301,4 +546,5 @@ class ImageManager:
         draw.text((main_x, main_y), main_text, fill="black", font=main_font)
         draw.text((sub_x, sub_y), sub_text, fill="black", font=sub_font)
 
-        img.save(output_file)
\ No newline at end of file
+        with atomic_write(output_file) as f:
+            img.save(f, format="PNG")
\ No newline at end of file
@@ -1,9 +1,62 @@
-import hashlib
+import math
+import functools
+import struct
+import zlib
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
 from PIL import Image, ImageEnhance
 
+# Let Pillow box-reduce large sources before the final LANCZOS pass
+# once the source is at least this many times the target size.
+RESIZE_REDUCING_GAP = 3.0
+
+PALETTE_SIZE = 256
+# Rows dithered per step, bounds the temporary distance array
+ORDERED_DITHER_ROWS = 32
+BAYER_MATRIX = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+], dtype=np.float32)
+
 def compute_image_hash(image: Image.Image) -> str:
-    """Compute hash of image to detect changes."""
-    return hashlib.md5(image.tobytes()).hexdigest()
+    """
+    Compute a cheap fingerprint of an image's pixels to detect changes.
+
+    Uses CRC-32 rather than a cryptographic hash since it only needs to tell
+    apart frames rendered by this device.
+    """
+    return f"{image.mode}-{image.width}x{image.height}-{zlib.crc32(image.tobytes()):08x}"
+
+def compute_dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Compute a perceptual difference hash of an image.
+
+    Each bit records whether a pixel is brighter than its right neighbour in a
+    tiny greyscale copy, so re-encoded or resized copies of a photo hash to
+    values that differ in only a few bits.
+
+    Args:
+        image: Image to hash, opened lazily so JPEG sources can be decoded at reduced size
+        hash_size: Number of rows and comparisons per row, giving hash_size ** 2 bits
+
+    Returns:
+        int: The hash
+    """
+    image.draft("L", (hash_size * 4, hash_size * 4))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    dhash = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            dhash = (dhash << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return dhash
 
 def change_orientation(image: Image.Image, orientation: str, inverted=False):
     if orientation == "landscape":
@@ -18,20 +71,73 @@ def change_orientation(image: Image.Image, orientation: str, inverted=False):
 
     return image.rotate(angle, expand=1)
 
-def resize_image(image: Image.Image, desired_size: tuple, image_settings=[]) -> Image.Image:
-    img_width, img_height = image.size
-    desired_width, desired_height = desired_size
-    desired_width, desired_height = int(desired_width), int(desired_height)
+def get_decode_size(source_size: tuple, desired_size: tuple, orientation: str) -> tuple:
+    """
+    Compute the smallest source size that still covers the display after cropping.
+
+    Args:
+        source_size: (width, height) of the undecoded source image
+        desired_size: (width, height) of the display
+        orientation: Display orientation, portrait sources are rotated by 90 degrees
+
+    Returns:
+        tuple: Minimum (width, height) to decode, never larger than the source
+    """
+    img_width, img_height = source_size
+    desired_width, desired_height = int(desired_size[0]), int(desired_size[1])
+    if orientation == "portrait":
+        desired_width, desired_height = desired_height, desired_width
+
+    scale = max(desired_width / img_width, desired_height / img_height)
+    if scale >= 1:
+        return img_width, img_height
+    return min(img_width, math.ceil(img_width * scale)), min(img_height, math.ceil(img_height * scale))
+
+def reduce_for_display(image: Image.Image, desired_size: tuple, orientation: str) -> Image.Image:
+    """
+    Configure a lazily opened image to decode at reduced resolution where the format allows it.
+
+    JPEG sources use DCT scaling so only 1/2, 1/4 or 1/8 of the pixels are decoded.
+    Other formats are decoded as-is and shrunk by the resize's reducing gap.
+
+    Args:
+        image: Image returned by Image.open that has not been loaded yet
+        desired_size: (width, height) of the display
+        orientation: Display orientation
+
+    Returns:
+        Image.Image: The same image, with a reduced decode size if supported
+    """
+    decode_size = get_decode_size(image.size, desired_size, orientation)
+    if decode_size != image.size and image.format == "JPEG":
+        image.draft("RGB", decode_size)
+    return image
+
+def get_crop_box(image_size: tuple, desired_size: tuple, image_settings=[]) -> Tuple[int, int, int, int]:
+    """
+    Compute the region of an image that matches the display's aspect ratio.
+
+    Images are cropped around their centre, or from the left edge when too
+    wide and image_settings contains "keep-width".
+
+    Args:
+        image_size: (width, height) of the image, already in display orientation
+        desired_size: (width, height) of the display
+        image_settings: Resize options such as "keep-width"
+
+    Returns:
+        Tuple[int, int, int, int]: (left, upper, right, lower) of the region
+    """
+    img_width, img_height = image_size
+    desired_width, desired_height = int(desired_size[0]), int(desired_size[1])
 
     img_ratio = img_width / img_height
     desired_ratio = desired_width / desired_height
 
     keep_width = "keep-width" in image_settings
 
-    x_offset, y_offset = 0,0
-    new_width, new_height = img_width,img_height
-    # Step 1: Determine crop dimensions
-    desired_ratio = desired_width / desired_height
+    x_offset, y_offset = 0, 0
+    new_width, new_height = img_width, img_height
     if img_ratio > desired_ratio:
         # Image is wider than desired aspect ratio
         new_width = int(img_height * desired_ratio)
@@ -42,23 +148,226 @@ def resize_image(image: Image.Image, desired_size: tuple, image_settings=[]) ->
         new_height = int(img_width / desired_ratio)
         y_offset = (img_height - new_height) // 2
 
-    # Step 2: Crop the image
-    cropped_image = image.crop((x_offset, y_offset, x_offset + new_width, y_offset + new_height))
+    return x_offset, y_offset, x_offset + new_width, y_offset + new_height
+
+def resize_image(image: Image.Image, desired_size: tuple, image_settings=[]) -> Image.Image:
+    desired_width, desired_height = int(desired_size[0]), int(desired_size[1])
+
+    # Step 1: Crop the image to the display's aspect ratio
+    cropped_image = image.crop(get_crop_box(image.size, desired_size, image_settings))
+
+    # Step 2: Resize to the exact desired dimensions
+    return cropped_image.resize((desired_width, desired_height), Image.Resampling.LANCZOS,
+                                reducing_gap=RESIZE_REDUCING_GAP)
+
+class TransformPlan(NamedTuple):
+    """One resample of a source region, then a lossless transpose of the result."""
+    # Region of the source to resample, in source coordinates
+    box: Tuple[int, int, int, int]
+    # Size the region is resampled to, before the transpose
+    size: Tuple[int, int]
+    # Applied to the resampled frame, None if it is already upright
+    transpose: Optional[Image.Transpose]
+
+def plan_transform(source_size: tuple, desired_size: tuple, orientation: str, inverted: bool = False,
+                   image_settings=[]) -> TransformPlan:
+    """
+    Fold orientation, cropping, scaling and inversion into a single transform.
+
+    The chain this replaces rotates the full-size source, crops a copy of it,
+    resizes that and rotates the frame again when inverted. Instead, the crop
+    is mapped back onto the unrotated source so it can be resampled straight
+    to the panel size, and the rotations are combined into one transpose of
+    the panel-sized result. No full-size intermediate is allocated.
+
+    Args:
+        source_size: (width, height) of the source image as decoded
+        desired_size: (width, height) of the display
+        orientation: Display orientation, portrait sources are rotated by 90 degrees
+        inverted: Whether the frame is turned upside down
+        image_settings: Resize options such as "keep-width"
 
-    # Step 3: Resize to the exact desired dimensions
-    return cropped_image.resize((desired_width, desired_height), Image.Resampling.LANCZOS)
+    Returns:
+        TransformPlan: The transform to pass to apply_transform
+    """
+    width, height = source_size
+    desired_width, desired_height = int(desired_size[0]), int(desired_size[1])
+
+    if orientation == "portrait":
+        # Crop in the rotated image's coordinates, where the source is height x width
+        left, upper, right, lower = get_crop_box((height, width), desired_size, image_settings)
+        # ROTATE_90 moves source pixel (x, y) to (y, width - 1 - x)
+        box = (width - lower, left, width - upper, right)
+        size = (desired_height, desired_width)
+        transpose = Image.Transpose.ROTATE_270 if inverted else Image.Transpose.ROTATE_90
+    else:
+        box = get_crop_box(source_size, desired_size, image_settings)
+        size = (desired_width, desired_height)
+        transpose = Image.Transpose.ROTATE_180 if inverted else None
+
+    return TransformPlan(box, size, transpose)
+
+def apply_transform(image: Image.Image, plan: TransformPlan) -> Image.Image:
+    """
+    Apply a transform made by plan_transform.
+
+    For photographs the result matches rotating, cropping and resizing with
+    change_orientation and resize_image, then rotating by 180 degrees if
+    inverted, within 2 levels per channel. Portrait frames resample the two
+    axes in the other order, which rounds and clips LANCZOS overshoot slightly
+    differently, and the filter reads the pixels just outside the crop instead
+    of repeating its edge, so noisy images can differ by more at the borders.
+    """
+    frame = image.resize(plan.size, Image.Resampling.LANCZOS, box=plan.box, reducing_gap=RESIZE_REDUCING_GAP)
+    if plan.transpose is not None:
+        frame = frame.transpose(plan.transpose)
+    return frame
 
 def apply_image_enhancement(img: Image.Image, image_settings={}) -> Image.Image:
-    # Apply Brightness
-    img = ImageEnhance.Brightness(img).enhance(image_settings.get("brightness", 1.0))
+    """
+    Apply brightness, contrast, saturation and sharpness in as few passes as possible.
+
+    Brightness and contrast are folded into one per-channel lookup table and
+    saturation into one colour matrix conversion. Factors of 1.0 are skipped.
+    For RGB and L images with factors between 0 and 2 the result matches
+    chaining ImageEnhance.Brightness, Contrast, Color and Sharpness within
+    2 levels per channel, and brightness on its own is exact. Other modes
+    use that chain directly.
+
+    Args:
+        img: Image to enhance
+        image_settings: Enhancement factors keyed by brightness, contrast, saturation and sharpness
 
-    # Apply Contrast
-    img = ImageEnhance.Contrast(img).enhance(image_settings.get("contrast", 1.0))
+    Returns:
+        Image.Image: Enhanced image
+    """
+    brightness = float(image_settings.get("brightness", 1.0))
+    contrast = float(image_settings.get("contrast", 1.0))
+    saturation = float(image_settings.get("saturation", 1.0))
+    sharpness = float(image_settings.get("sharpness", 1.0))
+
+    if img.mode not in ("RGB", "L"):
+        return _apply_image_enhancement_chain(img, brightness, contrast, saturation, sharpness)
+
+    # Apply Brightness and Contrast
+    if brightness != 1.0 or contrast != 1.0:
+        mean = _estimate_contrast_mean(img, brightness) if contrast != 1.0 else 0
+        img = img.point(_get_tone_lut(brightness, contrast, mean) * len(img.getbands()))
 
     # Apply Saturation (Color)
-    img = ImageEnhance.Color(img).enhance(image_settings.get("saturation", 1.0))
+    if saturation != 1.0 and img.mode == "RGB":
+        img = img.convert("RGB", _get_saturation_matrix(saturation))
 
     # Apply Sharpness
-    img = ImageEnhance.Sharpness(img).enhance(image_settings.get("sharpness", 1.0))
+    if sharpness != 1.0:
+        img = ImageEnhance.Sharpness(img).enhance(sharpness)
 
     return img
+
+def _apply_image_enhancement_chain(img: Image.Image, brightness: float, contrast: float,
+                                   saturation: float, sharpness: float) -> Image.Image:
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    img = ImageEnhance.Contrast(img).enhance(contrast)
+    img = ImageEnhance.Color(img).enhance(saturation)
+    return ImageEnhance.Sharpness(img).enhance(sharpness)
+
+@functools.lru_cache(maxsize=1024)
+def _get_tone_lut(brightness: float, contrast: float, mean: int) -> tuple:
+    """
+    Build the combined brightness and contrast lookup table for one channel.
+
+    Arithmetic is rounded to float32 to reproduce Image.blend, which ImageEnhance uses.
+    """
+    brightness, contrast = _to_float32(brightness), _to_float32(contrast)
+    lut = []
+    for value in range(256):
+        value = _clip_channel(_to_float32(brightness * value))
+        lut.append(_clip_channel(_to_float32(mean + _to_float32(contrast * (value - mean)))))
+    return tuple(lut)
+
+@functools.lru_cache(maxsize=32)
+def _get_saturation_matrix(saturation: float) -> tuple:
+    """Build the RGB conversion matrix that blends each pixel with its luma."""
+    grey = 1.0 - saturation
+    r, g, b = 0.299 * grey, 0.587 * grey, 0.114 * grey
+    return (
+        r + saturation, g, b, 0,
+        r, g + saturation, b, 0,
+        r, g, b + saturation, 0
+    )
+
+def _estimate_contrast_mean(img: Image.Image, brightness: float) -> int:
+    """
+    Estimate the mean luma ImageEnhance.Contrast would use after brightening.
+
+    Works from the channel histograms instead of converting the brightened image to L.
+    """
+    histogram = img.histogram()
+    brightness_lut = _get_tone_lut(brightness, 1.0, 0)
+    pixel_count = img.width * img.height
+    channel_means = []
+    for band in range(len(img.getbands())):
+        band_histogram = histogram[band * 256:(band + 1) * 256]
+        channel_means.append(sum(count * brightness_lut[value] for value, count in enumerate(band_histogram)) / pixel_count)
+
+    if len(channel_means) == 1:
+        return int(channel_means[0] + 0.5)
+    red, green, blue = channel_means
+    return int(0.299 * red + 0.587 * green + 0.114 * blue + 0.5)
+
+def _to_float32(value: float) -> float:
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+def _clip_channel(value: float) -> int:
+    if value <= 0.0:
+        return 0
+    if value >= 255.0:
+        return 255
+    return int(value)
+
+def quantize_to_palette(image: Image.Image, palette: list, dither: str = "floyd-steinberg",
+                        spread: float = 64.0) -> Image.Image:
+    """
+    Map a frame to the panel's palette so the driver can show it without dithering.
+
+    With "floyd-steinberg" the result is exactly what the panel driver's
+    set_image produces for an RGB frame, including its zero-padded palette.
+
+    Args:
+        image: Panel-sized frame
+        palette: Flat [r, g, b, ...] list of the panel colours
+        dither: "floyd-steinberg" or "ordered"
+        spread: Strength of the ordered dither pattern in colour levels
+
+    Returns:
+        Image.Image: "P" mode frame whose pixel values are palette indices
+
+    Raises:
+        ValueError: If the dither method is not supported
+    """
+    padded_palette = palette + [0, 0, 0] * (PALETTE_SIZE - len(palette) // 3)
+    image = image.convert("RGB")
+
+    if dither == "floyd-steinberg":
+        palette_image = Image.new("P", (1, 1))
+        palette_image.putpalette(padded_palette)
+        return image.quantize(palette=palette_image, dither=Image.Dither.FLOYDSTEINBERG)
+    if dither != "ordered":
+        raise ValueError(f"Unsupported dither method {dither}")
+
+    colors = np.array(palette, dtype=np.float32).reshape(-1, 3)
+    pixels = np.asarray(image, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    threshold = ((BAYER_MATRIX + 0.5) / BAYER_MATRIX.size - 0.5) * spread
+    threshold = np.tile(threshold, (math.ceil(height / 8), math.ceil(width / 8)))[:height, :width, None]
+
+    indices = np.empty((height, width), dtype=np.uint8)
+    for row in range(0, height, ORDERED_DITHER_ROWS):
+        block = pixels[row:row + ORDERED_DITHER_ROWS] + threshold[row:row + ORDERED_DITHER_ROWS]
+        distances = np.square(block[:, :, None, :] - colors).sum(axis=3)
+        indices[row:row + ORDERED_DITHER_ROWS] = distances.argmin(axis=2)
+
+    # putpalette turns the "L" image into a "P" image over the same indices
+    frame = Image.fromarray(indices)
+    frame.putpalette(padded_palette)
+    return frame
@@ -0,0 +1,185 @@
+import time
+import logging
+import resource
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, Optional, Tuple
+from PIL import Image
+from src.constants import DEFAULT_MEMORY_BUDGET_MB
+from src.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Pillow keeps 3 channel images in 4 bytes per pixel
+_BYTES_PER_PIXEL = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2, "LA": 4, "PA": 4, "La": 4}
+
+def estimate_image_bytes(size: Tuple[int, int], mode: str, copies: float = 1.0) -> int:
+    """
+    Estimate the memory a decoded image takes.
+
+    Args:
+        size: (width, height) the image decodes to
+        mode: Pillow mode it decodes to
+        copies: Number of full-size copies alive at once while it is processed
+
+    Returns:
+        int: Estimated bytes
+    """
+    width, height = size
+    return int(width * height * _BYTES_PER_PIXEL.get(mode, 4) * copies)
+
+class MemoryBudget:
+    """
+    Admission control for memory-hungry image work.
+
+    Callers reserve the bytes a decode is expected to take before doing it and
+    wait while the budget is spent. Waiters are admitted in arrival order, so
+    a large decode isn't starved by a stream of small ones. A single
+    reservation larger than the whole budget is admitted once nothing else
+    holds any of it, so it runs alone instead of never running.
+    """
+
+    def __init__(self, limit_bytes: int) -> None:
+        self.limit = int(limit_bytes)
+        self.condition = threading.Condition()
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self.queue: Deque[object] = deque()
+
+    def set_limit(self, limit_bytes: int) -> None:
+        with self.condition:
+            self.limit = int(limit_bytes)
+            self.condition.notify_all()
+
+    def reset_peak(self) -> None:
+        with self.condition:
+            self.peak = self.in_use
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> int:
+        """
+        Reserve part of the budget, waiting until it is available.
+
+        Args:
+            nbytes: Bytes to reserve
+            timeout: Seconds to wait before giving up, or None to wait indefinitely
+
+        Returns:
+            int: Bytes actually reserved, to be passed to release. Reservations larger
+            than the budget are capped at the budget.
+
+        Raises:
+            TimeoutError: If the budget didn't become available in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self.condition:
+            nbytes = max(0, min(int(nbytes), self.limit))
+            self.queue.append(ticket)
+            waited = False
+            try:
+                while self.queue[0] is not ticket or (self.in_use and self.in_use + nbytes > self.limit):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"Memory budget of {self.limit} bytes unavailable for {nbytes} bytes")
+                    waited = True
+                    self.condition.wait(remaining)
+                    nbytes = min(nbytes, self.limit)
+            finally:
+                self.queue.remove(ticket)
+                self.condition.notify_all()
+
+            if waited:
+                self.waits += 1
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+            return nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self.condition:
+            self.in_use -= nbytes
+            self.condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: Optional[float] = None) -> Iterator[int]:
+        """Hold a reservation for the duration of a block."""
+        reserved = self.acquire(nbytes, timeout)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+    @contextmanager
+    def reserve_image(self, image: Image.Image, copies: float = 1.0,
+                      timeout: Optional[float] = None) -> Iterator[int]:
+        """
+        Hold a reservation for decoding a lazily opened image.
+
+        If the image alone would take more than the whole budget and its format
+        can decode at reduced scale (JPEG), it is drafted down until it fits,
+        otherwise it waits to run alone.
+
+        Args:
+            image: Image returned by Image.open, possibly drafted, not loaded yet
+            copies: Number of full-size copies alive at once while it is processed
+            timeout: Seconds to wait before giving up, or None to wait indefinitely
+        """
+        estimate = estimate_image_bytes(image.size, image.mode, copies)
+        if estimate > self.limit and image.format == "JPEG" and image.tile:
+            width, height = image.size
+            scale = (self.limit / estimate) ** 0.5
+            image.draft(image.mode, (max(1, int(width * scale)), max(1, int(height * scale))))
+            logger.warning(f"Decoding {width}x{height} image at {image.size[0]}x{image.size[1]} to fit the memory budget.")
+            estimate = estimate_image_bytes(image.size, image.mode, copies)
+
+        with self.reserve(estimate, timeout) as reserved:
+            yield reserved
+
+def estimate_file_bytes(file_path: str, draft_size: Optional[Tuple[int, int]] = None, copies: float = 1.0) -> int:
+    """
+    Estimate the memory decoding an image file takes, from its header only.
+
+    Args:
+        file_path: Path of the image
+        draft_size: Size the decoder is asked to reduce to, for decodes that use Image.draft
+        copies: Number of full-size copies alive at once while it is processed
+
+    Returns:
+        int: Estimated bytes, 0 if the file can't be read as an image
+    """
+    try:
+        with Image.open(file_path) as image:
+            if draft_size is not None:
+                image.draft(image.mode, draft_size)
+            return estimate_image_bytes(image.size, image.mode, copies)
+    except Exception:
+        return 0
+
+def get_peak_rss_bytes() -> int:
+    """Get the highest resident set size the process has reached."""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def get_rss_bytes() -> int:
+    """Get the current resident set size of the process, or 0 where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return 0
+
+MEMORY_BUDGET = MemoryBudget(DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024)
+
+REGISTRY.gauge("pidash_memory_budget_bytes", "Memory image work may reserve.").set_function(
+    lambda: MEMORY_BUDGET.limit)
+REGISTRY.gauge("pidash_memory_budget_in_use_bytes", "Memory currently reserved by image work.").set_function(
+    lambda: MEMORY_BUDGET.in_use)
+REGISTRY.gauge("pidash_memory_budget_peak_bytes", "Most memory reserved by image work at once.").set_function(
+    lambda: MEMORY_BUDGET.peak)
+REGISTRY.counter("pidash_memory_budget_waits_total", "Reservations that had to wait for memory.").set_function(
+    lambda: MEMORY_BUDGET.waits)
+REGISTRY.gauge("pidash_process_resident_memory_bytes", "Resident set size of the process.").set_function(
+    get_rss_bytes)
+REGISTRY.gauge("pidash_process_peak_resident_memory_bytes", "Highest resident set size of the process.").set_function(
+    get_peak_rss_bytes)
@@ -4,7 +4,7 @@ import socket
 import logging
 from app import create_app
 from waitress import serve
-from constants import LOG_FORMAT, LOG_DATE_FORMAT, DEFAULT_HOST, DEFAULT_PORT, REFRESH_MANAGER_KEY, CONFIG_KEY, HOSTNAME_KEY, LOCAL_IP_KEY
+from constants import LOG_FORMAT, LOG_DATE_FORMAT, DEFAULT_HOST, DEFAULT_PORT, REFRESH_MANAGER_KEY, UPLOAD_MANAGER_KEY, THUMBNAIL_MANAGER_KEY, CONFIG_KEY, HOSTNAME_KEY, LOCAL_IP_KEY
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -32,6 +32,7 @@ def main():
     try:
         app.config[REFRESH_MANAGER_KEY].start()
         logger.info("Refresh manager started")
+        app.config[UPLOAD_MANAGER_KEY].start_backfill()
 
         logger.info("Running in production mode with Waitress")
         logger.info(f"Access at: http://{local_ip}:{DEFAULT_PORT} or http://{hostname}:{DEFAULT_PORT}")
@@ -48,6 +49,10 @@ def main():
     finally:
         logger.info("Stopping refresh manager...")
         app.config[REFRESH_MANAGER_KEY].stop()
+        logger.info("Stopping worker pools...")
+        app.config[UPLOAD_MANAGER_KEY].shutdown()
+        app.config[THUMBNAIL_MANAGER_KEY].shutdown()
+        app.config[CONFIG_KEY].flush()
 
 if __name__ == "__main__":
     main()
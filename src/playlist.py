@@ -0,0 +1,160 @@
+import os
+import sys
+from typing import Dict, Iterable, List, Optional
+
+class Playlist:
+    """
+    Display order of the images in a folder, with O(1) lookup of an image's position.
+
+    Names are stored once, interned and without the folder, which is kept as a
+    single prefix. An image keeps its position (slot) while others are added
+    and removed: new images are appended and removed ones leave a tombstone,
+    which navigation skips. Once tombstones outnumber the images, the owner
+    replaces the playlist with a compacted copy, the only time positions change.
+
+    A playlist is only changed before it is shared. The owner applies changes
+    to a copy and publishes that, so readers never see a playlist change under
+    them. Positions carry over to the copy: one a reader holds keeps pointing at
+    the same image or at a tombstone.
+    """
+
+    # Tombstones tolerated before compaction is worth it, whatever the library size
+    MIN_COMPACT_TOMBSTONES = 64
+
+    def __init__(self, folder: str, names: Iterable[str] = ()) -> None:
+        """
+        Initialize the playlist.
+
+        Args:
+            folder: Folder containing the images
+            names: Image names in display order
+        """
+        self.folder = folder
+        self.prefix = os.path.join(folder, "")
+        self.slots: List[Optional[str]] = []
+        self.positions: Dict[str, int] = {}
+        self.count = 0
+        self.live_names: Optional[List[str]] = None
+        self.add(names)
+
+    def copy(self) -> "Playlist":
+        """Get a copy with the same positions, to change without affecting readers of this one."""
+        playlist = Playlist(self.folder)
+        playlist.slots = self.slots.copy()
+        playlist.positions = self.positions.copy()
+        playlist.count = self.count
+        playlist.live_names = self.live_names
+        return playlist
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.positions
+
+    def add(self, names: Iterable[str]) -> None:
+        """Append images that aren't in the playlist yet, in the order given."""
+        for name in names:
+            if name in self.positions:
+                continue
+            name = sys.intern(name)
+            self.positions[name] = len(self.slots)
+            self.slots.append(name)
+            self.count += 1
+            self.live_names = None
+
+    def remove(self, names: Iterable[str]) -> None:
+        """Remove images, leaving the positions of the others unchanged."""
+        for name in names:
+            position = self.positions.pop(name, None)
+            if position is None:
+                continue
+            self.slots[position] = None
+            self.count -= 1
+            self.live_names = None
+
+    def needs_compaction(self) -> bool:
+        tombstones = len(self.slots) - self.count
+        return tombstones > self.MIN_COMPACT_TOMBSTONES and tombstones > self.count
+
+    def compacted(self) -> "Playlist":
+        """Get a copy without tombstones, in the same order."""
+        return Playlist(self.folder, self.names())
+
+    def names(self) -> List[str]:
+        """Get the image names in display order. The list is shared, callers must not modify it."""
+        live_names = self.live_names
+        if live_names is None:
+            live_names = [name for name in self.slots if name is not None]
+            self.live_names = live_names
+        return live_names
+
+    def position(self, name: str) -> Optional[int]:
+        return self.positions.get(name)
+
+    def name_at(self, position: int) -> Optional[str]:
+        """Get the image at a position, or None if it was removed or the position is out of range."""
+        slots = self.slots
+        if 0 <= position < len(slots):
+            return slots[position]
+        return None
+
+    def path(self, name: str) -> str:
+        return self.prefix + name
+
+    def resolve(self, position: int) -> Optional[int]:
+        """
+        Get the position of the image shown at or after a position.
+
+        A removed image is followed by the next one in order, and positions past the
+        end wrap around to the first image.
+
+        Returns:
+            Optional[int]: Position of an image, or None if the playlist is empty
+        """
+        slots = self.slots
+        if 0 <= position < len(slots):
+            if slots[position] is not None:
+                return position
+        else:
+            position = 0
+        # Bounded, as a concurrent writer may remove the last image while this looks for one
+        for _ in range(len(slots)):
+            if slots[position] is not None:
+                return position
+            position = (position + 1) % len(slots)
+        return None
+
+    def step(self, position: int, offset: int) -> Optional[int]:
+        """
+        Move offset images from a position, wrapping around the playlist.
+
+        Without tombstones this is plain arithmetic. Otherwise the move walks over
+        at most half the playlist, skipping tombstones.
+
+        Args:
+            position: Starting position, resolved first if its image was removed
+            offset: Number of images to move, negative to move backwards
+
+        Returns:
+            Optional[int]: Position of the image moved to, or None if the playlist is empty
+        """
+        slots = self.slots
+        if len(slots) == self.count and 0 <= position < len(slots):
+            return (position + offset) % len(slots)
+        position = self.resolve(position)
+        if position is None:
+            return None
+
+        count = max(self.count, 1)
+        offset %= count
+        direction = 1
+        if offset > count // 2:
+            offset, direction = count - offset, -1
+        for _ in range(len(slots)):
+            if not offset:
+                break
+            position = (position + direction) % len(slots)
+            if slots[position] is not None:
+                offset -= 1
+        return self.resolve(position)
@@ -0,0 +1,198 @@
+"""
+Render every image of a library ahead of time, on all cores.
+
+    python -m src.prerender [FOLDER] [--profile NAME | --panel MODEL] [--workers N] [--report PATH]
+
+Frames are rendered with the same pipeline as the service and written to the
+render cache it reads: this device's, or with --profile the frame server's
+cache of that device profile. The panel is never touched, so the service can
+keep running and picks the frames up as it needs them. Images whose frame is
+already cached are skipped, so an interrupted run resumes where it stopped.
+
+The exit status is 1 if any image failed to render.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from PIL import Image
+from src.config import Config
+from src.device_profile import DeviceProfile, load_profiles
+from src.display_backend import PANEL_MODELS
+from src.display_manager import DisplayManager
+from src.file_utils import write_json_atomic
+from src.frame_server import ROOT_DIR, create_profile_display_manager
+from src.render_cache import RenderCache
+from src.constants import (
+    IMAGE_FOLDER_KEY, RESOLUTION_KEY, ORIENTATION_KEY, INVERTED_IMAGE_KEY, IMAGE_SETTINGS_KEY, DISPLAY_BACKEND_KEY,
+    SIMULATED_DISPLAY_KEY, DEFAULT_SIMULATED_PANEL, DEFAULT_FRAME_SERVER_FOLDER, SUPPORTED_IMAGE_EXTENSIONS,
+    LOG_FORMAT, LOG_DATE_FORMAT
+)
+
+logger = logging.getLogger(__name__)
+
+# Display manager of each worker process, set up once by _init_worker
+_worker_display_manager: Optional[DisplayManager] = None
+
+def _init_worker(profile: DeviceProfile, scratch_dir: str) -> None:
+    global _worker_display_manager
+    # Workers only render, their own caches are kept apart from the target and from each other
+    _worker_display_manager = create_profile_display_manager(profile, os.path.join(scratch_dir, str(os.getpid())))
+
+def _render_image(source_path: str) -> Tuple[bytes, float]:
+    start = time.perf_counter()
+    with Image.open(source_path) as image:
+        frame = _worker_display_manager.render_uncached(image)
+    return RenderCache.encode(frame), time.perf_counter() - start
+
+def get_available_cores() -> int:
+    """Get the number of cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def list_images(folder: str) -> List[str]:
+    """Get the paths of the supported images in a folder, in name order."""
+    with os.scandir(folder) as it:
+        names = [entry.name for entry in it
+                 if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_IMAGE_EXTENSIONS]
+    return [os.path.join(folder, name) for name in sorted(names, key=lambda name: (name.lower(), name))]
+
+def prerender(display_manager: DisplayManager, profile: DeviceProfile, image_paths: List[str], workers: int,
+              on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Render images into a display manager's render cache on a pool of processes.
+
+    Args:
+        display_manager: Display manager set up for the profile, whose render cache receives the frames
+        profile: Device profile the workers render for
+        image_paths: Source images
+        workers: Number of worker processes
+        on_result: Called with each image's result as soon as it is known
+
+    Returns:
+        List[Dict[str, Any]]: Per image, in the order they finished: "name", "status" (rendered,
+        skipped or failed), "seconds" spent rendering and "error" for failures
+    """
+    results = []
+
+    def record(path, status, seconds=0.0, error=None):
+        result = {"name": os.path.basename(path), "status": status, "seconds": seconds}
+        if error is not None:
+            result["error"] = error
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    render_cache = display_manager.render_cache
+    pending = {}
+    for path in image_paths:
+        key = display_manager.get_cache_key(path)
+        if key is None:
+            record(path, "failed", error="File can't be read")
+        elif key in render_cache:
+            record(path, "skipped")
+        else:
+            pending[path] = key
+
+    if not pending:
+        return results
+
+    with tempfile.TemporaryDirectory(prefix="prerender-") as scratch_dir, \
+            ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                initargs=(profile, scratch_dir)) as executor:
+        futures = {executor.submit(_render_image, path): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                data, seconds = future.result()
+            except Exception as e:
+                record(path, "failed", error=f"{type(e).__name__}: {e}")
+                continue
+            # Stored as each frame finishes, so an interrupted run keeps the frames it completed
+            render_cache.put_encoded(pending[path], data)
+            record(path, "rendered", seconds)
+    return results
+
+def _detect_panel(config: Config) -> Optional[str]:
+    """Tell the panel model of this device from its configuration, or None if it can't."""
+    if config.get(DISPLAY_BACKEND_KEY) == "simulated":
+        return (config.get(SIMULATED_DISPLAY_KEY) or {}).get("model", DEFAULT_SIMULATED_PANEL)
+    resolution = config.get(RESOLUTION_KEY)
+    for model, panel in PANEL_MODELS.items():
+        if resolution and tuple(int(value) for value in resolution) == panel.resolution:
+            return model
+    return None
+
+def _print_result(result: Dict[str, Any]) -> None:
+    details = f"{result['seconds'] * 1000:8.1f} ms" if result["status"] == "rendered" else ""
+    if "error" in result:
+        details = result["error"]
+    print(f"{result['status']:<8}  {result['name']}  {details}".rstrip(), flush=True)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.prerender",
+                                     description="Render every image of a library into the render cache.")
+    parser.add_argument("folder", nargs="?", help="image folder, the configured one by default")
+    parser.add_argument("--profile", help="frame server device profile to render for, instead of this device")
+    parser.add_argument("--panel", choices=sorted(PANEL_MODELS),
+                        help="panel model of this device, if it can't be told from the configured resolution")
+    parser.add_argument("--workers", type=int, default=get_available_cores(),
+                        help="worker processes, one per available core by default")
+    parser.add_argument("--report", metavar="PATH", help="write the per-image results as JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    config = Config()
+    if args.profile:
+        try:
+            profile = load_profiles(config).get(args.profile)
+        except ValueError as e:
+            parser.error(str(e))
+        if profile is None:
+            parser.error(f"Unknown device profile {args.profile}")
+        cache_dir = os.path.join(ROOT_DIR, DEFAULT_FRAME_SERVER_FOLDER, args.profile)
+    else:
+        panel = args.panel or _detect_panel(config)
+        if panel is None:
+            parser.error(f"Can't tell the panel from the configured resolution {config.get(RESOLUTION_KEY)}, "
+                         f"pass --panel")
+        profile = DeviceProfile.from_dict("device", {
+            "panel": panel,
+            ORIENTATION_KEY: config.get(ORIENTATION_KEY),
+            INVERTED_IMAGE_KEY: config.get(INVERTED_IMAGE_KEY, False),
+            IMAGE_SETTINGS_KEY: config.get(IMAGE_SETTINGS_KEY) or {}
+        })
+        cache_dir = ROOT_DIR
+
+    folder = os.path.abspath(args.folder or os.path.join(ROOT_DIR, config.get(IMAGE_FOLDER_KEY)))
+    image_paths = list_images(folder)
+    display_manager = create_profile_display_manager(profile, cache_dir)
+    print(f"Rendering {len(image_paths)} images from {folder} for {profile.name} "
+          f"({profile.panel}, {profile.orientation}) on {args.workers} workers")
+
+    start = time.perf_counter()
+    results = prerender(display_manager, profile, image_paths, args.workers, _print_result)
+    elapsed = time.perf_counter() - start
+
+    counts = {status: sum(result["status"] == status for result in results)
+              for status in ("rendered", "skipped", "failed")}
+    print(f"{counts['rendered']} rendered, {counts['skipped']} already cached, {counts['failed']} failed "
+          f"in {elapsed:.1f} s")
+    render_cache = display_manager.render_cache
+    cached = {result["name"] for result in results if result["status"] != "failed"}
+    if any(os.path.basename(path) in cached and display_manager.get_cache_key(path) not in render_cache
+           for path in image_paths):
+        print(f"The render cache keeps {render_cache.max_bytes // (1024 * 1024)} MB, which doesn't hold every frame. "
+              f"Raise render_cache_size_mb to keep them all.")
+    if args.report:
+        write_json_atomic(args.report, {"folder": folder, "profile": profile.to_dict(), "seconds": elapsed,
+                                        "results": results}, indent=2)
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
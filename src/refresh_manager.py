@@ -1,95 +1,391 @@
+import os
 import threading
 import time
 import logging
+import uuid
+from collections import OrderedDict
+from PIL import Image
 from src.config import Config
 from src.image_manager import ImageManager
 from src.display_manager import DisplayManager
+from src.metrics import CACHE_LOOKUPS, DISPLAY_JOBS, DISPLAY_QUEUE_DEPTH, PIPELINE_STAGE_SECONDS
+from src.constants import MAX_DISPLAY_JOBS, MAX_PREPARED_FRAMES, REFRESH_INTERVAL_KEY, RENDER_SETTING_KEYS
 
 logger = logging.getLogger(__name__)
 
+class DisplayJob:
+    """A display command and its progress, shared by every request coalesced into it."""
+
+    def __init__(self, job_id, offset=0, image_name=None, force=False, automatic=False):
+        self.job_id = job_id
+        self.offset = offset
+        self.image_name = image_name
+        self.force = force
+        self.automatic = automatic
+        self.state = "queued"
+        self.error = None
+        self.requests = 1
+        self.done = threading.Event()
+
+    def merge(self, offset=0, image_name=None, force=False):
+        """Fold a newer request into this queued command."""
+        if image_name is not None:
+            self.image_name = image_name
+            self.offset = offset
+        else:
+            self.offset += offset
+        self.force = self.force or force
+        self.requests += 1
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Wait until the command has been shown, returning False on timeout."""
+        return self.done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "requests": self.requests,
+            "error": self.error
+        }
+
 class RefreshManager:
 
-    def __init__(self, config: Config, image_manager: ImageManager, display_manager: DisplayManager):
+    PREFETCH_NICENESS = 10
+
+    def __init__(self, config: Config, image_manager: ImageManager, display_manager: DisplayManager,
+                 max_prepared_frames: int = MAX_PREPARED_FRAMES, max_jobs: int = MAX_DISPLAY_JOBS):
         self.config = config
         self.image_manager = image_manager
         self.display_manager = display_manager
-        
+
         self.thread = None
         self.lock = threading.Lock()
         self.running = False
         self.condition = threading.Condition()
-    
+        self.last_refresh = None
+        self.refresh_requested = False
+        self.pending_job = None
+        self.jobs = OrderedDict()
+        self.max_jobs = max_jobs
+
+        self.prefetch_thread = None
+        self.prefetch_condition = threading.Condition()
+        self.prefetch_generation = 0
+        self.prefetch_targets = []
+        self.prepared_frames = OrderedDict()
+        self.max_prepared_frames = max_prepared_frames
+        self.manual_navigation = False
+
+        config.subscribe([REFRESH_INTERVAL_KEY], self._refresh_interval_changed)
+        config.subscribe(RENDER_SETTING_KEYS, self._render_settings_changed)
+
     def start(self):
         if self.thread and self.thread.is_alive():
             logger.warning("Rotation task already running")
             return
-        
+
         self.thread = threading.Thread(target=self._run, daemon=True)
+        self.prefetch_thread = threading.Thread(target=self._prefetch_run, daemon=True)
         self.running = True
         self.thread.start()
+        self.prefetch_thread.start()
         logger.info("Refresh task started")
-    
+
     def stop(self):
         with self.condition:
             self.running = False
             self.condition.notify_all()
-        
+        with self.prefetch_condition:
+            self.prefetch_condition.notify_all()
+
         if self.thread:
             self.thread.join()
             logger.info("Refresh task stopped")
-    
+        if self.prefetch_thread:
+            self.prefetch_thread.join()
+
     def trigger_immediate_refresh(self):
         with self.condition:
+            self.refresh_requested = True
+            self.condition.notify_all()
+
+    def request_refresh(self, force=False):
+        """Queue a redraw of the current image and return its job without waiting for the panel."""
+        return self.submit(force=force)
+
+    def request_next(self):
+        return self.submit(offset=1)
+
+    def request_previous(self):
+        return self.submit(offset=-1)
+
+    def request_image(self, image_name):
+        return self.submit(image_name=image_name)
+
+    def submit(self, offset=0, image_name=None, force=False):
+        """
+        Queue a display command for the display worker.
+
+        Only the most recent command is kept while the panel is busy: a new command
+        is merged into the queued one instead of waiting behind it, so a burst of
+        requests costs one refresh. Moves add up, so three quick "next" requests
+        still advance three images.
+
+        Args:
+            offset: Number of images to move from the current image (or from image_name)
+            image_name: Image to make current before moving, or None to start from the current image
+            force: Whether to update the panel even if the frame hasn't changed
+
+        Returns:
+            DisplayJob: Handle of the queued command, shared by every request merged into it
+        """
+        with self.condition:
+            job = self.pending_job
+            if job is None:
+                job = DisplayJob(uuid.uuid4().hex, offset, image_name, force)
+                self.pending_job = job
+                self.jobs[job.job_id] = job
+                while len(self.jobs) > self.max_jobs:
+                    self.jobs.popitem(last=False)
+            else:
+                job.merge(offset, image_name, force)
+            DISPLAY_QUEUE_DEPTH.set(job.requests)
             self.condition.notify_all()
-    
+        return job
+
+    def get_job(self, job_id):
+        """Get the state of a display command, or None if it is unknown or expired."""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
     def _run(self):
         logger.info("Starting refresh loop")
-        
+
         while self.running:
-            try:
-                refresh_interval = self.config.get("refresh_interval", 3600)
+            job = self._next_job()
+            if job is None:
+                break
+            self._execute(job)
 
-                if not self.running:
+    def _next_job(self):
+        """Wait for a queued command or for the rotation interval to elapse."""
+        # The interval is re-read after every wake-up, so a changed interval re-arms the timer
+        with self.condition:
+            while self.running:
+                if self.pending_job is not None:
+                    job, self.pending_job = self.pending_job, None
+                    job.state = "running"
+                    DISPLAY_QUEUE_DEPTH.set(0)
+                    return job
+                if self.refresh_requested or self.last_refresh is None:
+                    break
+                refresh_interval = self.config.get(REFRESH_INTERVAL_KEY, 3600)
+                remaining = self.last_refresh + refresh_interval - time.monotonic()
+                if remaining <= 0:
                     break
+                self.condition.wait(timeout=remaining)
+            else:
+                return None
+            self.refresh_requested = False
+        return DisplayJob(None, 1, automatic=True)
 
-                self.image_manager.refresh_image_list()
-                
-                if self.image_manager.get_image_count() == 0:
-                    logger.warning("No images available for display. Monitoring for changes...")
-                    self.refresh_display()
-                else:
-                    self.display_next_image()
-                
-                with self.condition:
-                    if self.running:
-                        self.condition.wait(timeout=refresh_interval)
-                
-            except Exception as e:
-                logger.exception(f"Error in refresh loop: {e}")
-                time.sleep(10)
+    def _execute(self, job):
+        # Only the display worker calls this, so access to the panel is serialized
+        start = time.perf_counter()
+        try:
+            self.image_manager.refresh_image_list()
+
+            if job.image_name is not None and not self.image_manager.set_current_image(job.image_name):
+                logger.warning(f"Image {job.image_name} is not in the library.")
+
+            # Someone browsing may step back, so the previous frame is prefetched too until rotation moves on
+            if job.offset != 0 or job.image_name is not None:
+                self.manual_navigation = not job.automatic
+
+            if self.image_manager.get_image_count() == 0:
+                logger.warning("No images available for display. Monitoring for changes...")
+                self.refresh_display(force=job.force)
+            elif job.offset == 0:
+                self.refresh_display(force=job.force)
+            else:
+                self.display_relative_image(job.offset, force=job.force)
+            job.finish("done")
+        except Exception as e:
+            logger.exception(f"Error in refresh loop: {e}")
+            job.finish("failed", str(e))
+        PIPELINE_STAGE_SECONDS.labels("total").observe(time.perf_counter() - start)
+        DISPLAY_JOBS.labels(job.state).inc()
+
+        self.last_refresh = time.monotonic()
+
+    def _refresh_interval_changed(self, key, old_value, new_value):
+        logger.info(f"Refresh interval changed from {old_value} to {new_value} seconds.")
+        with self.condition:
+            self.condition.notify_all()
+
+    def _render_settings_changed(self, key, old_value, new_value):
+        self.cancel_prefetch()
+        self.request_refresh()
+
+    def refresh_display(self, force=False):
+        image_path = self.image_manager.get_relative_image_path(0)
+        frame = self._take_prepared_frame(image_path)
+        if frame is not None:
+            self.display_manager.show_frame(frame, force=force)
+            self.schedule_prefetch()
+            return
 
-    def refresh_display(self):
         image = self.image_manager.get_current_image()
 
         if image:
-            self.display_manager.display_image(image)
+            self.display_manager.display_image(image, force=force)
+            self.schedule_prefetch()
         else:
             logger.warning("Failed to refresh display.")
 
     def display_next_image(self):
-        image = self.image_manager.get_next_image()
-        self.image_manager.update_image_index()
-
-        if image:
-            self.display_manager.display_image(image)
-        else:
-            logger.warning("Failed to display next image.")
+        self.display_relative_image(1)
 
     def display_previous_image(self):
-        image = self.image_manager.get_previous_image()
-        self.image_manager.update_image_index(increment=False)
+        self.display_relative_image(-1)
 
-        if image:
-            self.display_manager.display_image(image)
-        else:
-            logger.warning("Failed to display previous image.")
+    def display_relative_image(self, offset, force=False):
+        """
+        Display the image offset positions from the current one and make it current.
+
+        Args:
+            offset: Number of images to move (negative for previous)
+            force: Whether to update the panel even if the frame hasn't changed
+        """
+        image_path = self.image_manager.get_relative_image_path(offset)
+        frame = self._take_prepared_frame(image_path)
+        if frame is not None:
+            self.image_manager.move_current_image(offset)
+            self.display_manager.show_frame(frame, force=force)
+            self.schedule_prefetch()
+            return
+
+        if image_path is None:
+            self.refresh_display(force=force)
+            return
+
+        try:
+            image = Image.open(image_path)
+            logger.info(f"Loaded image for display: {os.path.basename(image_path)}")
+        except Exception as e:
+            logger.error(f"Error loading image {image_path}: {e}")
+            image = self.image_manager.get_default_image()
+        self.image_manager.move_current_image(offset)
+
+        with image:
+            self.display_manager.display_image(image, force=force)
+        self.schedule_prefetch()
+
+    def schedule_prefetch(self):
+        """Queue the frames most likely to be shown next for background rendering."""
+        offsets = [1, -1] if self.manual_navigation else [1]
+        targets = []
+        for offset in offsets:
+            image_path = self.image_manager.get_relative_image_path(offset)
+            if image_path and image_path not in targets:
+                targets.append(image_path)
+
+        with self.prefetch_condition:
+            self.prefetch_targets = targets[:self.max_prepared_frames]
+            for image_path in list(self.prepared_frames):
+                if image_path not in self.prefetch_targets:
+                    del self.prepared_frames[image_path]
+            self.prefetch_condition.notify_all()
+
+    def cancel_prefetch(self):
+        """Discard prepared frames and abandon in-flight renders, e.g. after library or settings changes."""
+        with self.prefetch_condition:
+            self.prefetch_generation += 1
+            self.prefetch_targets = []
+            self.prepared_frames.clear()
+            self.prefetch_condition.notify_all()
+        logger.debug("Prefetch cancelled")
+
+    def _take_prepared_frame(self, image_path):
+        if not image_path:
+            return None
+
+        with self.prefetch_condition:
+            prepared = self.prepared_frames.pop(image_path, None)
+
+        if prepared is None:
+            CACHE_LOOKUPS.labels("prepared", "miss").inc()
+            return None
+
+        frame, render_settings, mtime_ns = prepared
+        if render_settings != self.display_manager.get_render_settings() or mtime_ns != self._get_mtime_ns(image_path):
+            logger.debug(f"Discarding stale prepared frame for {os.path.basename(image_path)}")
+            CACHE_LOOKUPS.labels("prepared", "stale").inc()
+            return None
+
+        CACHE_LOOKUPS.labels("prepared", "hit").inc()
+        logger.info(f"Using prepared frame for {os.path.basename(image_path)}")
+        return frame
+
+    def _prefetch_run(self):
+        self._lower_thread_priority()
+
+        while self.running:
+            with self.prefetch_condition:
+                image_path = self._next_prefetch_target()
+                while self.running and image_path is None:
+                    self.prefetch_condition.wait()
+                    image_path = self._next_prefetch_target()
+                if not self.running:
+                    break
+                generation = self.prefetch_generation
+
+            try:
+                render_settings = self.display_manager.get_render_settings()
+                mtime_ns = self._get_mtime_ns(image_path)
+                with Image.open(image_path) as image:
+                    # A frame from the frame store is a view over a slot that later frames reuse,
+                    # so a frame that waits to be shown keeps its own pixels
+                    frame = self.display_manager.render_frame(image).copy()
+            except Exception as e:
+                logger.error(f"Failed to prefetch {os.path.basename(image_path)}: {e}")
+                with self.prefetch_condition:
+                    if image_path in self.prefetch_targets:
+                        self.prefetch_targets.remove(image_path)
+                continue
+
+            with self.prefetch_condition:
+                if generation != self.prefetch_generation or image_path not in self.prefetch_targets:
+                    continue
+                self.prefetch_targets.remove(image_path)
+                self.prepared_frames[image_path] = (frame, render_settings, mtime_ns)
+                while len(self.prepared_frames) > self.max_prepared_frames:
+                    self.prepared_frames.popitem(last=False)
+            logger.debug(f"Prepared frame for {os.path.basename(image_path)}")
+
+    def _next_prefetch_target(self):
+        for image_path in self.prefetch_targets:
+            if image_path not in self.prepared_frames:
+                return image_path
+        self.prefetch_targets = []
+        return None
+
+    def _lower_thread_priority(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.PREFETCH_NICENESS)
+        except (AttributeError, OSError) as e:
+            logger.debug(f"Could not lower prefetch thread priority: {e}")
+
+    @staticmethod
+    def _get_mtime_ns(image_path):
+        try:
+            return os.stat(image_path).st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,129 @@
+import io
+import re
+import time
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, Optional
+from PIL import Image
+from src.render_cache import RenderCache
+from src.metrics import CACHE_LOOKUPS
+from src.constants import FRAME_SERVER_TIMEOUT_SECONDS, FRAME_SERVER_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ETags the server gives frames are render cache keys, which are also used as file names here
+_ETAG = re.compile(r'(?:W/)?"([0-9a-f]{8,64})"')
+
+class RemoteFrameSource:
+    """
+    Frames rendered for this device by a frame server.
+
+    Frames are pulled over HTTP and kept on disk under the ETag the server gave
+    them. Asking for a frame again sends that ETag, so a frame the server hasn't
+    re-rendered costs a 304 instead of a transfer, and a frame the server did
+    re-render, because the image or the profile changed, replaces the old one.
+
+    Whenever the server can't be reached fetch returns None and callers render
+    the frame locally. After a failure the server isn't tried again for
+    retry_seconds, so refreshes don't wait for a timeout every time.
+    """
+
+    def __init__(self, server_url: str, profile: str, cache_dir: str, max_bytes: int,
+                 timeout: float = FRAME_SERVER_TIMEOUT_SECONDS,
+                 retry_seconds: float = FRAME_SERVER_RETRY_SECONDS) -> None:
+        """
+        Initialize the frame source.
+
+        Args:
+            server_url: Base URL of the frame server, e.g. "http://frames.local:8080"
+            profile: Name of the device profile registered on the server
+            cache_dir: Directory where pulled frames are kept
+            max_bytes: Maximum total size of the pulled frames kept
+            timeout: Seconds to wait for the server before giving up on a frame
+            retry_seconds: Seconds to render locally after a failure before trying the server again
+        """
+        self.server_url = server_url.rstrip("/")
+        self.profile = profile
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.cache = RenderCache(cache_dir, max_bytes)
+        self.lock = threading.Lock()
+        self.etags: Dict[str, str] = {}
+        self.retry_at = 0.0
+
+    def fetch(self, image_name: str, settings_digest: str) -> Optional[Image.Image]:
+        """
+        Get the frame the server rendered for an image.
+
+        Args:
+            image_name: Filename of the image in the library, which the server shares
+            settings_digest: Digest of this device's render settings, see device_profile.settings_digest.
+                The server refuses to serve a profile rendered with other settings.
+
+        Returns:
+            Optional[Image.Image]: The frame, or None if it has to be rendered locally
+        """
+        if time.monotonic() < self.retry_at:
+            CACHE_LOOKUPS.labels("frame_server", "unavailable").inc()
+            return None
+
+        with self.lock:
+            etag = self.etags.get(image_name)
+        if etag is not None and etag not in self.cache:
+            etag = None
+
+        url = (f"{self.server_url}/api/frames/{urllib.parse.quote(self.profile, safe='')}/"
+               f"{urllib.parse.quote(image_name, safe='')}?settings={settings_digest}")
+        request = urllib.request.Request(url, headers={"If-None-Match": f'"{etag}"'} if etag else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+                new_etag = self._parse_etag(response.headers.get("ETag"))
+        except urllib.error.HTTPError as e:
+            return self._handle_error(image_name, etag, e)
+        except (urllib.error.URLError, OSError) as e:
+            return self._unavailable(f"Frame server {self.server_url} unreachable: {e}")
+
+        try:
+            frame = Image.open(io.BytesIO(data))
+            frame.load()
+        except Exception as e:
+            return self._unavailable(f"Frame server sent an unreadable frame for {image_name}: {e}")
+
+        if new_etag is not None:
+            self.cache.put(new_etag, frame)
+            with self.lock:
+                self.etags[image_name] = new_etag
+        CACHE_LOOKUPS.labels("frame_server", "fetched").inc()
+        return frame
+
+    def _handle_error(self, image_name: str, etag: Optional[str], error: urllib.error.HTTPError) -> Optional[Image.Image]:
+        error.close()
+        if error.code == 304 and etag is not None:
+            frame = self.cache.get(etag)
+            CACHE_LOOKUPS.labels("frame_server", "not_modified" if frame is not None else "miss").inc()
+            return frame
+        if error.code == 404:
+            logger.info(f"Frame server has no frame for {image_name} in profile {self.profile}.")
+            CACHE_LOOKUPS.labels("frame_server", "miss").inc()
+            return None
+        if error.code == 409:
+            logger.warning(f"Profile {self.profile} on the frame server is rendered with other settings than "
+                           f"this device's, rendering {image_name} locally.")
+            CACHE_LOOKUPS.labels("frame_server", "mismatch").inc()
+            return None
+        return self._unavailable(f"Frame server failed to serve {image_name}: HTTP {error.code}")
+
+    def _unavailable(self, message: str) -> None:
+        logger.warning(f"{message}. Rendering locally for {self.retry_seconds} seconds.")
+        self.retry_at = time.monotonic() + self.retry_seconds
+        CACHE_LOOKUPS.labels("frame_server", "unavailable").inc()
+        return None
+
+    @staticmethod
+    def _parse_etag(header: Optional[str]) -> Optional[str]:
+        match = _ETAG.fullmatch(header.strip()) if header else None
+        return match.group(1) if match else None
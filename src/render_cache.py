@@ -0,0 +1,223 @@
+import os
+import io
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from PIL import Image
+from src.file_utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+class RenderCache:
+    """
+    Persistent on-disk cache of display-ready frames.
+
+    Frames are stored as PNG files named after a key derived from the source
+    file identity and every setting that affects rendering. The cache is kept
+    under a byte budget and evicts the least recently used frames first.
+    Frames another process stored in the same directory, e.g. the prerender
+    command, are picked up when they are first asked for.
+    """
+
+    FRAME_EXTENSION = ".png"
+    SETTINGS_FILE = "settings.json"
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        """
+        Initialize the render cache and index any frames already on disk.
+
+        Args:
+            cache_dir: Directory where rendered frames are stored
+            max_bytes: Maximum total size of cached frames in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.settings: Optional[Dict[str, Any]] = None
+        self._load_entries()
+
+    @staticmethod
+    def make_key(source_path: str, resolution, orientation: str, inverted: bool,
+                 image_settings: Dict[str, Any], resize_options=()) -> Optional[str]:
+        """
+        Build the cache key for a source image and its render settings.
+
+        Returns:
+            Optional[str]: Hex digest identifying the frame, or None if the source can't be read
+        """
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None
+
+        payload = json.dumps([
+            os.path.abspath(source_path), stat.st_mtime_ns, stat.st_size,
+            [int(value) for value in resolution], orientation, bool(inverted),
+            image_settings or {}, sorted(resize_options or ())
+        ], sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """
+        Load a cached frame and mark it as most recently used.
+
+        Returns:
+            Optional[Image.Image]: The cached frame, or None on a miss
+        """
+        frame_path = self._frame_path(key)
+        evicted = []
+        with self.lock:
+            if key not in self.entries:
+                try:
+                    size = os.path.getsize(frame_path)
+                except OSError:
+                    return None
+                self.entries[key] = size
+                self.total_bytes += size
+                evicted = self._evict_locked()
+            self.entries.move_to_end(key)
+
+        for evicted_key in evicted:
+            self._remove_file(evicted_key)
+
+        try:
+            with Image.open(frame_path) as cached:
+                frame = cached.copy()
+            os.utime(frame_path)
+            return frame
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached frame {key}: {e}")
+            self._discard(key)
+            return None
+
+    @staticmethod
+    def encode(frame: Image.Image) -> bytes:
+        """Encode a frame the way the cache stores it."""
+        buffer = io.BytesIO()
+        frame.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def put(self, key: str, frame: Image.Image) -> None:
+        """Store a rendered frame and evict old frames beyond the byte budget."""
+        self.put_encoded(key, self.encode(frame))
+
+    def put_encoded(self, key: str, data: bytes) -> None:
+        """Store a frame already encoded with encode, see put."""
+        if len(data) > self.max_bytes:
+            logger.debug(f"Frame {key} exceeds the render cache budget, not caching.")
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write_atomic(self._frame_path(key), data)
+        except Exception as e:
+            logger.error(f"Failed to cache rendered frame {key}: {e}")
+            return
+
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            evicted = self._evict_locked()
+
+        for evicted_key in evicted:
+            self._remove_file(evicted_key)
+
+    def ensure_settings(self, settings: Dict[str, Any]) -> bool:
+        """
+        Drop every cached frame if the render settings changed since last use.
+
+        Returns:
+            bool: True if the cache was invalidated
+        """
+        settings = json.loads(json.dumps(settings, sort_keys=True))
+        if settings == self.settings:
+            return False
+
+        settings_path = os.path.join(self.cache_dir, self.SETTINGS_FILE)
+        try:
+            with open(settings_path) as f:
+                if json.load(f) == settings:
+                    self.settings = settings
+                    return False
+        except (OSError, ValueError):
+            pass
+
+        logger.info("Render settings changed, invalidating render cache.")
+        self.clear()
+        self.settings = settings
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._write_atomic(settings_path, json.dumps(settings, sort_keys=True).encode("utf-8"))
+        except Exception as e:
+            logger.error(f"Failed to record render cache settings: {e}")
+        return True
+
+    def clear(self) -> None:
+        """Remove every cached frame."""
+        with self.lock:
+            keys = list(self.entries)
+            self.entries.clear()
+            self.total_bytes = 0
+
+        for key in keys:
+            self._remove_file(key)
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def _load_entries(self) -> None:
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        frames = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.FRAME_EXTENSION):
+                    stat = entry.stat()
+                    frames.append((stat.st_mtime_ns, entry.name[:-len(self.FRAME_EXTENSION)], stat.st_size))
+
+        for _, key, size in sorted(frames):
+            self.entries[key] = size
+            self.total_bytes += size
+
+        evicted = self._evict_locked()
+        for key in evicted:
+            self._remove_file(key)
+
+        logger.info(f"Render cache holds {len(self.entries)} frames ({self.total_bytes} bytes).")
+
+    def _evict_locked(self) -> list:
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(key)
+        return evicted
+
+    def _discard(self, key: str) -> None:
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+        self._remove_file(key)
+
+    def _remove_file(self, key: str) -> None:
+        try:
+            os.remove(self._frame_path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to remove cached frame {key}: {e}")
+
+    def _frame_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.FRAME_EXTENSION)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        with atomic_write(path) as f:
+            f.write(data)
@@ -0,0 +1,148 @@
+import os
+import glob
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from PIL import Image, features
+from src.constants import MEMORY_BUDGET_WAIT_SECONDS
+from src.file_utils import atomic_write
+from src.memory_budget import MEMORY_BUDGET
+
+logger = logging.getLogger(__name__)
+
+class ThumbnailManager:
+    """
+    Generates and caches small gallery thumbnails.
+
+    Thumbnails are rendered on a bounded worker pool shared by all requests and
+    stored on disk under a name derived from the source file's identity, so a
+    changed source gets a new thumbnail and a new ETag.
+    """
+
+    def __init__(self, image_folder: str, cache_dir: str, size: int, extensions: Iterable[str],
+                 max_workers: int = 1) -> None:
+        """
+        Initialize the thumbnail manager.
+
+        Args:
+            image_folder: Folder containing the source images
+            cache_dir: Directory where thumbnails are stored
+            size: Maximum width and height of a thumbnail in pixels
+            extensions: Lower-case source file extensions that may be thumbnailed
+            max_workers: Number of worker threads generating thumbnails
+        """
+        self.image_folder = image_folder
+        self.cache_dir = cache_dir
+        self.size = size
+        self.extensions = tuple(extensions)
+        self.format, self.mimetype = ("WEBP", "image/webp") if features.check("webp") else ("JPEG", "image/jpeg")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Future] = {}
+
+    def get_thumbnail(self, image_name: str, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Get the thumbnail for an image, generating it on the worker pool if needed.
+
+        Args:
+            image_name: Filename of the source image inside the image folder
+            timeout: Seconds to wait for generation before giving up
+
+        Returns:
+            Optional[Tuple[str, str]]: (thumbnail path, etag), or None if the image doesn't exist
+
+        Raises:
+            TimeoutError: If the thumbnail couldn't be generated within the timeout
+        """
+        identity = self._get_identity(image_name)
+        if identity is None:
+            return None
+
+        thumbnail_path, etag = identity
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path, etag
+
+        self.request_thumbnail(image_name).result(timeout=timeout)
+        return thumbnail_path, etag
+
+    def request_thumbnail(self, image_name: str) -> Future:
+        """Queue thumbnail generation for an image without waiting for it."""
+        identity = self._get_identity(image_name)
+        if identity is None:
+            future = Future()
+            future.set_result(None)
+            return future
+
+        thumbnail_path, _ = identity
+        with self.lock:
+            future = self.pending.get(thumbnail_path)
+            if future is None:
+                future = self.executor.submit(self._generate, image_name, thumbnail_path)
+                self.pending[thumbnail_path] = future
+                future.add_done_callback(lambda _: self._finish(thumbnail_path))
+        return future
+
+    def remove(self, image_name: str) -> None:
+        """Delete every cached thumbnail of an image."""
+        for path in glob.glob(os.path.join(self.cache_dir, self._get_prefix(image_name) + "-*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to remove thumbnail {path}: {e}")
+
+    def clear(self) -> None:
+        """Delete every cached thumbnail."""
+        for path in glob.glob(os.path.join(self.cache_dir, "*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to remove thumbnail {path}: {e}")
+
+    def shutdown(self) -> None:
+        with self.lock:
+            pending = len(self.pending)
+        if pending:
+            logger.info(f"Dropping {pending} pending thumbnail(s), they are generated again when requested.")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_identity(self, image_name: str) -> Optional[Tuple[str, str]]:
+        if not image_name or os.path.basename(image_name) != image_name:
+            return None
+        if not image_name.lower().endswith(self.extensions):
+            return None
+
+        try:
+            stat = os.stat(os.path.join(self.image_folder, image_name))
+        except OSError:
+            return None
+
+        version = f"{image_name}:{stat.st_mtime_ns}:{stat.st_size}:{self.size}:{self.format}"
+        etag = hashlib.sha1(version.encode("utf-8")).hexdigest()[:20]
+        extension = ".webp" if self.format == "WEBP" else ".jpg"
+        return os.path.join(self.cache_dir, f"{self._get_prefix(image_name)}-{etag}{extension}"), etag
+
+    def _get_prefix(self, image_name: str) -> str:
+        return hashlib.sha1(image_name.encode("utf-8")).hexdigest()[:16]
+
+    def _generate(self, image_name: str, thumbnail_path: str) -> str:
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+
+        source_path = os.path.join(self.image_folder, image_name)
+        with Image.open(source_path) as image:
+            image.draft("RGB", (self.size, self.size))
+            with MEMORY_BUDGET.reserve_image(image, timeout=MEMORY_BUDGET_WAIT_SECONDS):
+                image.thumbnail((self.size, self.size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+                thumbnail = image.convert("RGB")
+
+        self.remove(image_name)
+        with atomic_write(thumbnail_path) as f:
+            thumbnail.save(f, format=self.format, quality=75)
+        logger.debug(f"Generated thumbnail for {image_name}")
+        return thumbnail_path
+
+    def _finish(self, thumbnail_path: str) -> None:
+        with self.lock:
+            self.pending.pop(thumbnail_path, None)
@@ -0,0 +1,407 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from PIL import Image
+from src.content_index import compute_file_digest, hash_image_file
+from src.image_manager import ImageManager
+from src.constants import MEMORY_BUDGET_WAIT_SECONDS
+from src.image_utils import compute_dhash
+from src.memory_budget import MEMORY_BUDGET, estimate_file_bytes
+from src.metrics import UPLOAD_STAGE_SECONDS, UPLOAD_FILES
+from src.validation import validate_uploaded_file, verify_image_data
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_SAVE_INTERVAL = 100
+# Size compute_dhash asks JPEG decoders to reduce to
+DHASH_DRAFT_SIZE = (32, 32)
+# A decoded image plus the greyscale copy its perceptual hash is computed from
+HASH_DECODE_COPIES = 1.25
+
+def check_upload(file_path: str, filename: str) -> Tuple[bool, str, Optional[str]]:
+    """Validate an uploaded file and compute its content digest while it's still in the page cache."""
+    is_valid, message = validate_uploaded_file(file_path, filename)
+    return is_valid, message, compute_file_digest(file_path) if is_valid else None
+
+def hash_library_image(file_path: str) -> Optional[Tuple[str, Optional[int]]]:
+    """Compute the content hashes of an image in the library, or None if it has gone away."""
+    try:
+        return hash_image_file(file_path)
+    except OSError:
+        return None
+
+def verify_upload(file_path: str) -> Tuple[bool, str, Optional[int]]:
+    """Fully decode a staged image and compute its perceptual hash."""
+    is_valid, message = verify_image_data(file_path)
+    if not is_valid:
+        return is_valid, message, None
+    with Image.open(file_path) as image:
+        return is_valid, message, compute_dhash(image)
+
+class UploadJob:
+    """Progress of one batch of uploaded files."""
+
+    def __init__(self, job_id: str, files: List[Tuple[str, str]]) -> None:
+        self.job_id = job_id
+        self.files = files
+        self.state = "validating"
+        self.validated = 0
+        self.valid_files: List[Tuple[str, str]] = []
+        self.digests: Dict[str, str] = {}
+        self.added: List[str] = []
+        self.rejected: List[Dict[str, str]] = []
+        self.duplicates: List[Dict[str, str]] = []
+        self.stage_started = time.monotonic()
+
+    def end_stage(self, stage: str) -> None:
+        """Record how long the stage that just ended took and start timing the next one."""
+        now = time.monotonic()
+        UPLOAD_STAGE_SECONDS.labels(stage).observe(now - self.stage_started)
+        self.stage_started = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "total": len(self.files),
+            "validated": self.validated,
+            "added": list(self.added),
+            "rejected": list(self.rejected),
+            "duplicates": list(self.duplicates)
+        }
+
+class UploadManager:
+    """
+    Ingests batches of uploaded files in the background.
+
+    Files are checked from their headers on a bounded process pool, so the web
+    threads are never held up. If deep verification is enabled, the files that
+    pass are then fully decoded on the same pool while they are still staged,
+    so a corrupt image never reaches the library. Each batch is committed to the
+    image library with a single index update once every file has been checked.
+
+    Exact copies of images already in the library are never stored, they are
+    linked to the existing image by content digest. If near_duplicate_distance
+    is set, images that look like an existing one are not stored either.
+    """
+
+    def __init__(self, image_manager: ImageManager, staging_dir: str, max_workers: int,
+                 max_jobs: int, deep_verify: bool = True, near_duplicate_distance: Optional[int] = None,
+                 on_changed: Optional[Callable[[], None]] = None) -> None:
+        """
+        Initialize the upload manager.
+
+        Args:
+            image_manager: Image manager the validated files are added to
+            staging_dir: Directory where uploaded files wait for validation
+            max_workers: Number of processes validating files
+            max_jobs: Number of finished jobs whose results are kept for polling
+            deep_verify: Whether to fully decode images before they are added
+            near_duplicate_distance: Perceptual hash distance within which an image counts as a
+                duplicate, or None to only detect exact copies. Requires deep_verify.
+            on_changed: Called after a job adds images to or removes them from the library
+        """
+        self.image_manager = image_manager
+        self.staging_dir = staging_dir
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.deep_verify = deep_verify
+        self.near_duplicate_distance = near_duplicate_distance
+        self.backfill_thread: Optional[threading.Thread] = None
+        self.on_changed = on_changed
+        self.lock = threading.Lock()
+        self.jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self.validator: Optional[ProcessPoolExecutor] = None
+        # Commits run one at a time, off the pool's result thread
+        self.committer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-commit")
+
+    def create_staging_file(self) -> str:
+        """Get a new path in the staging directory for an upload to be saved to."""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        return os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def submit(self, files: List[Tuple[str, str]]) -> str:
+        """
+        Start validating and adding a batch of staged files.
+
+        The staged files are owned by the job from here on and are removed once it finishes.
+
+        Args:
+            files: (staged path, sanitized filename) pairs
+
+        Returns:
+            str: Id of the job to poll with get_job
+        """
+        job = UploadJob(uuid.uuid4().hex, files)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._prune_jobs_locked()
+
+        if not files:
+            self.committer.submit(self._checked, job)
+            return job.job_id
+
+        validator = self._get_validator()
+        for staged_path, filename in files:
+            future = validator.submit(check_upload, staged_path, filename)
+            future.add_done_callback(lambda f, item=(staged_path, filename): self._validated(job, item, f))
+
+        logger.info(f"Started upload job {job.job_id} with {len(files)} file(s).")
+        return job.job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the progress of a job, or None if it is unknown or expired."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def start_backfill(self) -> None:
+        """Hash the images already in the library in the background so duplicates of them are found."""
+        if self.backfill_thread is not None and self.backfill_thread.is_alive():
+            return
+        self.backfill_thread = threading.Thread(target=self._backfill, name="content-backfill", daemon=True)
+        self.backfill_thread.start()
+
+    def shutdown(self) -> None:
+        with self.lock:
+            unfinished = [job for job in self.jobs.values() if job.state != "done"]
+        for job in unfinished:
+            logger.warning(f"Stopping upload job {job.job_id} while {job.state}, "
+                           f"{len(job.files) - len(job.added)} of its file(s) won't be added.")
+        if self.validator is not None:
+            self.validator.shutdown(wait=False, cancel_futures=True)
+        self.committer.shutdown(wait=False, cancel_futures=True)
+
+    def _get_validator(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.validator is None:
+                self.validator = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._get_mp_context())
+            return self.validator
+
+    def _get_mp_context(self) -> multiprocessing.context.BaseContext:
+        # Fork workers from a small server process instead of the threaded web server
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["src.upload_manager"])
+            return context
+        return multiprocessing.get_context()
+
+    def _validated(self, job: UploadJob, item: Tuple[str, str], future: Future) -> None:
+        staged_path, filename = item
+        try:
+            is_valid, message, digest = future.result()
+        except Exception as e:
+            is_valid, message, digest = False, f"File validation error: {str(e)}", None
+
+        with self.lock:
+            job.validated += 1
+            if is_valid:
+                job.valid_files.append(item)
+                job.digests[staged_path] = digest
+            else:
+                job.rejected.append({"name": filename, "reason": message})
+            finished = job.validated == len(job.files)
+
+        if not is_valid:
+            self._discard(staged_path)
+        if finished:
+            job.end_stage("validate")
+            self.committer.submit(self._checked, job)
+
+    def _checked(self, job: UploadJob) -> None:
+        with self.lock:
+            order = {item: position for position, item in enumerate(job.files)}
+            valid_files = sorted(job.valid_files, key=order.get)
+
+        # Exact copies are linked to the image already holding their contents, checked here since commits are serial
+        unique_files = []
+        seen: Dict[str, str] = {}
+        for staged_path, filename in valid_files:
+            digest = job.digests[staged_path]
+            existing = self.image_manager.find_duplicate(digest) or seen.get(digest)
+            if existing is not None:
+                with self.lock:
+                    job.duplicates.append({"name": filename, "existing": existing})
+                self._discard(staged_path)
+            else:
+                seen[digest] = filename
+                unique_files.append((staged_path, filename))
+
+        if unique_files and self.deep_verify:
+            with self.lock:
+                job.state = "verifying"
+            self._start_verify(job, unique_files)
+        else:
+            self._commit(job, unique_files, {})
+
+    def _start_verify(self, job: UploadJob, files: List[Tuple[str, str]]) -> None:
+        remaining = [len(files)]
+        results: Dict[str, Tuple[bool, str, Optional[int]]] = {}
+
+        def verified(staged_path: str, future: Future) -> None:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = False, f"File validation error: {str(e)}", None
+            with self.lock:
+                results[staged_path] = result
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                self.committer.submit(self._finish_verify, job,
+                                      [(staged_path, filename, *results[staged_path]) for staged_path, filename in files])
+
+        for staged_path, filename in files:
+            try:
+                future = self._submit_decode(verify_upload, staged_path,
+                                             estimate_file_bytes(staged_path, copies=HASH_DECODE_COPIES))
+            except TimeoutError as e:
+                # Keep the image rather than reject it for want of memory, it has passed the header checks
+                logger.warning(f"Skipping verification of {filename}: {e}")
+                future = Future()
+                future.set_result((True, "Not verified", None))
+            future.add_done_callback(lambda f, staged_path=staged_path: verified(staged_path, f))
+
+    def _finish_verify(self, job: UploadJob, results: List[Tuple[str, str, bool, str, Optional[int]]]) -> None:
+        job.end_stage("verify")
+        verified_files = []
+        dhashes: Dict[str, Optional[int]] = {}
+        # Looks of the images accepted so far in this batch, which aren't in the content index yet
+        accepted: List[Tuple[str, int]] = []
+        for staged_path, filename, is_valid, message, dhash in results:
+            if not is_valid:
+                logger.warning(f"Rejecting {filename} after it failed to decode.")
+                with self.lock:
+                    job.rejected.append({"name": filename, "reason": message})
+                self._discard(staged_path)
+                continue
+
+            similar = None
+            if self.near_duplicate_distance is not None and dhash is not None:
+                similar = self.image_manager.find_similar(dhash, self.near_duplicate_distance)
+                if similar is None:
+                    similar = next((name for name, other in accepted
+                                    if (other ^ dhash).bit_count() <= self.near_duplicate_distance), None)
+            if similar is not None:
+                logger.info(f"Skipping {filename} as a near-duplicate of {similar}.")
+                with self.lock:
+                    job.duplicates.append({"name": filename, "existing": similar})
+                self._discard(staged_path)
+                continue
+
+            verified_files.append((staged_path, filename))
+            dhashes[staged_path] = dhash
+            if dhash is not None:
+                accepted.append((filename, dhash))
+
+        self._commit(job, verified_files, dhashes)
+
+    def _commit(self, job: UploadJob, files: List[Tuple[str, str]], dhashes: Dict[str, Optional[int]]) -> None:
+        with self.lock:
+            job.state = "adding"
+
+        try:
+            added_names = self.image_manager.add_images(files, move=True)
+        except Exception as e:
+            logger.error(f"Failed to add images for upload job {job.job_id}: {e}")
+            added_names = [None] * len(files)
+
+        hashes = {}
+        with self.lock:
+            for (staged_path, filename), added_name in zip(files, added_names):
+                if added_name is None:
+                    job.rejected.append({"name": filename, "reason": "Failed to save"})
+                else:
+                    job.added.append(added_name)
+                    hashes[added_name] = (job.digests[staged_path], dhashes.get(staged_path))
+            job.state = "done"
+
+        for staged_path, _ in files:
+            self._discard(staged_path)
+
+        if hashes:
+            self.image_manager.record_content(hashes)
+            self._notify_changed(job)
+        job.end_stage("commit")
+        self._finished(job)
+
+    def _finished(self, job: UploadJob) -> None:
+        UPLOAD_FILES.labels("added").inc(len(job.added))
+        UPLOAD_FILES.labels("duplicate").inc(len(job.duplicates))
+        UPLOAD_FILES.labels("rejected").inc(len(job.rejected))
+        logger.info(f"Finished upload job {job.job_id}: {len(job.added)} added, {len(job.rejected)} rejected.")
+
+    def _backfill(self) -> None:
+        names = self.image_manager.get_unhashed_images()
+        if not names:
+            return
+
+        logger.info(f"Hashing {len(names)} image(s) to detect duplicate uploads.")
+        folder = self.image_manager.image_folder
+        hashed = 0
+        try:
+            futures = []
+            for name in names:
+                file_path = os.path.join(folder, name)
+                estimate = estimate_file_bytes(file_path, DHASH_DRAFT_SIZE, HASH_DECODE_COPIES)
+                futures.append(self._submit_decode(hash_library_image, file_path, estimate))
+            batch = {}
+            for name, future in zip(names, futures):
+                result = future.result()
+                if result is None:
+                    continue
+                batch[name] = result
+                if len(batch) >= BACKFILL_SAVE_INTERVAL:
+                    self.image_manager.record_content(batch)
+                    hashed += len(batch)
+                    batch = {}
+            self.image_manager.record_content(batch)
+            hashed += len(batch)
+        except Exception as e:
+            logger.error(f"Content hash backfill stopped after {hashed} image(s): {e}")
+            return
+        logger.info(f"Finished hashing {hashed} image(s).")
+
+    def _submit_decode(self, func: Callable[[str], Any], file_path: str, estimate: int) -> Future:
+        """
+        Run a decoding function on the validation pool once the memory budget allows it.
+
+        The reservation is taken here, in the web server process, and released when
+        the worker finishes, so decodes in worker processes count against the same
+        budget as the server's own.
+        """
+        reserved = MEMORY_BUDGET.acquire(estimate, MEMORY_BUDGET_WAIT_SECONDS)
+        try:
+            future = self._get_validator().submit(func, file_path)
+        except Exception:
+            MEMORY_BUDGET.release(reserved)
+            raise
+        future.add_done_callback(lambda _: MEMORY_BUDGET.release(reserved))
+        return future
+
+    def _notify_changed(self, job: UploadJob) -> None:
+        if self.on_changed is None:
+            return
+        try:
+            self.on_changed()
+        except Exception as e:
+            logger.error(f"Upload callback failed for job {job.job_id}: {e}")
+
+    def _prune_jobs_locked(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.state == "done"]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def _discard(self, staged_path: str) -> None:
+        try:
+            os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove staged upload {staged_path}: {e}")
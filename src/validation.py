@@ -5,7 +5,29 @@ Provides comprehensive validation for user inputs, file uploads,
 and configuration values to prevent security issues and data corruption.
 """
 
-from src.constants import VALID_ORIENTATIONS, MIN_REFRESH_INTERVAL, MAX_REFRESH_INTERVAL
+import os
+from typing import Tuple
+from PIL import Image
+from src.constants import (
+    VALID_ORIENTATIONS, MIN_REFRESH_INTERVAL, MAX_REFRESH_INTERVAL, MAX_FILE_SIZE_BYTES, ALLOWED_MIME_TYPES,
+    SUPPORTED_IMAGE_EXTENSIONS, ALLOWED_IMAGE_FORMATS, MAX_IMAGE_PIXELS
+)
+
+
+# How far from the end of a file its trailer marker may sit, allowing for padding and appended metadata
+TRAILER_SEARCH_BYTES = 64 * 1024
+
+TRAILERS = {
+    "JPEG": b"\xff\xd9",
+    "MPO": b"\xff\xd9",
+    "PNG": b"IEND\xaeB`\x82"
+}
+GIF_TRAILER = b";"
+
+TIFF_STRIP_OFFSETS = 273
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_TILE_OFFSETS = 324
+TIFF_TILE_BYTE_COUNTS = 325
 
 
 class ValidationError(Exception):
@@ -59,4 +81,111 @@ def validate_refresh_interval(interval) -> int:
     if interval > MAX_REFRESH_INTERVAL:
         raise ValidationError(f"Refresh interval too large (maximum: {MAX_REFRESH_INTERVAL} seconds)")
     
-    return interval
\ No newline at end of file
+    return interval
+
+
+def validate_uploaded_file(file_path: str, filename: str, deep: bool = False) -> Tuple[bool, str]:
+    """
+    Validate an uploaded file for security and format.
+
+    By default the file is only checked from its headers: the container type, the
+    declared dimensions against MAX_IMAGE_PIXELS, and whether the image data is
+    truncated. No pixels are decoded, so a full check can be run separately with
+    verify_image_data. This only depends on its arguments so it can run in a
+    worker process.
+
+    Args:
+        file_path: Path of the uploaded file on disk
+        filename: Sanitized filename the file was uploaded as
+        deep: Whether to also decode the whole image
+
+    Returns:
+        Tuple[bool, str]: Whether the file is valid and a message describing the result
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+        if file_size > MAX_FILE_SIZE_BYTES:
+            return False, f"File too large. Maximum size is {MAX_FILE_SIZE_BYTES // (1024*1024)}MB"
+        
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext not in SUPPORTED_IMAGE_EXTENSIONS:
+            return False, f"File type {file_ext} not allowed"
+
+        # libmagic loads its database on import, so it is only loaded once an upload needs it
+        import magic
+        mime = magic.from_file(file_path, mime=True)
+        if mime not in ALLOWED_MIME_TYPES:
+            return False, f"Invalid file format (detected: {mime})" 
+
+        try:
+            with Image.open(file_path, formats=ALLOWED_IMAGE_FORMATS) as img:
+                width, height = img.size
+                if width <= 0 or height <= 0:
+                    return False, "Invalid image file: empty image"
+                if width * height > MAX_IMAGE_PIXELS:
+                    return False, f"Image too large ({width}x{height}). Maximum is {MAX_IMAGE_PIXELS} pixels"
+                _check_complete(img, file_path, file_size)
+        except Exception as e:
+            return False, f"Invalid image file: {str(e)}"
+
+        if deep:
+            return verify_image_data(file_path)
+        return True, "File validation successful"
+            
+    except Exception as e:
+        return False, f"File validation error: {str(e)}"
+
+
+def verify_image_data(file_path: str) -> Tuple[bool, str]:
+    """
+    Fully decode an image to make sure its pixel data is intact.
+
+    Args:
+        file_path: Path of the image on disk
+
+    Returns:
+        Tuple[bool, str]: Whether the image decoded and a message describing the result
+    """
+    try:
+        with Image.open(file_path, formats=ALLOWED_IMAGE_FORMATS) as img:
+            img.verify()
+        with Image.open(file_path, formats=ALLOWED_IMAGE_FORMATS) as img:
+            img.load()
+        return True, "File validation successful"
+    except Exception as e:
+        return False, f"Invalid image file: {str(e)}"
+
+
+def _check_complete(img: Image.Image, file_path: str, file_size: int) -> None:
+    """Raise ValueError if the image data declared by the headers is cut short."""
+    for tile in img.tile:
+        if tile.offset > file_size:
+            raise ValueError("image data starts past the end of the file")
+        if tile.codec_name == "raw" and len(tile.args) > 1 and tile.args[1]:
+            rows = tile.extents[3] - tile.extents[1]
+            if tile.offset + abs(tile.args[1]) * rows > file_size:
+                raise ValueError("image file is truncated")
+
+    if img.format in TRAILERS:
+        if TRAILERS[img.format] not in _read_tail(file_path, file_size):
+            raise ValueError("image file is truncated")
+    elif img.format == "GIF":
+        if not _read_tail(file_path, file_size).rstrip(b"\x00").endswith(GIF_TRAILER):
+            raise ValueError("image file is truncated")
+    elif img.format == "WEBP":
+        with open(file_path, "rb") as f:
+            header = f.read(8)
+        if len(header) < 8 or int.from_bytes(header[4:8], "little") + 8 > file_size:
+            raise ValueError("image file is truncated")
+    elif img.format == "TIFF":
+        offsets = img.tag_v2.get(TIFF_STRIP_OFFSETS) or img.tag_v2.get(TIFF_TILE_OFFSETS) or ()
+        byte_counts = img.tag_v2.get(TIFF_STRIP_BYTE_COUNTS) or img.tag_v2.get(TIFF_TILE_BYTE_COUNTS) or ()
+        for offset, byte_count in zip(offsets, byte_counts):
+            if offset + byte_count > file_size:
+                raise ValueError("image file is truncated")
+
+
+def _read_tail(file_path: str, file_size: int) -> bytes:
+    with open(file_path, "rb") as f:
+        f.seek(max(0, file_size - TRAILER_SEARCH_BYTES))
+        return f.read()
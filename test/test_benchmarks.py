@@ -0,0 +1,44 @@
+import json
+import os
+from PIL import Image
+from benchmarks.__main__ import main
+from benchmarks.library import generate_library
+from benchmarks.suite import compare_results
+
+def _results(**medians):
+    return {"meta": {}, "results": {name: {"median_ms": median} for name, median in medians.items()}}
+
+def test_compare_flags_changes_beyond_threshold():
+    baseline = _results(fast=10.0, slow=10.0, steady=10.0, removed=1.0)
+    current = _results(fast=5.0, slow=12.0, steady=10.5, added=1.0)
+
+    rows = {row["name"]: row for row in compare_results(baseline, current, 0.15)}
+
+    assert rows["fast"]["status"] == "improvement"
+    assert rows["slow"]["status"] == "regression"
+    assert round(rows["slow"]["change"], 2) == 0.2
+    assert rows["steady"]["status"] == "ok"
+    assert rows["added"]["status"] == "new"
+    assert rows["removed"]["status"] == "missing"
+
+def test_generated_library_mixes_formats(tmp_path, monkeypatch):
+    monkeypatch.setattr("benchmarks.library.LIBRARY_SIZES", [(64, 48), (48, 64)])
+    names = generate_library(str(tmp_path), 14, unique=7)
+
+    assert len(names) == len(set(names)) == len(os.listdir(tmp_path)) == 14
+    formats = set()
+    for name in names[:7]:
+        with Image.open(tmp_path / name) as image:
+            formats.add(image.format)
+    assert formats == {"JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF"}
+
+def test_compare_mode_fails_on_regression(tmp_path, monkeypatch):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(_results(**{"gallery/page/none/30": 0.0001})))
+    monkeypatch.setattr("benchmarks.suite.QUICK_LIBRARY_COUNTS", (30,))
+    monkeypatch.setattr("benchmarks.library.LIBRARY_SIZES", [(64, 48)])
+
+    assert main(["--only", "gallery", "--quick", "--compare", str(baseline),
+                 "--save", str(tmp_path / "current.json")]) == 1
+    saved = json.loads((tmp_path / "current.json").read_text())
+    assert set(saved["results"]) == {"gallery/page/none/30", "gallery/page/name/30", "gallery/page/size/30"}
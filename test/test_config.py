@@ -1,4 +1,7 @@
 import os
+import json
+import threading
+import src.config
 from src.config import Config
 
 def test_config_file_exists():
@@ -40,4 +43,104 @@ def test_config_sets_new_value():
 
     assert config.get("new_key") is None
     config.set("new_key", "new_value", save=False)
-    assert config.get("new_key") == "new_value"
\ No newline at end of file
+    assert config.get("new_key") == "new_value"
+def _make_isolated_config(tmp_path, flush_delay=60):
+    config = Config(flush_delay=flush_delay)
+    config.config_file = str(tmp_path / "device.json")
+    config.save_config()
+    return config
+
+def test_config_set_is_debounced(tmp_path):
+    config = _make_isolated_config(tmp_path)
+
+    config.set("orientation", "portrait")
+    config.set("refresh_interval", 60)
+    with open(config.config_file) as f:
+        assert json.load(f)["orientation"] == "landscape"
+
+    config.flush()
+    with open(config.config_file) as f:
+        saved = json.load(f)
+    assert saved["orientation"] == "portrait"
+    assert saved["refresh_interval"] == 60
+
+def test_config_flushes_after_delay(tmp_path):
+    config = _make_isolated_config(tmp_path, flush_delay=0.05)
+
+    config.set("orientation", "portrait")
+    config.flush_timer.join(timeout=5)
+
+    with open(config.config_file) as f:
+        assert json.load(f)["orientation"] == "portrait"
+
+def test_concurrent_flushes_never_write_older_data_last(tmp_path, monkeypatch):
+    config = _make_isolated_config(tmp_path)
+    write_json_atomic = src.config.write_json_atomic
+    first_write_started = threading.Event()
+    shutdowns = []
+
+    def slow_first_write(path, data, **kwargs):
+        if data["orientation"] == "portrait":
+            # The timer's flush copied the data and is still writing it when shutdown flushes
+            first_write_started.set()
+            config.set("orientation", "landscape")
+            shutdowns.append(threading.Thread(target=config.flush))
+            shutdowns[0].start()
+            shutdowns[0].join(timeout=0.2)
+        write_json_atomic(path, data, **kwargs)
+    monkeypatch.setattr(src.config, "write_json_atomic", slow_first_write)
+
+    config.set("orientation", "portrait")
+    config.flush()
+    shutdowns[0].join(timeout=5)
+
+    assert first_write_started.is_set()
+    with open(config.config_file) as f:
+        assert json.load(f)["orientation"] == "landscape"
+
+def test_ephemeral_keys_go_to_state_file(tmp_path):
+    config = _make_isolated_config(tmp_path)
+    config_mtime_ns = os.stat(config.config_file).st_mtime_ns
+    config.mark_ephemeral("last_shown")
+
+    config.set("current_image_index", 7)
+    config.set("last_shown", "a.png")
+    config.flush()
+
+    assert os.stat(config.config_file).st_mtime_ns == config_mtime_ns
+    with open(config.state_file) as f:
+        assert json.load(f) == {"current_image_index": 7, "current_image": config.get("current_image"),
+                                "last_shown": "a.png"}
+
+    reloaded = Config()
+    reloaded.config_file = config.config_file
+    reloaded.config = reloaded.load_config()
+    assert reloaded.get("current_image_index") == 7
+    assert reloaded.get("orientation") == "landscape"
+
+def test_subscribers_get_old_and_new_values():
+    config = Config()
+    changes = []
+    config.subscribe(["orientation"], lambda key, old, new: changes.append((key, old, new)))
+
+    config.set("orientation", "portrait", save=False)
+    config.set("orientation", "portrait", save=False)
+    config.set("refresh_interval", 60, save=False)
+
+    assert changes == [("orientation", "landscape", "portrait")]
+
+def test_failing_subscriber_does_not_block_others():
+    config = Config()
+    changes = []
+
+    def failing(key, old, new):
+        raise RuntimeError("broken subscriber")
+
+    config.subscribe(["orientation"], failing)
+    config.subscribe(["orientation"], lambda key, old, new: changes.append(new))
+    config.set("orientation", "portrait", save=False)
+    config.unsubscribe(failing)
+    config.set("orientation", "landscape", save=False)
+
+    assert changes == ["portrait", "landscape"]
+    assert len(config.subscribers) == 1
@@ -0,0 +1,59 @@
+import io
+import random
+from PIL import Image
+from src.content_index import ContentIndex, compute_file_digest, hash_image_file
+from src.image_utils import compute_dhash
+
+def _make_photo(seed):
+    pixels = random.Random(seed).randbytes(32 * 24 * 3)
+    return Image.frombytes("RGB", (32, 24), pixels).resize((640, 480), Image.Resampling.BICUBIC)
+
+def _reencode(image, size, quality):
+    buffer = io.BytesIO()
+    image.resize(size).save(buffer, format="JPEG", quality=quality)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+def test_dhash_matches_reencoded_copies_only():
+    photo = _make_photo(1)
+    dhash = compute_dhash(photo)
+
+    assert (compute_dhash(_reencode(photo, (320, 240), 60)) ^ dhash).bit_count() <= 3
+    assert (compute_dhash(_make_photo(2)) ^ dhash).bit_count() > 10
+
+def test_index_finds_exact_and_similar_images(tmp_path):
+    index = ContentIndex(str(tmp_path / "content.json"))
+    index.add("a.jpg", "digest-a", 0b1011, 10, 1)
+    index.add("b.jpg", "digest-b", 0b1011 | (1 << 63), 20, 2)
+    index.add("c.jpg", "digest-c", 0xFFFF_0000_FFFF_0000, 30, 3)
+
+    assert index.find("digest-a") == ["a.jpg"]
+    assert index.find("digest-x") == []
+    assert index.find_similar(0b1011, 3) == [("a.jpg", 0), ("b.jpg", 1)]
+
+    index.remove("a.jpg")
+    assert index.find("digest-a") == []
+    assert index.find_similar(0b1011, 3) == [("b.jpg", 1)]
+
+def test_index_persists_and_reports_stale_entries(tmp_path):
+    index = ContentIndex(str(tmp_path / "content.json"))
+    index.add("a.jpg", "digest-a", None, 10, 1)
+    index.add("b.jpg", "digest-b", 7, 20, 2)
+    index.save()
+
+    reloaded = ContentIndex(str(tmp_path / "content.json"))
+    assert reloaded.get("b.jpg") == ("digest-b", 7, 20, 2)
+
+    missing, gone = reloaded.get_stale({"a.jpg": (10, 1), "b.jpg": (20, 5), "c.jpg": (30, 3)})
+    assert sorted(missing) == ["b.jpg", "c.jpg"]
+    assert gone == []
+    assert reloaded.get_stale({})[1] == ["a.jpg", "b.jpg"]
+
+def test_hash_image_file(tmp_path):
+    path = tmp_path / "photo.png"
+    _make_photo(3).save(path)
+
+    digest, dhash = hash_image_file(str(path))
+
+    assert digest == compute_file_digest(str(path))
+    assert dhash == compute_dhash(Image.open(path))
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import threading
+import numpy as np
+import pytest
+from inky.inky_e673 import Inky as InkySpectra
+from PIL import Image
+from src.config import Config
+from src.constants import DISPLAY_BACKEND_KEY, SIMULATED_DISPLAY_KEY, LAST_FRAME_FINGERPRINT_KEY
+from src.display_backend import PANEL_MODELS, SimulatedPanel, create_display_backend
+from src.display_manager import DisplayManager
+
+def _make_frame(size):
+    return Image.merge("RGB", [Image.linear_gradient("L").rotate(angle).resize(size) for angle in (0, 90, 180)])
+
+def test_simulated_panel_models():
+    assert {model: PANEL_MODELS[model].resolution for model in PANEL_MODELS} == {
+        "4": (640, 400), "5.7": (600, 448), "7.3": (800, 480), "13.3": (1600, 1200)
+    }
+    with pytest.raises(ValueError):
+        SimulatedPanel("9.7")
+
+def test_simulated_panel_quantizes_like_the_driver():
+    panel = SimulatedPanel("7.3", time_scale=0)
+    driver = InkySpectra()
+    frame = _make_frame((800, 480))
+
+    panel.set_image(frame)
+    driver.set_image(frame)
+
+    assert panel.get_palette(0.5) == driver._palette_blend(0.5)
+    # The Spectra driver remaps palette indices to its controller's colour codes
+    assert np.array_equal(driver.buf, np.array([0, 1, 2, 3, 5, 6])[panel.buf])
+    with pytest.raises(ValueError):
+        panel.set_image(_make_frame((640, 400)))
+
+def test_simulated_panel_is_busy_while_refreshing(tmp_path):
+    panel = SimulatedPanel("4", frame_folder=str(tmp_path), time_scale=0.01)
+    panel.set_image(_make_frame((640, 400)))
+
+    refresh = threading.Thread(target=panel.show)
+    refresh.start()
+    assert panel.busy.wait(timeout=1)
+    refresh.join()
+
+    assert not panel.is_busy()
+    assert panel.show_count == 1
+    assert sorted(os.listdir(tmp_path)) == ["frame_00001.png", "latest.png"]
+    assert Image.open(tmp_path / "latest.png").size == (640, 400)
+
+def test_simulated_panel_keeps_only_the_last_frames(tmp_path):
+    panel = SimulatedPanel("4", frame_folder=str(tmp_path), time_scale=0, kept_frames=2)
+    panel.set_image(_make_frame((640, 400)))
+    for _ in range(5):
+        panel.show()
+
+    assert sorted(os.listdir(tmp_path)) == ["frame_00004.png", "frame_00005.png", "latest.png"]
+
+def test_display_manager_runs_on_configured_simulated_panel(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(DISPLAY_BACKEND_KEY, "simulated", save=False)
+    config.set(SIMULATED_DISPLAY_KEY, {"model": "5.7", "time_scale": 0}, save=False)
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    source = tmp_path / "photo.png"
+    _make_frame((1200, 900)).save(source)
+
+    # Caches go to tmp_path instead of the source tree
+    display_manager = type("IsolatedDisplayManager", (DisplayManager,), {"BASE_DIR": str(tmp_path)})(config)
+    with Image.open(source) as image:
+        assert display_manager.display_image(image)
+
+    panel = display_manager.inky_display
+    assert isinstance(panel, SimulatedPanel)
+    assert panel.show_count == 1
+    assert panel.buf.shape == (448, 600)
+    assert len(np.unique(panel.buf)) > 2
+
+def test_display_manager_imports_without_panel_driver():
+    code = "import sys; import src.display_manager; print('inky' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == "False"
+
+def test_unknown_backend_is_rejected(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(DISPLAY_BACKEND_KEY, "hologram", save=False)
+    with pytest.raises(ValueError):
+        create_display_backend(config)
@@ -0,0 +1,193 @@
+import threading
+import pytest
+from flask import Flask
+from PIL import Image
+from src.blueprints import display as display_blueprint
+from src.config import Config
+from src.constants import (
+    RESOLUTION_KEY, LAST_FRAME_FINGERPRINT_KEY, IMAGE_FOLDER_KEY, HOSTNAME_KEY, IMAGE_SETTINGS_KEY,
+    REFRESH_MANAGER_KEY, DEFAULT_FRAME_STORE_FILE
+)
+from src.display_backend import DisplayBackend
+from src.display_manager import DisplayManager
+from src.image_manager import ImageManager
+from src.image_utils import compute_image_hash
+from src.refresh_manager import RefreshManager
+
+class FakePanel(DisplayBackend):
+    width, height = 64, 48
+
+    def __init__(self):
+        self.images = []
+        self.show_count = 0
+
+    def set_image(self, image):
+        self.images.append(image)
+
+    def show(self):
+        self.show_count += 1
+
+class FakeColourPanel(FakePanel):
+    def get_palette(self, saturation):
+        return [0, 0, 0, 255, 255, 255, 255, 0, 0]
+
+class FakePanelDisplayManager(DisplayManager):
+    panel_class = FakePanel
+
+    def initialize_display(self):
+        self.inky_display = self.panel_class()
+        self.config.set(RESOLUTION_KEY, [FakePanel.width, FakePanel.height], save=False)
+
+class FakeColourPanelDisplayManager(FakePanelDisplayManager):
+    panel_class = FakeColourPanel
+
+class SlowPanelDisplayManager(FakePanelDisplayManager):
+    """Panel whose detection blocks until the test lets it finish, or fails."""
+
+    def __init__(self, config, detected, error=None):
+        self.detected = detected
+        self.error = error
+        super().__init__(config, background=True)
+
+    def initialize_display(self):
+        self.detected.wait(5)
+        if self.error is not None:
+            raise self.error
+        super().initialize_display()
+
+def _isolated(manager_class, tmp_path):
+    """Subclass a manager so it keeps its caches under tmp_path instead of the source tree."""
+    return type(manager_class.__name__, (manager_class,), {"BASE_DIR": str(tmp_path)})
+
+def _make_display_manager(tmp_path, display_manager_class=None):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    config.save_config()
+    return _isolated(display_manager_class or FakePanelDisplayManager, tmp_path)(config)
+
+def test_image_hash_detects_pixel_changes():
+    frame = Image.new("RGB", (64, 48), color="white")
+    changed = frame.copy()
+    changed.putpixel((10, 10), (0, 0, 0))
+
+    assert compute_image_hash(frame) == compute_image_hash(frame.copy())
+    assert compute_image_hash(frame) != compute_image_hash(changed)
+    assert compute_image_hash(frame) != compute_image_hash(frame.convert("L"))
+
+def test_show_frame_skips_unchanged_frame(tmp_path):
+    display_manager = _make_display_manager(tmp_path)
+    frame = Image.new("RGB", (64, 48), color="white")
+
+    assert display_manager.show_frame(frame)
+    assert not display_manager.show_frame(frame.copy())
+    assert display_manager.inky_display.show_count == 1
+
+    assert display_manager.show_frame(Image.new("RGB", (64, 48), color="black"))
+    assert display_manager.inky_display.show_count == 2
+
+def test_show_frame_force_overrides_skip(tmp_path):
+    display_manager = _make_display_manager(tmp_path)
+    frame = Image.new("RGB", (64, 48), color="white")
+
+    display_manager.show_frame(frame)
+    assert display_manager.show_frame(frame, force=True)
+    assert display_manager.inky_display.show_count == 2
+
+def test_last_fingerprint_persists(tmp_path):
+    display_manager = _make_display_manager(tmp_path)
+    frame = Image.new("RGB", (64, 48), color="white")
+    display_manager.show_frame(frame)
+    display_manager.config.flush()
+
+    config = Config()
+    config.config_file = display_manager.config.config_file
+    config.config = config.load_config()
+    restarted = _isolated(FakePanelDisplayManager, tmp_path)(config)
+
+    assert not restarted.show_frame(frame)
+    assert restarted.inky_display.show_count == 0
+
+def test_colour_panel_receives_quantized_frames(tmp_path):
+    display_manager = _make_display_manager(tmp_path, FakeColourPanelDisplayManager)
+    assert display_manager.frame_store.path == str(tmp_path / DEFAULT_FRAME_STORE_FILE)
+    source = tmp_path / "red.png"
+    Image.new("RGB", (128, 96), color=(250, 10, 10)).save(source)
+
+    with Image.open(source) as image:
+        display_manager.display_image(image)
+    frame = display_manager.inky_display.images[-1]
+    assert frame.mode == "P"
+    assert max(range(3), key=frame.histogram().__getitem__) == 2
+    assert sum(frame.histogram()[3:]) == 0
+
+    with Image.open(source) as image:
+        cached = display_manager.render_frame(image)
+    assert cached.tobytes() == frame.tobytes()
+    assert cached.readonly
+
+def test_background_initialization_waits_for_the_panel(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    detected = threading.Event()
+    display_manager = _isolated(SlowPanelDisplayManager, tmp_path)(config, detected)
+
+    with pytest.raises(TimeoutError):
+        display_manager.wait_until_ready(timeout=0.05)
+    # Setting up the panel reads the settings, so changes before it is ready need no invalidation
+    config.set(IMAGE_SETTINGS_KEY, ["keep-width"], save=False)
+
+    detected.set()
+    display_manager.wait_until_ready(timeout=5)
+    assert display_manager.render_cache.settings[IMAGE_SETTINGS_KEY] == ["keep-width"]
+    assert display_manager.show_frame(Image.new("RGB", (64, 48), color="white"))
+
+def test_failed_background_initialization_is_reported(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    detected = threading.Event()
+    detected.set()
+    display_manager = _isolated(SlowPanelDisplayManager, tmp_path)(config, detected, error=OSError("No panel found"))
+
+    with pytest.raises(RuntimeError, match="No panel found"):
+        display_manager.wait_until_ready(timeout=5)
+    with pytest.raises(RuntimeError):
+        display_manager.show_frame(Image.new("RGB", (64, 48)))
+    # A settings change after a failed start must not touch the missing caches
+    config.set(IMAGE_SETTINGS_KEY, ["keep-width"], save=False)
+
+def test_web_requests_are_answered_while_the_panel_is_detected(tmp_path):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    Image.new("RGB", (16, 16)).save(image_folder / "image.png")
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    detected = threading.Event()
+    display_manager = _isolated(SlowPanelDisplayManager, tmp_path)(config, detected)
+    refresh_manager = RefreshManager(config, _isolated(ImageManager, tmp_path)(config), display_manager)
+    app = Flask(__name__)
+    app.config[REFRESH_MANAGER_KEY] = refresh_manager
+    app.register_blueprint(display_blueprint.bp)
+    client = app.test_client()
+    refresh_manager.start()
+
+    try:
+        response = client.post("/refresh_screen", headers={"Accept": "application/json"})
+        assert response.status_code == 202
+        status_url = response.get_json()["status_url"]
+        assert client.get(status_url).get_json()["state"] in ("queued", "running")
+        with pytest.raises(TimeoutError):
+            display_manager.wait_until_ready(timeout=0)
+
+        detected.set()
+        job = refresh_manager.jobs[response.get_json()["job_id"]]
+        assert job.done.wait(5)
+        assert client.get(status_url).get_json()["state"] == "done"
+        assert display_manager.inky_display.show_count >= 1
+    finally:
+        detected.set()
+        refresh_manager.stop()
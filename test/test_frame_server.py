@@ -0,0 +1,155 @@
+import io
+import os
+import threading
+import numpy as np
+import pytest
+from PIL import Image
+from waitress import create_server
+from src.config import Config
+from src.constants import (
+    IMAGE_FOLDER_KEY, HOSTNAME_KEY, LAST_FRAME_FINGERPRINT_KEY, ORIENTATION_KEY, FRAME_SERVER_PROFILES_KEY
+)
+from src.device_profile import DeviceProfile, load_profiles, settings_digest
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.frame_server import FrameServer, create_frame_server_app
+from src.image_manager import ImageManager
+from src.metrics import CACHE_LOOKUPS
+from src.remote_frames import RemoteFrameSource
+
+PROFILES = {"kitchen": {"panel": "7.3", "orientation": "portrait",
+                        "image_settings": {"brightness": 1, "contrast": 1.2, "saturation": 1.3, "sharpness": 1}}}
+
+def _isolated(manager_class, path):
+    return type(manager_class.__name__, (manager_class,), {"BASE_DIR": str(path)})
+
+def _make_library(tmp_path, count=3):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(count):
+        Image.new("RGB", (320, 240), color=(i * 80, 120, 200 - i * 60)).save(image_folder / f"image_{i}.png")
+    return image_folder
+
+def _make_frame_server(tmp_path, image_folder):
+    config = Config()
+    config.config_file = str(tmp_path / "server.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    config.set(FRAME_SERVER_PROFILES_KEY, PROFILES, save=False)
+    image_manager = _isolated(ImageManager, tmp_path / "server")(config)
+    return FrameServer(image_manager, load_profiles(config), str(tmp_path / "server" / "profiles"))
+
+def _make_device(tmp_path, name, image_folder, frame_source=None):
+    """Device set up like the kitchen profile, with a simulated panel."""
+    config = Config()
+    config.config_file = str(tmp_path / f"{name}.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    DeviceProfile.from_dict("kitchen", PROFILES["kitchen"]).apply(config)
+    panel = SimulatedPanel("7.3", time_scale=0)
+    return _isolated(DisplayManager, tmp_path / name)(config, panel, frame_source=frame_source), panel
+
+def _lookups(result):
+    return CACHE_LOOKUPS.labels("frame_server", result).get()
+
+def test_profile_settings_digest_ignores_number_types():
+    profile = DeviceProfile.from_dict("kitchen", PROFILES["kitchen"])
+
+    assert profile.resolution == (800, 480)
+    assert profile.settings_digest() == settings_digest(
+        [800, 480], "portrait", False, {"brightness": 1.0, "contrast": 1.2, "saturation": 1.3, "sharpness": 1.0})
+    assert profile.settings_digest() != settings_digest([800, 480], "landscape", False, profile.image_settings)
+    with pytest.raises(ValueError):
+        DeviceProfile.from_dict("hall", {"panel": "9.7"})
+    with pytest.raises(ValueError):
+        DeviceProfile.from_dict("hall", {"orientation": "sideways"})
+
+def test_frames_are_revalidated_with_etags(tmp_path):
+    image_folder = _make_library(tmp_path)
+    frame_server = _make_frame_server(tmp_path, image_folder)
+    client = create_frame_server_app(frame_server).test_client()
+    digest = DeviceProfile.from_dict("kitchen", PROFILES["kitchen"]).settings_digest()
+    renders = []
+    render = frame_server.render
+    frame_server.render = lambda *args: renders.append(args) or render(*args)
+
+    response = client.get(f"/api/frames/kitchen/image_0.png?settings={digest}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    with Image.open(image_folder / "image_0.png") as image:
+        expected = frame_server.display_managers["kitchen"].render_frame(image)
+    with Image.open(io.BytesIO(response.data)) as frame:
+        assert frame.mode == "P" and frame.size == (800, 480)
+        assert np.array_equal(np.asarray(frame), np.asarray(expected))
+
+    response = client.get("/api/frames/kitchen/image_0.png", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert len(renders) == 1
+
+    Image.new("RGB", (320, 240), color="white").save(image_folder / "image_0.png")
+    os.utime(image_folder / "image_0.png", ns=(10**18, 10**18))
+    response = client.get("/api/frames/kitchen/image_0.png", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    assert client.get("/api/frames/kitchen/missing.png").status_code == 404
+    assert client.get("/api/frames/hall/image_0.png").status_code == 404
+    assert client.get("/api/frames/kitchen/image_0.png?settings=0123456789abcdef").status_code == 409
+    assert client.get("/api/profiles").get_json()["profiles"][0]["settings_digest"] == digest
+
+def test_device_pulls_frames_and_renders_locally_without_the_server(tmp_path):
+    image_folder = _make_library(tmp_path)
+    frame_server = _make_frame_server(tmp_path, image_folder)
+    server = create_server(create_frame_server_app(frame_server), host="127.0.0.1", port=0, threads=2)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    frame_source = RemoteFrameSource(f"http://127.0.0.1:{server.effective_port}", "kitchen",
+                                     str(tmp_path / "device" / "remote"), 16 * 1024 * 1024,
+                                     timeout=5, retry_seconds=60)
+    device, panel = _make_device(tmp_path, "device", image_folder, frame_source)
+    reference, _ = _make_device(tmp_path, "reference", image_folder)
+    local_renders = []
+    render = device._render
+    device._render = lambda *args: local_renders.append(args) or render(*args)
+
+    def expected_frame(name):
+        with Image.open(image_folder / name) as image:
+            return np.asarray(reference.render_frame(image))
+
+    fetched, not_modified, unavailable = _lookups("fetched"), _lookups("not_modified"), _lookups("unavailable")
+    try:
+        with Image.open(image_folder / "image_0.png") as image:
+            assert device.display_image(image)
+        assert panel.show_count == 1
+        assert np.array_equal(panel.buf, expected_frame("image_0.png"))
+        assert _lookups("fetched") == fetched + 1
+
+        # Pulled again, the frame the device already holds is revalidated instead of sent
+        with Image.open(image_folder / "image_0.png") as image:
+            assert device.display_image(image, force=True)
+        assert _lookups("not_modified") == not_modified + 1
+        assert np.array_equal(panel.buf, expected_frame("image_0.png"))
+        assert not local_renders
+
+        # Settings that no longer match the profile are rendered locally
+        device.config.set(ORIENTATION_KEY, "landscape", save=False)
+        with Image.open(image_folder / "image_1.png") as image:
+            device.render_frame(image)
+        assert len(local_renders) == 1
+        device.config.set(ORIENTATION_KEY, "portrait", save=False)
+    finally:
+        server.close()
+        thread.join(timeout=5)
+
+    with Image.open(image_folder / "image_2.png") as image:
+        assert device.display_image(image)
+    assert np.array_equal(panel.buf, expected_frame("image_2.png"))
+    assert len(local_renders) == 2
+    assert _lookups("unavailable") == unavailable + 1
+
+    # Within the retry period the server isn't tried again
+    with Image.open(image_folder / "image_0.png") as image:
+        device.render_frame(image)
+    assert _lookups("unavailable") == unavailable + 2
@@ -0,0 +1,55 @@
+import numpy as np
+from PIL import Image
+from src.frame_store import FrameStore
+
+PALETTE = [0, 0, 0, 255, 255, 255, 255, 0, 0]
+
+def _make_frame(value, size=(32, 24)):
+    frame = Image.new("P", size, value)
+    frame.putpalette(PALETTE)
+    return frame
+
+def test_frame_store_returns_views_of_stored_frames(tmp_path):
+    store = FrameStore(str(tmp_path / "frames.bin"), 32, 24, 2)
+
+    assert store.put("a", _make_frame(2))
+    frame = store.get("a", PALETTE)
+
+    assert frame.mode == "P"
+    assert frame.getpixel((5, 5)) == 2
+    assert frame.convert("RGB").getpixel((5, 5)) == (255, 0, 0)
+    store.frames[store.keys["a"]][5, 5] = 1
+    assert frame.getpixel((5, 5)) == 1
+    assert store.get("missing", PALETTE) is None
+
+def test_frame_store_reuses_least_recently_used_slot(tmp_path):
+    store = FrameStore(str(tmp_path / "frames.bin"), 32, 24, 2)
+    store.put("a", _make_frame(0))
+    store.put("b", _make_frame(1))
+    store.get("a", PALETTE)
+
+    store.put("c", _make_frame(2))
+
+    assert "a" in store and "c" in store
+    assert "b" not in store
+    assert not store.put("wrong-size", _make_frame(0, size=(16, 16)))
+    assert not store.put("wrong-mode", Image.new("RGB", (32, 24)))
+
+def test_frame_store_persists_and_resets_on_layout_change(tmp_path):
+    path = str(tmp_path / "frames.bin")
+    store = FrameStore(path, 32, 24, 2)
+    store.put("a", _make_frame(1))
+    store.put("b", _make_frame(2))
+    store.get("a", PALETTE)
+    store.close()
+
+    reopened = FrameStore(path, 32, 24, 2)
+    assert np.asarray(reopened.get("b", PALETTE)).max() == 2
+    reopened.put("c", _make_frame(0))
+    assert "a" not in reopened
+
+    resized = FrameStore(path, 48, 24, 2)
+    assert not resized.keys
+    resized.put("d", _make_frame(1, size=(48, 24)))
+    resized.clear()
+    assert "d" not in FrameStore(path, 48, 24, 2)
@@ -0,0 +1,66 @@
+import os
+from flask import Flask
+from PIL import Image
+from src.blueprints import gallery
+from src.config import Config
+from src.constants import IMAGE_MANAGER_KEY, IMAGE_FOLDER_KEY, HOSTNAME_KEY
+from src.image_manager import ImageManager
+
+def _make_client(tmp_path, sizes):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i, size in enumerate(sizes):
+        Image.new("RGB", size).save(image_folder / f"image_{i:02d}.png")
+        os.utime(image_folder / f"image_{i:02d}.png", ns=(i * 10**9, i * 10**9))
+
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+
+    app = Flask(__name__)
+    app.config[IMAGE_MANAGER_KEY] = type("IsolatedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path)})(config)
+    app.register_blueprint(gallery.bp)
+    return app.test_client()
+
+def test_list_images_paginates_with_cursor(tmp_path):
+    client = _make_client(tmp_path, [(8, 8)] * 5)
+
+    first = client.get("/api/images?limit=2&sort=name").get_json()
+    assert [image["name"] for image in first["images"]] == ["image_00.png", "image_01.png"]
+    assert first["total"] == 5
+    assert first["next_cursor"] == "2"
+
+    names = [image["name"] for image in first["images"]]
+    cursor = first["next_cursor"]
+    while cursor is not None:
+        page = client.get(f"/api/images?limit=2&sort=name&cursor={cursor}").get_json()
+        names += [image["name"] for image in page["images"]]
+        cursor = page["next_cursor"]
+
+    assert names == [f"image_{i:02d}.png" for i in range(5)]
+
+def test_list_images_sorts_by_size(tmp_path):
+    client = _make_client(tmp_path, [(8, 8), (64, 64), (16, 16)])
+
+    page = client.get("/api/images?sort=size&order=desc").get_json()
+
+    assert [image["name"] for image in page["images"]] == ["image_01.png", "image_02.png", "image_00.png"]
+    assert page["images"][0]["size"] > page["images"][-1]["size"]
+    assert page["next_cursor"] is None
+
+def test_list_images_defaults_to_display_order(tmp_path):
+    client = _make_client(tmp_path, [(8, 8)] * 3)
+
+    page = client.get("/api/images").get_json()
+
+    assert page["total"] == 3
+    assert page["current_image"] == page["images"][0]["name"]
+
+def test_list_images_rejects_invalid_arguments(tmp_path):
+    client = _make_client(tmp_path, [(8, 8)])
+
+    assert client.get("/api/images?limit=0").status_code == 400
+    assert client.get("/api/images?limit=10000").status_code == 400
+    assert client.get("/api/images?cursor=abc").status_code == 400
+    assert client.get("/api/images?sort=colour").status_code == 400
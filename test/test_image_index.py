@@ -0,0 +1,133 @@
+import os
+import pytest
+from PIL import Image
+from src.image_index import ImageIndex
+
+EXTENSIONS = (".png", ".jpg")
+OLD_MTIME_NS = 1_000_000_000_000_000_000
+
+def _make_image(folder, name):
+    Image.new("RGB", (4, 4)).save(os.path.join(folder, name))
+
+def _age_folder(folder):
+    os.utime(folder, ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+
+def _make_index(tmp_path, use_inotify):
+    folder = tmp_path / "images"
+    folder.mkdir(exist_ok=True)
+    return ImageIndex(str(folder), EXTENSIONS, str(tmp_path / "index.json"), use_inotify=use_inotify)
+
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_index_tracks_added_and_removed_files(tmp_path, use_inotify):
+    index = _make_index(tmp_path, use_inotify)
+    _make_image(index.folder, "a.png")
+    (tmp_path / "images" / "notes.txt").write_text("not an image")
+
+    assert index.refresh()
+    assert index.names() == ["a.png"]
+
+    _make_image(index.folder, "b.jpg")
+    os.remove(os.path.join(index.folder, "a.png"))
+
+    assert index.refresh()
+    assert index.names() == ["b.jpg"]
+    assert not index.refresh()
+    index.close()
+
+def test_index_skips_rescan_when_folder_unchanged(tmp_path):
+    index = _make_index(tmp_path, use_inotify=False)
+    _make_image(index.folder, "a.png")
+    _age_folder(index.folder)
+    index.refresh()
+
+    scans = []
+    index._rescan = lambda dir_mtime_ns: scans.append(dir_mtime_ns)
+
+    assert not index.refresh()
+    assert scans == []
+
+def test_notify_hooks_avoid_rescan(tmp_path):
+    index = _make_index(tmp_path, use_inotify=False)
+    _make_image(index.folder, "a.png")
+    _age_folder(index.folder)
+    index.refresh()
+
+    scans = []
+    index._rescan = lambda dir_mtime_ns: scans.append(dir_mtime_ns)
+
+    _make_image(index.folder, "b.png")
+    index.notify_added("b.png")
+    os.remove(os.path.join(index.folder, "a.png"))
+    index.notify_removed("a.png")
+
+    assert not index.refresh()
+    assert scans == []
+    assert index.names() == ["b.png"]
+
+def test_index_persists_between_instances(tmp_path):
+    index = _make_index(tmp_path, use_inotify=False)
+    _make_image(index.folder, "a.png")
+    _make_image(index.folder, "b.png")
+    _age_folder(index.folder)
+    index.refresh()
+
+    reloaded = _make_index(tmp_path, use_inotify=False)
+    reloaded._rescan = lambda dir_mtime_ns: pytest.fail("persisted index should not be rescanned")
+
+    assert sorted(reloaded.names()) == ["a.png", "b.png"]
+    assert not reloaded.refresh()
+
+def test_index_rescans_after_offline_changes(tmp_path):
+    index = _make_index(tmp_path, use_inotify=True)
+    _make_image(index.folder, "a.png")
+    _age_folder(index.folder)
+    index.refresh()
+    index.close()
+
+    _make_image(index.folder, "b.png")
+
+    reloaded = _make_index(tmp_path, use_inotify=True)
+    assert reloaded.refresh()
+    assert sorted(reloaded.names()) == ["a.png", "b.png"]
+    reloaded.close()
+
+def test_index_uses_inotify_events(tmp_path):
+    index = _make_index(tmp_path, use_inotify=True)
+    index.refresh()
+    if index.watcher is None:
+        pytest.skip("inotify is not available")
+
+    index._rescan = lambda dir_mtime_ns: pytest.fail("inotify updates should not rescan")
+    _make_image(index.folder, "a.png")
+    os.rename(os.path.join(index.folder, "a.png"), os.path.join(index.folder, "c.png"))
+
+    assert index.refresh()
+    assert index.names() == ["c.png"]
+    index.close()
+
+def test_scan_indexes_new_images_in_name_order(tmp_path):
+    index = _make_index(tmp_path, use_inotify=False)
+    for name in ("c.png", "B.png", "a.png", "b.png"):
+        _make_image(index.folder, name)
+
+    assert index.refresh()
+    assert index.names() == ["a.png", "B.png", "b.png", "c.png"]
+    index.close()
+
+def test_changes_since_replays_additions_and_removals(tmp_path):
+    index = _make_index(tmp_path, use_inotify=False)
+    for name in ("a.png", "b.png"):
+        _make_image(index.folder, name)
+    version = index.version
+    index.notify_added_many(["a.png", "b.png"])
+    os.remove(os.path.join(index.folder, "a.png"))
+    index.notify_removed_many(["a.png", "missing.png"])
+
+    assert index.changes_since(version) == [(("a.png", "b.png"), ()), ((), ("a.png",))]
+    assert index.changes_since(index.version) == []
+
+    for i in range(ImageIndex.CHANGE_LOG_SIZE):
+        _make_image(index.folder, f"image_{i}.png")
+        index.notify_added_many([f"image_{i}.png"])
+    assert index.changes_since(version) is None
+    index.close()
@@ -1,20 +1,31 @@
 import os
-from src.constants import HOSTNAME_KEY, LOCAL_IP_KEY
+import threading
+import time
+from PIL import Image
+from src.constants import HOSTNAME_KEY, LOCAL_IP_KEY, IMAGE_FOLDER_KEY, CURRENT_IMAGE_KEY, CURRENT_IMAGE_INDEX_KEY
 from src.config import Config
 from src.image_manager import ImageManager
 
-def test_image_manager_loads():
+def _isolated_image_manager(tmp_path, config):
+    """Image manager whose indexes are kept under tmp_path instead of the installation folder."""
+    return type("IsolatedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path)})(config)
+
+def test_image_manager_loads(tmp_path):
     config = Config()
-    config.set(HOSTNAME_KEY, "Hello Pidash!")
-    _ = ImageManager(config=config)
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(tmp_path / "images"), save=False)
+    config.set(HOSTNAME_KEY, "Hello Pidash!", save=False)
+    _ = _isolated_image_manager(tmp_path, config)
 
-def test_create_image():
+def test_create_image(tmp_path):
     config = Config()
-    config.set(HOSTNAME_KEY, "Pidash")
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(tmp_path / "images"), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
 
     assert config.get(HOSTNAME_KEY) == "Pidash"
 
-    image_manager = ImageManager(config=config)
+    image_manager = _isolated_image_manager(tmp_path, config)
 
     default_landscape = image_manager.default_image_landscape_path
     default_portrait = image_manager.default_image_portrait_path
@@ -28,14 +39,129 @@ def test_create_image():
     default_landscape_name = os.path.basename(default_landscape)
     default_portrait_name = os.path.basename(default_portrait)
 
-    assert default_landscape_name == "default_landscape.png"
-    assert default_portrait_name == "default_portrait.png"
+    assert default_landscape_name.startswith("default_landscape-") and default_landscape_name.endswith(".png")
+    assert default_portrait_name.startswith("default_portrait-") and default_portrait_name.endswith(".png")
+
+    assert default_landscape_name not in image_manager.get_image_names()
+    assert default_portrait_name not in image_manager.get_image_names()
+
+def test_default_images_are_reused_until_their_text_changes(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = _isolated_image_manager(tmp_path, config)
+    output_dir = tmp_path / "splash"
+    output_dir.mkdir()
+    (output_dir / "default_landscape.png").write_bytes(b"unhashed image from an older version")
+
+    landscape, portrait = image_manager.create_default_image("Pidash", "Visit: http://pidash", str(output_dir))
+    assert sorted(os.listdir(output_dir)) == sorted([os.path.basename(landscape), os.path.basename(portrait)])
+    with Image.open(landscape) as image:
+        assert image.size == (800, 400)
+
+    mtime = os.stat(landscape).st_mtime_ns
+    assert image_manager.create_default_image("Pidash", "Visit: http://pidash", str(output_dir)) == (landscape, portrait)
+    assert os.stat(landscape).st_mtime_ns == mtime
+
+    renamed = image_manager.create_default_image("Frame", "Visit: http://frame", str(output_dir))
+    assert renamed != (landscape, portrait)
+    assert sorted(os.listdir(output_dir)) == sorted(os.path.basename(path) for path in renamed)
+
+def test_remove_images_updates_the_indexes_once(tmp_path, monkeypatch):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(5):
+        Image.new("RGB", (8, 8)).save(image_folder / f"image_{i}.png")
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = _isolated_image_manager(tmp_path, config)
+    saves = []
+    monkeypatch.setattr(image_manager.image_index, "_save", lambda: saves.append("image"))
+    monkeypatch.setattr(image_manager.content_index, "save", lambda: saves.append("content"))
+    published = image_manager.snapshot.playlist
+
+    assert image_manager.remove_images(["image_1.png", "missing.png", "image_3.png"]) == [True, False, True]
+
+    assert sorted(saves) == ["content", "image"]
+    assert sorted(image_manager.get_image_names()) == ["image_0.png", "image_2.png", "image_4.png"]
+    # Readers still holding the earlier snapshot keep seeing it whole
+    assert published.names() == [f"image_{i}.png" for i in range(5)]
+    assert sorted(os.listdir(image_folder)) == sorted(image_manager.get_image_names() + ["default"])
+
+def test_current_image_is_restored_by_name(tmp_path):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(5):
+        Image.new("RGB", (8, 8)).save(image_folder / f"image_{i}.png")
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = _isolated_image_manager(tmp_path, config)
+
+    assert image_manager.get_image_names() == [f"image_{i}.png" for i in range(5)]
+    assert image_manager.set_current_image("image_3.png")
+    assert config.get(CURRENT_IMAGE_KEY) == "image_3.png"
+
+    # A position saved before the images ahead of it were removed points at the wrong image
+    config.set(CURRENT_IMAGE_INDEX_KEY, 0, save=False)
+    restarted = type("RestartedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path / "restarted")})(config)
+
+    assert restarted.get_current_image_name() == "image_3.png"
+    assert restarted.get_relative_image_path(1) == str(image_folder / "image_4.png")
+
+def test_readers_see_consistent_snapshots_during_rescans(tmp_path):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(20):
+        Image.new("RGB", (8, 8)).save(image_folder / f"image_{i:02}.png")
+    source = tmp_path / "source.png"
+    Image.new("RGB", (8, 8)).save(source)
+
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = _isolated_image_manager(tmp_path, config)
+    image_manager.set_current_image("image_19.png")
+
+    errors = []
+    reads = [0]
+    stop = threading.Event()
 
-    assert "default_landscape.png" not in image_manager.get_image_names()
-    assert "default_portrait.png" not in image_manager.get_image_names()
+    def read():
+        try:
+            while not stop.is_set():
+                snapshot = image_manager.snapshot
+                assert snapshot.playlist.name_at(snapshot.playlist.resolve(snapshot.current_index)) is not None
+                assert image_manager.get_current_image_name() is not None
+                assert image_manager.get_relative_image_path(1) is not None
+                assert image_manager.get_image_page(0, 5)[1] >= 10
+                reads[0] += 1
+        except Exception as e:
+            errors.append(e)
 
-    os.remove(default_landscape)
-    os.remove(default_portrait)
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    deadline = time.monotonic() + 1.0
+    round_number = 0
+    while time.monotonic() < deadline:
+        # Shrink the library below the current position, then grow it back
+        names = [f"image_{i:02}.png" for i in range(10, 20)]
+        image_manager.remove_images(names)
+        for name in names:
+            image_manager.add_image(str(source), name)
+        (image_folder / f"external_{round_number}.png").write_bytes(source.read_bytes())
+        image_manager.refresh_image_list()
+        image_manager.move_current_image(round_number)
+        round_number += 1
+    stop.set()
+    for reader in readers:
+        reader.join()
 
-    del config.config[HOSTNAME_KEY]
-    config.save_config()
+    assert not errors
+    assert reads[0] > 0
+    assert round_number > 1
@@ -0,0 +1,165 @@
+import itertools
+import random
+import numpy as np
+from inky.inky_e673 import Inky as InkySpectra
+from inky.inky_uc8159 import Inky as InkyUC8159
+from PIL import Image, ImageChops, ImageEnhance, ImageStat
+from src.image_utils import (
+    get_decode_size, reduce_for_display, change_orientation, resize_image, apply_image_enhancement,
+    quantize_to_palette, plan_transform, apply_transform
+)
+
+def _make_jpeg(tmp_path, size=(3200, 2400)):
+    path = tmp_path / "large.jpg"
+    Image.radial_gradient("L").resize(size).convert("RGB").save(path, quality=95)
+    return path
+
+def test_decode_size_covers_crop_window():
+    assert get_decode_size((6000, 4000), (800, 480), "landscape") == (800, 534)
+    assert get_decode_size((6000, 4000), (800, 480), "portrait") == (1200, 800)
+    assert get_decode_size((4000, 6000), (800, 480), "landscape") == (800, 1200)
+
+def test_decode_size_never_upscales():
+    assert get_decode_size((640, 400), (800, 480), "landscape") == (640, 400)
+
+def test_reduce_for_display_uses_jpeg_draft(tmp_path):
+    path = _make_jpeg(tmp_path)
+
+    with Image.open(path) as image:
+        reduced = reduce_for_display(image, (800, 480), "landscape")
+        assert reduced.size == (800, 600)
+        reduced.load()
+        assert reduced.size == (800, 600)
+
+def test_reduce_for_display_ignores_non_jpeg(tmp_path):
+    path = tmp_path / "large.png"
+    Image.new("RGB", (3200, 2400)).save(path)
+
+    with Image.open(path) as image:
+        assert reduce_for_display(image, (800, 480), "landscape").size == (3200, 2400)
+
+def test_reduced_decode_matches_full_decode(tmp_path):
+    path = _make_jpeg(tmp_path)
+
+    for orientation in ("landscape", "portrait"):
+        with Image.open(path) as image:
+            full = resize_image(change_orientation(image, orientation), (800, 480))
+        with Image.open(path) as image:
+            reduced = resize_image(change_orientation(reduce_for_display(image, (800, 480), orientation), orientation), (800, 480))
+
+        assert reduced.size == full.size == (800, 480)
+        difference = ImageStat.Stat(ImageChops.difference(full, reduced)).mean
+        assert max(difference) < 2.0
+
+def _reference_transform(image, desired_size, orientation, inverted, image_settings):
+    frame = resize_image(change_orientation(image, orientation), desired_size, image_settings)
+    return frame.rotate(180) if inverted else frame
+
+def _make_smooth_photo(size):
+    # Smooth colour fields like a photograph, without the pixel noise that makes LANCZOS overshoot clip
+    pixels = random.Random(size[0] * size[1]).randbytes(16 * 12 * 3)
+    return Image.frombytes("RGB", (16, 12), pixels).resize(size, Image.Resampling.BICUBIC)
+
+def test_transform_matches_rotate_crop_resize_chain():
+    for source_size in ((1200, 900), (900, 1200), (801, 481), (333, 777), (500, 500)):
+        source = _make_smooth_photo(source_size)
+        for desired_size, orientation, inverted, image_settings in itertools.product(
+                ((800, 480), (640, 400)), ("landscape", "portrait"), (False, True), ([], ["keep-width"])):
+            plan = plan_transform(source.size, desired_size, orientation, inverted, image_settings)
+            frame = apply_transform(source, plan)
+            reference = _reference_transform(source, desired_size, orientation, inverted, image_settings)
+            case = (source_size, desired_size, orientation, inverted, image_settings)
+
+            assert frame.size == reference.size == desired_size, case
+            difference = ImageChops.difference(frame, reference)
+            assert max(high for _, high in difference.getextrema()) <= 2, case
+            assert max(ImageStat.Stat(difference).mean) < 0.1, case
+
+def test_transform_avoids_full_size_copies():
+    source = _make_photo((2000, 1500))
+    stats = Image.core.get_stats()
+    apply_transform(source, plan_transform(source.size, (800, 480), "portrait", True))
+    transform_images = Image.core.get_stats()["new_count"] - stats["new_count"]
+
+    stats = Image.core.get_stats()
+    _reference_transform(source, (800, 480), "portrait", True, [])
+    chain_images = Image.core.get_stats()["new_count"] - stats["new_count"]
+
+    assert transform_images < chain_images
+
+def _make_photo(size=(320, 240)):
+    noise = Image.effect_noise(size, 48)
+    gradient = Image.radial_gradient("L").resize(size)
+    return Image.merge("RGB", [noise, gradient, ImageChops.invert(gradient)])
+
+def _reference_enhancement(img, settings):
+    img = ImageEnhance.Brightness(img).enhance(settings.get("brightness", 1.0))
+    img = ImageEnhance.Contrast(img).enhance(settings.get("contrast", 1.0))
+    img = ImageEnhance.Color(img).enhance(settings.get("saturation", 1.0))
+    return ImageEnhance.Sharpness(img).enhance(settings.get("sharpness", 1.0))
+
+def test_enhancement_skips_identity_factors():
+    image = _make_photo()
+    settings = {"brightness": 1.0, "contrast": 1.0, "saturation": 1.0, "sharpness": 1.0}
+
+    assert apply_image_enhancement(image, settings) is image
+
+def test_brightness_enhancement_is_exact():
+    image = _make_photo()
+    settings = {"brightness": 1.3}
+
+    assert apply_image_enhancement(image, settings).tobytes() == _reference_enhancement(image, settings).tobytes()
+
+def test_fused_enhancement_matches_image_enhance():
+    image = _make_photo()
+
+    for brightness, contrast, saturation, sharpness in itertools.product((0.5, 1.2, 2.0), (0.5, 1.0, 1.8), (0.0, 1.0, 1.7), (1.0, 2.0)):
+        settings = {"brightness": brightness, "contrast": contrast, "saturation": saturation, "sharpness": sharpness}
+        difference = ImageChops.difference(apply_image_enhancement(image, settings), _reference_enhancement(image, settings))
+
+        assert max(high for _, high in difference.getextrema()) <= 2, settings
+        assert max(ImageStat.Stat(difference).mean) < 1.0, settings
+
+def test_fused_enhancement_handles_greyscale_and_other_modes():
+    settings = {"brightness": 1.1, "contrast": 1.4, "saturation": 0.5, "sharpness": 1.0}
+    greyscale = Image.radial_gradient("L")
+    difference = ImageChops.difference(apply_image_enhancement(greyscale, settings), _reference_enhancement(greyscale, settings))
+    assert difference.getextrema()[1] <= 1
+
+    rgba = _make_photo().convert("RGBA")
+    assert apply_image_enhancement(rgba, settings).tobytes() == _reference_enhancement(rgba, settings).tobytes()
+
+def _make_frame(size):
+    # Colour gradients plus a pure black corner, which the driver maps to its zero padding
+    bands = [Image.linear_gradient("L").rotate(angle).resize(size) for angle in (0, 90, 180)]
+    frame = Image.merge("RGB", bands)
+    frame.paste((0, 0, 0), (0, 0, 16, 16))
+    return frame
+
+def test_quantized_frame_matches_driver_quantization():
+    for panel in (InkyUC8159(resolution=(600, 448)), InkySpectra()):
+        frame = _make_frame((panel.width, panel.height))
+        panel.set_image(frame)
+        expected = panel.buf.copy()
+
+        quantized = quantize_to_palette(frame, panel._palette_blend(0.5))
+        panel.set_image(quantized)
+
+        assert quantized.mode == "P"
+        assert np.array_equal(panel.buf, expected)
+
+def test_ordered_dither_maps_to_panel_colours():
+    palette = InkyUC8159._palette_blend(InkyUC8159.__new__(InkyUC8159), 0.5)
+    colours = [tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)]
+    frame = Image.new("RGB", (40, 24), colours[2])
+    frame.paste(colours[4], (20, 0, 40, 24))
+
+    quantized = quantize_to_palette(frame, palette, dither="ordered")
+    assert set(np.asarray(quantized)[:, :20].flat) == {2}
+    assert set(np.asarray(quantized)[:, 20:].flat) == {4}
+
+    gradient = _make_frame((64, 48))
+    ordered = quantize_to_palette(gradient, palette, dither="ordered")
+    assert np.asarray(ordered).max() < len(colours)
+    original_mean = np.asarray(gradient, dtype=np.float32).mean()
+    assert abs(np.asarray(ordered.convert("RGB"), dtype=np.float32).mean() - original_mean) < 20
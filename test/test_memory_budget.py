@@ -0,0 +1,140 @@
+import io
+import time
+import threading
+import pytest
+from PIL import Image
+from src.config import Config
+from src.constants import IMAGE_FOLDER_KEY, HOSTNAME_KEY, RESOLUTION_KEY, LAST_FRAME_FINGERPRINT_KEY
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.image_manager import ImageManager
+from src.memory_budget import MEMORY_BUDGET, MemoryBudget, estimate_file_bytes, estimate_image_bytes
+from src.upload_manager import UploadManager
+
+@pytest.fixture
+def memory_budget():
+    limit = MEMORY_BUDGET.limit
+    yield MEMORY_BUDGET
+    MEMORY_BUDGET.set_limit(limit)
+
+def test_acquire_waits_until_budget_is_released():
+    budget = MemoryBudget(100)
+    budget.acquire(60)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(budget.acquire(50)))
+    waiter.start()
+
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+    with pytest.raises(TimeoutError):
+        budget.acquire(50, timeout=0.01)
+
+    budget.release(60)
+    waiter.join(timeout=5)
+    assert acquired == [50]
+    assert budget.in_use == 50
+    assert budget.peak == 60
+    assert budget.waits == 1
+
+def test_oversized_reservation_runs_alone():
+    budget = MemoryBudget(100)
+    budget.acquire(10)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(budget.acquire(500)))
+    waiter.start()
+
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+    budget.release(10)
+    waiter.join(timeout=5)
+
+    assert acquired == [100]
+    assert budget.peak == 100
+
+def test_large_jpeg_is_decoded_smaller_to_fit(tmp_path):
+    Image.new("RGB", (2000, 1000), color="red").save(tmp_path / "large.jpg")
+    budget = MemoryBudget(estimate_image_bytes((2000, 1000), "RGB") // 4)
+
+    with Image.open(tmp_path / "large.jpg") as image:
+        with budget.reserve_image(image) as reserved:
+            image.load()
+            assert image.size == (1000, 500)
+            assert reserved <= budget.limit
+
+def test_budget_holds_under_concurrent_uploads_and_refreshes(tmp_path, memory_budget):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(6):
+        Image.new("RGB", (1600, 1200), color=(i * 40, 80, 160)).save(image_folder / f"photo_{i}.png")
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    panel = SimulatedPanel("7.3", time_scale=0)
+    config.set(RESOLUTION_KEY, [panel.width, panel.height], save=False)
+    display_manager = type("IsolatedDisplayManager", (DisplayManager,), {"BASE_DIR": str(tmp_path)})(config, panel)
+    image_manager = type("IsolatedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path)})(config)
+    upload_manager = UploadManager(image_manager, str(tmp_path / "staging"), 2, 5)
+
+    # Room for one render and one upload being verified, not for everything at once
+    render_bytes = estimate_file_bytes(str(image_folder / "photo_0.png"), copies=2)
+    memory_budget.set_limit(render_bytes * 1.5)
+    memory_budget.reset_peak()
+    waits_before = memory_budget.waits
+    in_flight, max_in_flight = [0], [0]
+    lock = threading.Lock()
+    acquire, release = memory_budget.acquire, memory_budget.release
+
+    def tracked_acquire(nbytes, timeout=None):
+        reserved = acquire(nbytes, timeout)
+        with lock:
+            in_flight[0] += reserved
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+        return reserved
+
+    def tracked_release(nbytes):
+        with lock:
+            in_flight[0] -= nbytes
+        release(nbytes)
+
+    memory_budget.acquire, memory_budget.release = tracked_acquire, tracked_release
+    errors = []
+
+    def refresh(i):
+        try:
+            with Image.open(image_folder / f"photo_{i}.png") as image:
+                display_manager.render_frame(image)
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        files = []
+        for i in range(4):
+            buffer = io.BytesIO()
+            Image.new("RGB", (1600, 1200), color=(200, i * 50, 0)).save(buffer, format="PNG")
+            staged_path = upload_manager.create_staging_file()
+            with open(staged_path, "wb") as f:
+                f.write(buffer.getvalue())
+            files.append((staged_path, f"upload_{i}.png"))
+        job_id = upload_manager.submit(files)
+
+        threads = [threading.Thread(target=refresh, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        deadline = time.monotonic() + 60
+        while upload_manager.get_job(job_id)["state"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        upload_manager.shutdown()
+        del memory_budget.acquire, memory_budget.release
+
+    assert not errors
+    assert len(upload_manager.get_job(job_id)["added"]) == 4
+    assert 0 < max_in_flight[0] <= memory_budget.limit
+    assert memory_budget.peak <= memory_budget.limit
+    assert memory_budget.waits > waits_before
+    assert memory_budget.in_use == 0
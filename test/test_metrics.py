@@ -0,0 +1,65 @@
+from flask import Flask
+from PIL import Image
+from src.blueprints import metrics as metrics_blueprint
+from src.config import Config
+from src.constants import RESOLUTION_KEY, LAST_FRAME_FINGERPRINT_KEY
+from src.display_backend import SimulatedPanel
+from src.display_manager import DisplayManager
+from src.metrics import MetricsRegistry, PIPELINE_STAGE_SECONDS, DISPLAY_UPDATES
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test latencies.", ("stage",), buckets=(0.1, 1.0))
+    histogram.labels("resize").observe(0.05)
+    histogram.labels("resize").observe(0.5)
+    histogram.labels("resize").observe(5)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{stage="resize",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="resize",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="resize",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="resize"} 5.55' in lines
+    assert 'test_seconds_count{stage="resize"} 3' in lines
+
+def test_counters_and_gauges_render_with_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test events.", ("result",))
+    counter.labels("hit").inc()
+    counter.labels("hit").inc(2)
+    registry.gauge("test_depth", "Test depth.").set_function(lambda: 4)
+
+    assert registry.counter("test_total", "Test events.", ("result",)) is counter
+    lines = registry.render().splitlines()
+    assert 'test_total{result="hit"} 3' in lines
+    assert "test_depth 4" in lines
+
+def test_display_pipeline_is_measured(tmp_path):
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(LAST_FRAME_FINGERPRINT_KEY, None, save=False)
+    panel = SimulatedPanel("7.3", time_scale=0)
+    config.set(RESOLUTION_KEY, [panel.width, panel.height], save=False)
+    display_manager = type("IsolatedDisplayManager", (DisplayManager,), {"BASE_DIR": str(tmp_path)})(config, panel)
+    Image.new("RGB", (1200, 900), color=(200, 30, 30)).save(tmp_path / "photo.png")
+    transform = PIPELINE_STAGE_SECONDS.labels("transform")
+    transformed_before = sum(transform.snapshot()[0])
+    skipped_before = DISPLAY_UPDATES.labels("skipped").get()
+
+    with Image.open(tmp_path / "photo.png") as image:
+        assert display_manager.display_image(image)
+    with Image.open(tmp_path / "photo.png") as image:
+        assert not display_manager.display_image(image)
+
+    assert sum(transform.snapshot()[0]) == transformed_before + 1
+    assert DISPLAY_UPDATES.labels("skipped").get() == skipped_before + 1
+
+    app = Flask(__name__)
+    app.register_blueprint(metrics_blueprint.bp)
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    assert 'pidash_pipeline_stage_seconds_count{stage="show"}' in body
+    assert 'pidash_cache_lookups_total{cache="frame_store",result="hit"}' in body
@@ -0,0 +1,87 @@
+import os
+import sys
+from src.playlist import Playlist
+
+def _names(count):
+    return [f"image_{i:03}.png" for i in range(count)]
+
+def test_lookup_by_name_and_position():
+    playlist = Playlist("/images", _names(3))
+
+    assert len(playlist) == 3
+    assert playlist.position("image_002.png") == 2
+    assert playlist.position("missing.png") is None
+    assert playlist.name_at(1) == "image_001.png"
+    assert playlist.name_at(3) is None
+    assert playlist.path("image_001.png") == os.path.join("/images", "image_001.png")
+
+def test_names_are_interned_and_added_once():
+    playlist = Playlist("/images")
+    playlist.add(["".join(["image", ".png"]), "image.png"])
+
+    assert playlist.names() == ["image.png"]
+    assert playlist.name_at(0) is sys.intern("image.png")
+
+def test_positions_stay_put_while_images_come_and_go():
+    playlist = Playlist("/images", _names(5))
+    playlist.remove(["image_001.png", "missing.png"])
+    playlist.add(["new.png"])
+
+    assert playlist.position("image_004.png") == 4
+    assert playlist.position("new.png") == 5
+    assert playlist.names() == ["image_000.png", "image_002.png", "image_003.png", "image_004.png", "new.png"]
+
+def test_changing_a_copy_leaves_the_original_alone():
+    playlist = Playlist("/images", _names(3))
+    names = playlist.names()
+    copy = playlist.copy()
+    copy.remove(["image_000.png"])
+    copy.add(["new.png"])
+
+    assert playlist.names() is names
+    assert names == _names(3) and len(playlist) == 3
+    assert playlist.position("new.png") is None
+    assert copy.names() == ["image_001.png", "image_002.png", "new.png"]
+    assert copy.position("image_002.png") == 2
+
+def test_navigation_skips_removed_images_and_wraps():
+    playlist = Playlist("/images", _names(5))
+    playlist.remove(["image_001.png", "image_004.png"])
+
+    assert playlist.resolve(1) == 2
+    assert playlist.resolve(4) == 0
+    assert playlist.resolve(99) == 0
+    assert playlist.step(0, 1) == 2
+    assert playlist.step(0, -1) == 3
+    assert playlist.step(1, 0) == 2
+    assert playlist.step(3, 2) == 2
+    assert [playlist.step(0, offset) for offset in range(-3, 4)] == [0, 2, 3, 0, 2, 3, 0]
+
+def test_step_without_removals_is_arithmetic():
+    playlist = Playlist("/images", _names(4))
+
+    assert playlist.step(3, 1) == 0
+    assert playlist.step(0, -1) == 3
+    assert playlist.step(1, 10) == 3
+
+def test_empty_playlist_has_nowhere_to_go():
+    playlist = Playlist("/images", _names(2))
+    playlist.remove(_names(2))
+
+    assert playlist.resolve(0) is None
+    assert playlist.step(0, 1) is None
+    assert Playlist("/images").step(0, 1) is None
+
+def test_compaction_keeps_order_once_tombstones_dominate():
+    names = _names(Playlist.MIN_COMPACT_TOMBSTONES * 3)
+    playlist = Playlist("/images", names)
+    playlist.remove(names[:Playlist.MIN_COMPACT_TOMBSTONES])
+    assert not playlist.needs_compaction()
+
+    playlist.remove(names[Playlist.MIN_COMPACT_TOMBSTONES:-10])
+    assert playlist.needs_compaction()
+    compacted = playlist.compacted()
+
+    assert compacted.names() == names[-10:]
+    assert compacted.position(names[-1]) == 9
+    assert not compacted.needs_compaction()
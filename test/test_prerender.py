@@ -0,0 +1,58 @@
+import os
+from PIL import Image
+from src.device_profile import DeviceProfile
+from src.frame_server import create_profile_display_manager
+from src.prerender import list_images, prerender
+
+PROFILE = DeviceProfile.from_dict("kitchen", {"panel": "7.3", "orientation": "portrait"})
+
+def _make_library(tmp_path, count=4):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    for i in range(count):
+        Image.new("RGB", (640, 480), color=(i * 60, 100, 200)).save(image_folder / f"image_{i}.jpg")
+    (image_folder / "broken.png").write_bytes(b"not an image")
+    (image_folder / "notes.txt").write_text("not an image either")
+    return image_folder
+
+def _statuses(results):
+    return {result["name"]: result["status"] for result in results}
+
+def test_prerendered_frames_are_served_from_the_render_cache(tmp_path):
+    image_folder = _make_library(tmp_path)
+    image_paths = list_images(str(image_folder))
+    assert [os.path.basename(path) for path in image_paths] == [
+        "broken.png", "image_0.jpg", "image_1.jpg", "image_2.jpg", "image_3.jpg"]
+
+    reported = []
+    results = prerender(create_profile_display_manager(PROFILE, str(tmp_path / "cache")), PROFILE, image_paths,
+                        workers=2, on_result=reported.append)
+
+    assert reported == results
+    assert _statuses(results) == {"broken.png": "failed", "image_0.jpg": "rendered", "image_1.jpg": "rendered",
+                                  "image_2.jpg": "rendered", "image_3.jpg": "rendered"}
+    assert "UnidentifiedImageError" in next(result["error"] for result in results if result["status"] == "failed")
+    assert all(result["seconds"] > 0 for result in results if result["status"] == "rendered")
+
+    # The service starts with the cache the command filled and renders nothing itself
+    service = create_profile_display_manager(PROFILE, str(tmp_path / "cache"))
+    service._render = None
+    with Image.open(image_folder / "image_2.jpg") as image:
+        frame = service.render_frame(image)
+    with Image.open(image_folder / "image_2.jpg") as image:
+        expected = create_profile_display_manager(PROFILE, str(tmp_path / "reference")).render_uncached(image)
+    assert frame.mode == "P" and frame.size == (800, 480)
+    assert frame.tobytes() == expected.tobytes()
+
+def test_interrupted_run_resumes_without_redoing_finished_frames(tmp_path):
+    image_folder = _make_library(tmp_path)
+    image_paths = list_images(str(image_folder))
+    display_manager = create_profile_display_manager(PROFILE, str(tmp_path / "cache"))
+    prerender(display_manager, PROFILE, image_paths[:3], workers=2)
+
+    # A new run, as after the command was interrupted
+    display_manager = create_profile_display_manager(PROFILE, str(tmp_path / "cache"))
+    results = prerender(display_manager, PROFILE, image_paths, workers=2)
+
+    assert _statuses(results) == {"broken.png": "failed", "image_0.jpg": "skipped", "image_1.jpg": "skipped",
+                                  "image_2.jpg": "rendered", "image_3.jpg": "rendered"}
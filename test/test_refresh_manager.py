@@ -0,0 +1,237 @@
+import time
+import threading
+from flask import Flask
+from PIL import Image
+from src.blueprints import display as display_blueprint
+from src.blueprints import home as home_blueprint
+from src.config import Config
+from src.constants import (
+    IMAGE_FOLDER_KEY, HOSTNAME_KEY, ORIENTATION_KEY, REFRESH_INTERVAL_KEY, REFRESH_MANAGER_KEY
+)
+from src.image_manager import ImageManager
+from src.refresh_manager import DisplayJob, RefreshManager
+
+class FakeDisplayManager:
+    def __init__(self):
+        self.rendered = []
+        self.shown = []
+
+    def get_render_settings(self):
+        return {"orientation": "landscape"}
+
+    def render_frame(self, image, image_settings=[]):
+        self.rendered.append(image.filename)
+        return image.copy()
+
+    def display_image(self, image, image_settings=[], force=False):
+        return self.show_frame(self.render_frame(image, image_settings), force=force)
+
+    def show_frame(self, frame, force=False):
+        self.shown.append(frame)
+        return True
+
+class ViewDisplayManager(FakeDisplayManager):
+    """Hands out views over one buffer, as frames taken from the frame store are."""
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray(16 * 16)
+
+    def render_frame(self, image, image_settings=[]):
+        self.rendered.append(image.filename)
+        return Image.frombuffer("L", (16, 16), self.buffer, "raw", "L", 0, 1)
+
+def _make_manager(tmp_path, count=3, display_manager=None):
+    for i in range(count):
+        Image.new("RGB", (16, 16), color=(i * 40, 0, 0)).save(tmp_path / f"image_{i}.png")
+
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(tmp_path), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = type("IsolatedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path)})(config)
+    display_manager = display_manager or FakeDisplayManager()
+    return RefreshManager(config, image_manager, display_manager, max_prepared_frames=2), image_manager, display_manager
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_prefetch_prepares_next_frame(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path)
+    refresh_manager.running = True
+    refresh_manager.prefetch_thread = threading.Thread(target=refresh_manager._prefetch_run, daemon=True)
+    refresh_manager.prefetch_thread.start()
+    try:
+        refresh_manager.display_next_image()
+        next_path = image_manager.get_relative_image_path(1)
+        assert _wait_for(lambda: next_path in refresh_manager.prepared_frames)
+
+        rendered_before = len(display_manager.rendered)
+        refresh_manager.display_next_image()
+
+        assert len(display_manager.rendered) == rendered_before
+        assert image_manager.get_relative_image_path(0) == next_path
+    finally:
+        refresh_manager.stop()
+
+def test_prepared_frame_outlives_the_buffer_it_was_rendered_into(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path, display_manager=ViewDisplayManager())
+    refresh_manager.running = True
+    refresh_manager.prefetch_thread = threading.Thread(target=refresh_manager._prefetch_run, daemon=True)
+    refresh_manager.prefetch_thread.start()
+    try:
+        refresh_manager.display_next_image()
+        next_path = image_manager.get_relative_image_path(1)
+        assert _wait_for(lambda: next_path in refresh_manager.prepared_frames)
+
+        # The slot is reused for another frame while the prepared one waits
+        display_manager.buffer[:] = b"\xff" * len(display_manager.buffer)
+        refresh_manager.display_next_image()
+
+        assert display_manager.shown[-1].tobytes() == bytes(16 * 16)
+    finally:
+        refresh_manager.stop()
+
+def test_prefetch_includes_previous_after_manual_navigation(tmp_path):
+    refresh_manager, image_manager, _ = _make_manager(tmp_path, count=5)
+
+    # Redraws, even ones that aren't automatic, are not navigation
+    refresh_manager._execute(DisplayJob(None, force=True))
+    assert refresh_manager.prefetch_targets == [image_manager.get_relative_image_path(1)]
+
+    refresh_manager._execute(DisplayJob(None, -1))
+    assert refresh_manager.prefetch_targets == [
+        image_manager.get_relative_image_path(1),
+        image_manager.get_relative_image_path(-1)
+    ]
+
+    refresh_manager._execute(DisplayJob(None, 1, automatic=True))
+    assert refresh_manager.prefetch_targets == [image_manager.get_relative_image_path(1)]
+
+def test_cancel_prefetch_discards_prepared_frames(tmp_path):
+    refresh_manager, image_manager, _ = _make_manager(tmp_path)
+    next_path = image_manager.get_relative_image_path(1)
+    refresh_manager.prepared_frames[next_path] = (Image.new("RGB", (16, 16)), {"orientation": "landscape"}, None)
+
+    refresh_manager.cancel_prefetch()
+
+    assert not refresh_manager.prepared_frames
+    assert refresh_manager._take_prepared_frame(next_path) is None
+
+def test_stale_prepared_frame_is_not_used(tmp_path):
+    refresh_manager, image_manager, _ = _make_manager(tmp_path)
+    next_path = image_manager.get_relative_image_path(1)
+    mtime_ns = refresh_manager._get_mtime_ns(next_path)
+    refresh_manager.prepared_frames[next_path] = (Image.new("RGB", (16, 16)), {"orientation": "portrait"}, mtime_ns)
+
+    assert refresh_manager._take_prepared_frame(next_path) is None
+
+def test_prepared_frames_stay_bounded(tmp_path):
+    refresh_manager, _, _ = _make_manager(tmp_path, count=5)
+    refresh_manager.manual_navigation = True
+    refresh_manager.max_prepared_frames = 1
+
+    refresh_manager.schedule_prefetch()
+
+    assert len(refresh_manager.prefetch_targets) == 1
+
+def test_interval_change_rearms_timer(tmp_path):
+    refresh_manager, _, _ = _make_manager(tmp_path)
+    refresh_manager.config.set(REFRESH_INTERVAL_KEY, 3600, save=False)
+    refresh_manager.running = True
+    refresh_manager.last_refresh = time.monotonic()
+    waiter = threading.Thread(target=refresh_manager._next_job, daemon=True)
+    waiter.start()
+
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+
+    refresh_manager.config.set(REFRESH_INTERVAL_KEY, 0, save=False)
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()
+
+def test_render_setting_change_refreshes_display(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path)
+    next_path = image_manager.get_relative_image_path(1)
+    refresh_manager.prepared_frames[next_path] = (Image.new("RGB", (16, 16)), {"orientation": "landscape"}, None)
+
+    refresh_manager.config.set(ORIENTATION_KEY, "portrait", save=False)
+    refresh_manager.config.set(ORIENTATION_KEY, "portrait", save=False)
+
+    assert next_path not in refresh_manager.prepared_frames
+    assert refresh_manager.pending_job.offset == 0
+    assert refresh_manager.pending_job.requests == 1
+    assert display_manager.shown == []
+
+def test_requests_are_coalesced_while_panel_is_busy(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path, count=5)
+    first_path = image_manager.get_relative_image_path(0)
+
+    job = refresh_manager.request_next()
+    assert refresh_manager.request_next() is job
+    assert refresh_manager.request_next() is job
+    assert refresh_manager.request_previous() is job
+    refresh_manager.running = True
+    refresh_manager._execute(refresh_manager._next_job())
+
+    assert job.state == "done"
+    assert job.requests == 4
+    assert len(display_manager.shown) == 1
+    assert image_manager.get_relative_image_path(-2) == first_path
+
+def test_show_image_replaces_queued_moves(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path, count=5)
+
+    refresh_manager.request_next()
+    job = refresh_manager.request_image("image_3.png")
+    refresh_manager.request_next()
+    refresh_manager.running = True
+    refresh_manager._execute(refresh_manager._next_job())
+
+    names = image_manager.get_image_names()
+    assert job.state == "done"
+    assert image_manager.get_current_image_name() == names[(names.index("image_3.png") + 1) % len(names)]
+    assert display_manager.rendered == [image_manager.get_relative_image_path(0)]
+
+def test_worker_serves_requests_and_rotation(tmp_path):
+    refresh_manager, image_manager, display_manager = _make_manager(tmp_path)
+    refresh_manager.config.set(REFRESH_INTERVAL_KEY, 3600, save=False)
+    refresh_manager.start()
+    try:
+        names = image_manager.get_image_names()
+        assert _wait_for(lambda: refresh_manager.last_refresh is not None)
+        assert image_manager.get_current_image_name() == names[1]
+
+        assert refresh_manager.request_next().wait(timeout=5)
+        assert image_manager.get_current_image_name() == names[2]
+        assert refresh_manager.request_previous().wait(timeout=5)
+        assert image_manager.get_current_image_name() == names[1]
+        assert len(display_manager.shown) == 3
+    finally:
+        refresh_manager.stop()
+
+def test_display_endpoints_return_pollable_jobs(tmp_path):
+    refresh_manager, image_manager, _ = _make_manager(tmp_path)
+    app = Flask(__name__)
+    app.config[REFRESH_MANAGER_KEY] = refresh_manager
+    app.register_blueprint(home_blueprint.bp)
+    app.register_blueprint(display_blueprint.bp)
+    client = app.test_client()
+
+    response = client.post("/show_next_image", headers={"Accept": "application/json"})
+    assert response.status_code == 202
+    assert client.post("/show_next_image").status_code == 302
+
+    status_url = response.get_json()["status_url"]
+    assert client.get(status_url).get_json()["requests"] == 2
+    refresh_manager.running = True
+    refresh_manager._execute(refresh_manager._next_job())
+
+    assert client.get(status_url).get_json()["state"] == "done"
+    assert image_manager.get_current_image_name() == image_manager.get_image_names()[2]
+    assert client.get("/display_jobs/unknown").status_code == 404
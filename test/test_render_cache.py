@@ -0,0 +1,95 @@
+import os
+from PIL import Image
+from src.render_cache import RenderCache
+
+SETTINGS = {"brightness": 1.0, "contrast": 1.0, "saturation": 1.0, "sharpness": 1.0}
+
+def _make_source(tmp_path, name="source.png", color="red"):
+    path = os.path.join(tmp_path, name)
+    Image.new("RGB", (64, 48), color=color).save(path)
+    return path
+
+def test_render_cache_round_trip(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    source = _make_source(tmp_path)
+    key = RenderCache.make_key(source, (32, 24), "landscape", False, SETTINGS)
+
+    assert cache.get(key) is None
+
+    frame = Image.new("RGB", (32, 24), color="blue")
+    cache.put(key, frame)
+
+    cached = cache.get(key)
+    assert cached is not None
+    assert cached.size == (32, 24)
+    assert cached.tobytes() == frame.tobytes()
+
+def test_render_cache_key_changes_with_settings(tmp_path):
+    source = _make_source(tmp_path)
+    base = RenderCache.make_key(source, (32, 24), "landscape", False, SETTINGS)
+
+    assert base == RenderCache.make_key(source, [32, 24], "landscape", False, dict(SETTINGS))
+    assert base != RenderCache.make_key(source, (32, 24), "portrait", False, SETTINGS)
+    assert base != RenderCache.make_key(source, (32, 24), "landscape", True, SETTINGS)
+    assert base != RenderCache.make_key(source, (32, 24), "landscape", False, {**SETTINGS, "contrast": 1.5})
+    assert base != RenderCache.make_key(source, (32, 24), "landscape", False, SETTINGS, ["keep-width"])
+
+    os.utime(source, ns=(0, 0))
+    assert base != RenderCache.make_key(source, (32, 24), "landscape", False, SETTINGS)
+
+def test_render_cache_missing_source_has_no_key(tmp_path):
+    assert RenderCache.make_key(str(tmp_path / "missing.png"), (32, 24), "landscape", False, SETTINGS) is None
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    frame = Image.effect_noise((64, 64), 64).convert("RGB")
+    cache = RenderCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    cache.put("probe", frame)
+    frame_size = cache.total_bytes
+    cache.clear()
+
+    cache = RenderCache(str(tmp_path / "cache"), frame_size * 2)
+    cache.put("first", frame)
+    cache.put("second", frame)
+    assert cache.get("first") is not None
+    cache.put("third", frame)
+
+    assert "first" in cache
+    assert "second" not in cache
+    assert "third" in cache
+    assert cache.total_bytes <= cache.max_bytes
+    assert not os.path.exists(os.path.join(cache.cache_dir, "second.png"))
+
+def test_render_cache_persists_across_instances(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = RenderCache(cache_dir, 10 * 1024 * 1024)
+    cache.put("frame", Image.new("RGB", (8, 8), color="green"))
+
+    reloaded = RenderCache(cache_dir, 10 * 1024 * 1024)
+    assert "frame" in reloaded
+    assert reloaded.total_bytes == cache.total_bytes
+
+def test_render_cache_invalidates_on_settings_change(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = RenderCache(cache_dir, 10 * 1024 * 1024)
+    render_settings = {"orientation": "landscape", "image_settings": SETTINGS}
+
+    assert cache.ensure_settings(render_settings)
+    cache.put("frame", Image.new("RGB", (8, 8)))
+    assert not cache.ensure_settings(render_settings)
+    assert not RenderCache(cache_dir, 10 * 1024 * 1024).ensure_settings(render_settings)
+    assert "frame" in cache
+
+    assert cache.ensure_settings({**render_settings, "orientation": "portrait"})
+    assert "frame" not in cache
+    assert cache.total_bytes == 0
+
+def test_render_cache_picks_up_frames_stored_by_another_instance(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    other = RenderCache(str(tmp_path / "cache"), 10 * 1024 * 1024)
+    frame = Image.new("RGB", (32, 24), color="green")
+
+    other.put_encoded("prerendered", RenderCache.encode(frame))
+
+    assert "prerendered" not in cache
+    assert cache.get("prerendered").tobytes() == frame.tobytes()
+    assert "prerendered" in cache
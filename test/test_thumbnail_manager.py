@@ -0,0 +1,63 @@
+import os
+from flask import Flask
+from PIL import Image
+from src.blueprints import gallery
+from src.constants import THUMBNAIL_MANAGER_KEY
+from src.thumbnail_manager import ThumbnailManager
+
+def _make_manager(tmp_path):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    Image.new("RGB", (1200, 800), color="red").save(image_folder / "photo.jpg")
+    return ThumbnailManager(str(image_folder), str(tmp_path / "thumbnails"), 128, (".jpg", ".png"))
+
+def test_thumbnail_is_generated_and_cached(tmp_path):
+    thumbnail_manager = _make_manager(tmp_path)
+
+    thumbnail_path, etag = thumbnail_manager.get_thumbnail("photo.jpg", timeout=10)
+
+    with Image.open(thumbnail_path) as thumbnail:
+        assert max(thumbnail.size) == 128
+    assert thumbnail_manager.get_thumbnail("photo.jpg", timeout=10) == (thumbnail_path, etag)
+    thumbnail_manager.shutdown()
+
+def test_thumbnail_changes_with_source(tmp_path):
+    thumbnail_manager = _make_manager(tmp_path)
+    old_path, old_etag = thumbnail_manager.get_thumbnail("photo.jpg", timeout=10)
+
+    source = os.path.join(thumbnail_manager.image_folder, "photo.jpg")
+    Image.new("RGB", (800, 1200), color="blue").save(source)
+    os.utime(source, ns=(0, 0))
+
+    new_path, new_etag = thumbnail_manager.get_thumbnail("photo.jpg", timeout=10)
+    assert new_etag != old_etag
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
+
+    thumbnail_manager.remove("photo.jpg")
+    assert not os.path.exists(new_path)
+    thumbnail_manager.shutdown()
+
+def test_thumbnail_rejects_unknown_names(tmp_path):
+    thumbnail_manager = _make_manager(tmp_path)
+
+    assert thumbnail_manager.get_thumbnail("missing.jpg") is None
+    assert thumbnail_manager.get_thumbnail("../photo.jpg") is None
+    assert thumbnail_manager.get_thumbnail("photo.txt") is None
+    thumbnail_manager.shutdown()
+
+def test_thumbnail_endpoint_supports_conditional_requests(tmp_path):
+    app = Flask(__name__)
+    app.config[THUMBNAIL_MANAGER_KEY] = _make_manager(tmp_path)
+    app.register_blueprint(gallery.bp)
+    client = app.test_client()
+
+    response = client.get("/thumbnail/photo.jpg")
+    assert response.status_code == 200
+    assert response.mimetype == app.config[THUMBNAIL_MANAGER_KEY].mimetype
+    etag = response.headers["ETag"]
+    assert not etag.startswith("W/")
+
+    assert client.get("/thumbnail/photo.jpg", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/thumbnail/missing.jpg").status_code == 404
+    app.config[THUMBNAIL_MANAGER_KEY].shutdown()
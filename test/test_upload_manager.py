@@ -0,0 +1,188 @@
+import io
+import os
+import time
+import zlib
+from flask import Flask
+from PIL import Image
+from src.blueprints import config as config_blueprint
+from src.config import Config
+from src.constants import IMAGE_FOLDER_KEY, HOSTNAME_KEY, UPLOAD_MANAGER_KEY
+from src.image_manager import ImageManager
+from src.upload_manager import UploadJob, UploadManager
+
+def _make_upload_manager(tmp_path, on_changed=None, near_duplicate_distance=None):
+    image_folder = tmp_path / "images"
+    image_folder.mkdir()
+    config = Config()
+    config.config_file = str(tmp_path / "device.json")
+    config.set(IMAGE_FOLDER_KEY, str(image_folder), save=False)
+    config.set(HOSTNAME_KEY, "Pidash", save=False)
+    image_manager = type("IsolatedImageManager", (ImageManager,), {"BASE_DIR": str(tmp_path)})(config)
+    return UploadManager(image_manager, str(tmp_path / "staging"), 2, 5,
+                         near_duplicate_distance=near_duplicate_distance, on_changed=on_changed)
+
+def _stage(upload_manager, data):
+    staged_path = upload_manager.create_staging_file()
+    with open(staged_path, "wb") as f:
+        f.write(data)
+    return staged_path
+
+def _png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), color=color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _wait_for_job(upload_manager, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = upload_manager.get_job(job_id)
+        if job["state"] == "done":
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Upload job {job_id} didn't finish")
+
+def test_batch_is_validated_and_added_in_one_index_update(tmp_path):
+    changes = []
+    upload_manager = _make_upload_manager(tmp_path, on_changed=lambda: changes.append(True))
+    image_manager = upload_manager.image_manager
+    version = image_manager.image_index.version
+
+    files = [
+        (_stage(upload_manager, _png_bytes("red")), "red.png"),
+        (_stage(upload_manager, b"not an image"), "fake.png"),
+        (_stage(upload_manager, _png_bytes("blue")), "blue.png")
+    ]
+    job = _wait_for_job(upload_manager, upload_manager.submit(files))
+
+    assert job["total"] == 3
+    assert job["validated"] == 3
+    assert job["added"] == ["red.png", "blue.png"]
+    assert [rejected["name"] for rejected in job["rejected"]] == ["fake.png"]
+    assert changes == [True]
+    assert image_manager.image_index.version == version + 1
+    assert sorted(image_manager.get_image_names()) == ["blue.png", "red.png"]
+    assert os.listdir(upload_manager.staging_dir) == []
+    upload_manager.shutdown()
+
+def test_deep_verify_keeps_corrupt_images_out_of_the_library(tmp_path):
+    added = []
+    upload_manager = _make_upload_manager(tmp_path, on_changed=lambda: added.append(
+        upload_manager.image_manager.get_image_names()))
+    image_manager = upload_manager.image_manager
+    version = image_manager.image_index.version
+    corrupt = bytearray(_png_bytes("red"))
+    # Flip pixel data but keep the chunk CRC valid, so only a full decode notices
+    idat = corrupt.index(b"IDAT")
+    length = int.from_bytes(corrupt[idat - 4:idat], "big")
+    corrupt[idat + 6:idat + 4 + length] = b"\xff" * (length - 2)
+    corrupt[idat + 4 + length:idat + 8 + length] = zlib.crc32(corrupt[idat:idat + 4 + length]).to_bytes(4, "big")
+
+    files = [
+        (_stage(upload_manager, bytes(corrupt)), "corrupt.png"),
+        (_stage(upload_manager, _png_bytes("blue")), "blue.png")
+    ]
+    job = _wait_for_job(upload_manager, upload_manager.submit(files))
+
+    assert job["added"] == ["blue.png"]
+    assert [rejected["name"] for rejected in job["rejected"]] == ["corrupt.png"]
+    assert image_manager.get_image_names() == ["blue.png"]
+    # Only verified images were ever published to the library
+    assert added == [["blue.png"]]
+    assert image_manager.image_index.version == version + 1
+    assert not os.path.exists(os.path.join(image_manager.image_folder, "corrupt.png"))
+    assert os.listdir(upload_manager.staging_dir) == []
+    upload_manager.shutdown()
+
+def test_exact_duplicates_are_linked_to_existing_images(tmp_path):
+    upload_manager = _make_upload_manager(tmp_path)
+    image_manager = upload_manager.image_manager
+    _wait_for_job(upload_manager, upload_manager.submit([(_stage(upload_manager, _png_bytes("red")), "red.png")]))
+
+    files = [
+        (_stage(upload_manager, _png_bytes("red")), "red_again.png"),
+        (_stage(upload_manager, _png_bytes("blue")), "blue.png"),
+        (_stage(upload_manager, _png_bytes("blue")), "blue_copy.png")
+    ]
+    job = _wait_for_job(upload_manager, upload_manager.submit(files))
+
+    assert job["added"] == ["blue.png"]
+    assert job["duplicates"] == [
+        {"name": "red_again.png", "existing": "red.png"},
+        {"name": "blue_copy.png", "existing": "blue.png"}
+    ]
+    assert sorted(image_manager.get_image_names()) == ["blue.png", "red.png"]
+    assert os.listdir(upload_manager.staging_dir) == []
+    upload_manager.shutdown()
+
+def test_near_duplicates_are_skipped_after_verification(tmp_path):
+    upload_manager = _make_upload_manager(tmp_path, near_duplicate_distance=3)
+    image = Image.linear_gradient("L").convert("RGB")
+    original, resized = io.BytesIO(), io.BytesIO()
+    image.save(original, format="PNG")
+    image.resize((128, 128)).save(resized, format="JPEG", quality=70)
+
+    _wait_for_job(upload_manager, upload_manager.submit([(_stage(upload_manager, original.getvalue()), "gradient.png")]))
+    job = _wait_for_job(upload_manager, upload_manager.submit([(_stage(upload_manager, resized.getvalue()), "small.jpg")]))
+
+    assert job["added"] == []
+    assert job["duplicates"] == [{"name": "small.jpg", "existing": "gradient.png"}]
+    assert upload_manager.image_manager.get_image_names() == ["gradient.png"]
+
+    # Near-duplicates within one batch are caught too, although neither is in the library yet
+    radial = Image.radial_gradient("L").convert("RGB")
+    radial_original, radial_resized = io.BytesIO(), io.BytesIO()
+    radial.save(radial_original, format="PNG")
+    radial.resize((128, 128)).save(radial_resized, format="JPEG", quality=70)
+    files = [(_stage(upload_manager, radial_original.getvalue()), "radial.png"),
+             (_stage(upload_manager, radial_resized.getvalue()), "radial_small.jpg")]
+    job = _wait_for_job(upload_manager, upload_manager.submit(files))
+
+    assert job["added"] == ["radial.png"]
+    assert job["duplicates"] == [{"name": "radial_small.jpg", "existing": "radial.png"}]
+    assert sorted(upload_manager.image_manager.get_image_names()) == ["gradient.png", "radial.png"]
+    upload_manager.shutdown()
+
+def test_backfill_hashes_existing_library(tmp_path):
+    upload_manager = _make_upload_manager(tmp_path)
+    image_manager = upload_manager.image_manager
+    for i in range(5):
+        Image.new("RGB", (8, 8), color=(i * 40, 0, 0)).save(os.path.join(image_manager.image_folder, f"old_{i}.png"))
+    image_manager.refresh_image_list()
+
+    upload_manager.start_backfill()
+    upload_manager.backfill_thread.join(timeout=30)
+
+    assert image_manager.get_unhashed_images() == []
+    job = _wait_for_job(upload_manager, upload_manager.submit([(_stage(upload_manager, open(
+        os.path.join(image_manager.image_folder, "old_3.png"), "rb").read()), "again.png")]))
+    assert job["duplicates"] == [{"name": "again.png", "existing": "old_3.png"}]
+    upload_manager.shutdown()
+
+def test_upload_endpoint_returns_pollable_job(tmp_path):
+    upload_manager = _make_upload_manager(tmp_path)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.config[UPLOAD_MANAGER_KEY] = upload_manager
+    app.register_blueprint(config_blueprint.bp)
+    client = app.test_client()
+
+    response = client.post("/upload_images", headers={"Accept": "application/json"},
+                           data={"image_upload_names": [(io.BytesIO(_png_bytes("green")), "green.png")]})
+
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    _wait_for_job(upload_manager, job_id)
+
+    job = client.get(response.get_json()["status_url"]).get_json()
+    assert job["added"] == ["green.png"]
+    assert client.get("/upload_images/unknown").status_code == 404
+    upload_manager.shutdown()
+
+def test_shutdown_reports_unfinished_jobs(tmp_path, caplog):
+    upload_manager = _make_upload_manager(tmp_path)
+    job = UploadJob("pending", [(_stage(upload_manager, _png_bytes("red")), "red.png")])
+    upload_manager.jobs[job.job_id] = job
+
+    upload_manager.shutdown()
+
+    assert "Stopping upload job pending while validating, 1 of its file(s) won't be added." in caplog.text
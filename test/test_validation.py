@@ -0,0 +1,77 @@
+import io
+import struct
+import zlib
+import pytest
+from PIL import Image
+from src.validation import validate_uploaded_file, verify_image_data
+
+FORMATS = [
+    ("jpg", "JPEG", {}),
+    ("png", "PNG", {}),
+    ("gif", "GIF", {}),
+    ("bmp", "BMP", {}),
+    ("webp", "WEBP", {}),
+    ("tiff", "TIFF", {}),
+    ("tiff", "TIFF", {"compression": "tiff_lzw"})
+]
+
+def _encode(format, size=(320, 240), **params):
+    image = Image.effect_noise(size, 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def _png_with_header(width, height, pixel_data):
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) +
+            _png_chunk(b"IDAT", pixel_data) + _png_chunk(b"IEND", b""))
+
+def _validate(tmp_path, name, data, deep=False):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return validate_uploaded_file(str(path), name, deep=deep)
+
+@pytest.mark.parametrize("extension, format, params", FORMATS)
+def test_valid_images_pass_both_modes(tmp_path, extension, format, params):
+    data = _encode(format, **params)
+
+    assert _validate(tmp_path, f"image.{extension}", data)[0]
+    assert _validate(tmp_path, f"image.{extension}", data, deep=True)[0]
+
+@pytest.mark.parametrize("extension, format, params", FORMATS)
+@pytest.mark.parametrize("keep", [0.5, 0.9])
+def test_truncated_images_fail_fast_mode(tmp_path, extension, format, params, keep):
+    data = _encode(format, **params)
+    truncated = data[:int(len(data) * keep)]
+
+    assert not _validate(tmp_path, f"image.{extension}", truncated, deep=True)[0]
+    assert not _validate(tmp_path, f"image.{extension}", truncated)[0]
+
+def test_decompression_bomb_is_rejected_from_header(tmp_path):
+    bomb = _png_with_header(9000, 9000, zlib.compress(b"\0" * 1024))
+
+    is_valid, message = _validate(tmp_path, "bomb.png", bomb)
+
+    assert not is_valid
+    assert "too large" in message
+
+@pytest.mark.parametrize("name, data", [
+    ("text.png", b"definitely not an image"),
+    ("script.jpg", b"#!/bin/sh\necho hello\n"),
+    ("image.exe", _encode("PNG")),
+    ("empty.png", b""),
+    ("zero.png", _png_with_header(0, 10, zlib.compress(b"")))
+])
+def test_malformed_files_are_rejected(tmp_path, name, data):
+    assert not _validate(tmp_path, name, data)[0]
+    assert not _validate(tmp_path, name, data, deep=True)[0]
+
+def test_corrupt_pixel_data_is_caught_by_deep_verify(tmp_path):
+    corrupt = _png_with_header(64, 64, b"\x78\x9c" + b"\xff" * 512)
+
+    assert _validate(tmp_path, "corrupt.png", corrupt)[0]
+    assert not _validate(tmp_path, "corrupt.png", corrupt, deep=True)[0]
+    assert not verify_image_data(str(tmp_path / "corrupt.png"))[0]